@@ -0,0 +1,175 @@
+# scripts — Peec AI x Awin connector
+# The cell_NN_*.py files are exec'd by the notebook (or run_pipeline.py) and
+# are not imported. The helper modules are top-level modules with scripts/
+# on sys.path (how cells, run_pipeline.py and process-pool workers import
+# them). Several hold session state (the hostnames memo, http_telemetry's
+# sessions and rate limits, pipeline's stage memo), so there must be one
+# copy of each: importing the package puts scripts/ on sys.path, and
+# `scripts.<module>` is an alias of top-level `<module>`, not a second copy.
+#
+# Importing the package is cheap: submodules load on first attribute access,
+# and the modules themselves defer pandas / numpy / API clients until they
+# are used. check_import_times() measures this against IMPORT_BUDGET_MS, and
+# each cell's module-level imports against CELL_IMPORT_BUDGET_MS.
+
+import importlib
+import importlib.abc
+import importlib.util
+import re
+import subprocess
+import sys
+from pathlib import Path as _Path
+
+_SUBMODULES = ("pipeline", "parallel_agg", "profiling", "http_telemetry", "hostnames",
+               "journal", "chat_store", "rollups", "snapshots", "approx", "report_memo",
+               "run_pipeline")
+
+# Cold-start budget per import, in milliseconds (fresh interpreter, cumulative
+# self + children as reported by `python -X importtime`)
+IMPORT_BUDGET_MS = {
+    "scripts": 20,
+    "scripts.pipeline": 60,
+    "scripts.profiling": 30,
+    "scripts.http_telemetry": 30,
+    "scripts.hostnames": 30,
+    "scripts.journal": 30,
+    "scripts.chat_store": 40,
+    "scripts.rollups": 40,
+    "scripts.snapshots": 30,
+    "scripts.approx": 20,
+    "scripts.report_memo": 20,
+    "scripts.run_pipeline": 120,
+}
+
+# Cold-start budget for each cell's module-level import statements, in
+# milliseconds (fresh interpreter, scripts/ as the working directory). Cells
+# are exec'd rather than imported, so these are timed from their source.
+# Imports inside functions are deferred and not counted. Most of the cost is
+# pandas + ipywidgets/IPython, which varies by a third between runs on a
+# shared machine, so these leave more headroom than the module budgets.
+CELL_IMPORT_BUDGET_MS = {
+    "cell_00_pip_installs.py": 40,
+    "cell_01_session_config.py": 800,
+    "cell_02_css_styling.py": 500,
+    "cell_03_peec_client.py": 800,
+    "cell_04_peec_data_pull.py": 1200,
+    "cell_05_domain_report.py": 1200,
+    "cell_06_url_report.py": 1200,
+    "cell_07_awin_transactions.py": 1200,
+    "cell_08_domain_match.py": 1200,
+    "cell_09_enriched_report.py": 1200,
+    "cell_10_gap_analysis.py": 1200,
+}
+
+__all__ = list(_SUBMODULES) + ["IMPORT_BUDGET_MS", "CELL_IMPORT_BUDGET_MS", "check_import_times"]
+
+_SCRIPTS_DIR = str(_Path(__file__).resolve().parent)
+if _SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPTS_DIR)
+
+
+class _Alias(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """Resolves `scripts.<module>` to the top-level module of the same name."""
+
+    def find_spec(self, fullname, path=None, target=None):
+        package, _, name = fullname.rpartition(".")
+        if package == __name__ and name in _SUBMODULES:
+            return importlib.util.spec_from_loader(fullname, self)
+        return None
+
+    def create_module(self, spec):
+        return importlib.import_module(spec.name.rpartition(".")[2])
+
+    def exec_module(self, module):
+        pass  # already executed under its top-level name
+
+
+sys.meta_path[:] = [f for f in sys.meta_path  # once, even if the package is reloaded
+                   if (type(f).__module__, type(f).__name__) != (__name__, "_Alias")]
+sys.meta_path.insert(0, _Alias())
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        module = importlib.import_module(f"{__name__}.{name}")
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _import_times(code, cwd=None):
+    """(module, nesting depth, cumulative ms) for each import made running code."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=cwd,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"{code!r} failed: {out.stderr.strip().splitlines()[-1]}")
+    times = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$", line)
+        if m:
+            times.append((m.group(3), len(m.group(2)), int(m.group(1)) / 1000))
+    return times
+
+
+def _import_time_ms(module, cwd=None):
+    """Cumulative import time of module in a fresh interpreter."""
+    for name, _, ms in reversed(_import_times(f"import {module}", cwd)):
+        if name == module:
+            return ms
+    raise RuntimeError(f"no import timing reported for {module}")
+
+
+def _cell_imports(path):
+    """A cell's module-level import statements (not those inside functions), as source."""
+    import ast
+
+    def is_import(node):
+        return isinstance(node, (ast.Import, ast.ImportFrom))
+
+    def walk(body):
+        for node in body:
+            if is_import(node):
+                yield ast.unparse(node)
+            elif isinstance(node, ast.Try) and all(map(is_import, node.body)):
+                yield ast.unparse(node)  # optional import, e.g. google.colab
+            elif isinstance(node, ast.If):
+                yield from walk(node.body)
+
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(walk(tree.body)) or "pass"
+
+
+def _cell_import_time_ms(path, cwd=None):
+    """
+    Cold import time of a cell's module-level imports: the top-level entries
+    -X importtime reports for them, less whatever interpreter start-up
+    already loaded.
+    """
+    startup = {name for name, depth, _ in _import_times("pass", cwd) if not depth}
+    return sum(ms for name, depth, ms in _import_times(_cell_imports(path), cwd)
+               if not depth and name not in startup)
+
+
+def check_import_times(budget=None, cell_budget=None, repeat=3, cwd=None):
+    """
+    Measure each module's cold import time, and each cell's module-level
+    imports (best of `repeat` runs), and compare them with the budgets.
+    Returns {module or cell file: (ms, budget_ms, ok)}.
+    """
+    from pathlib import Path
+
+    budget = budget or IMPORT_BUDGET_MS
+    cell_budget = CELL_IMPORT_BUDGET_MS if cell_budget is None else cell_budget
+    here = Path(__file__).resolve().parent
+    cwd = cwd or str(here.parent)
+    results = {}
+    for module, limit in budget.items():
+        ms = min(_import_time_ms(module, cwd) for _ in range(repeat))
+        results[module] = (round(ms, 1), limit, ms <= limit)
+    for cell, limit in cell_budget.items():
+        ms = min(_cell_import_time_ms(here / cell, str(here)) for _ in range(repeat))
+        results[cell] = (round(ms, 1), limit, ms <= limit)
+    return results
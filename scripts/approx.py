@@ -0,0 +1,116 @@
+# approx.py — Approximate aggregations on a stratified sample of df_detail
+# Imported (not exec'd). Used by the interactive filters in cells 05 / 06 on
+# large pulls: filters and groupbys run on a sample instead of every row,
+# and the exact report is computed on demand.
+#
+#   s = approx.sample(df_detail)                      # cached per frame
+#   s = s[s["Model"] == "gpt-4o"]                     # filter as usual
+#   agg = approx.grouped_agg(s, "Domain", Total=("usage_count", "sum"), ...)
+#
+# The sample is stratified by Domain: every domain keeps its rows in
+# proportion to its size (at least MIN_PER_STRATUM, so small domains are
+# kept whole and exact). Within a domain rows are drawn uniformly, so:
+#   sum      expanded by the domain's N/n, with a 95% interval
+#   mean     the sample mean, with a 95% interval
+#   nunique  distinct values seen in the sample: exact for domains kept
+#            whole, a lower bound for sampled ones
+# Groups must nest inside a domain (Domain, URL), so each belongs to one
+# stratum. grouped_agg appends a "<name>_err" column (95% half-width, 0
+# when exact) for each sum / mean.
+
+APPROX_MIN_ROWS = 1_000_000   # below this the exact reports are fast enough
+SAMPLE_ROWS = 200_000
+MIN_PER_STRATUM = 30
+Z95 = 1.96
+
+_cache = {}
+
+
+def sample(df, strata="Domain", n=SAMPLE_ROWS, seed=0):
+    """
+    Stratified sample of df with per-row stratum sizes _Nh (rows in df)
+    and _nh (rows sampled). Cached for the last frame seen, so filter
+    changes reuse it. Frames of n rows or fewer come back whole.
+    """
+    key = (strata, n, seed)
+    hit = _cache.get(key)
+    if hit is not None and hit[0] is df:
+        return hit[1]
+
+    import numpy as np
+    import pandas as pd
+    import profiling
+
+    with profiling.stage("approx_sample", cell="approx", rows=len(df)) as rec:
+        codes, uniques = pd.factorize(df[strata])
+        sizes = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        if len(df) <= n:
+            take = np.ones(len(df), dtype=bool)
+            alloc = sizes
+        else:
+            alloc = np.minimum(sizes, np.maximum(MIN_PER_STRATUM,
+                                                 np.ceil(n * sizes / len(df)).astype(int)))
+            # Rank rows within their stratum in random order; keep the first alloc
+            rng = np.random.default_rng(seed)
+            order = np.lexsort((rng.random(len(df)), codes))
+            order = order[codes[order] >= 0]  # rows with no domain are dropped
+            sorted_codes = codes[order]
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            rank = np.arange(len(order)) - starts[sorted_codes]
+            take = np.zeros(len(df), dtype=bool)
+            take[order[rank < alloc[sorted_codes]]] = True
+        take &= codes >= 0
+        kept = codes[take]
+        out = df[take].assign(_Nh=sizes[kept], _nh=alloc[kept])
+        rec["sample_rows"] = len(out)
+    _cache.clear()
+    _cache[key] = (df, out)
+    return out
+
+
+def grouped_agg(s, key, **spec):
+    """
+    Like _grouped_agg(df, key, **spec) on a sample() frame, estimating the
+    full-frame result. func is "sum", "mean", "nunique" or "first"; each
+    sum / mean gets a trailing "<name>_err" column (95% half-width).
+    """
+    import numpy as np
+    import pandas as pd
+
+    g = s.groupby(key, sort=False)
+    Nh = g["_Nh"].first().to_numpy(dtype=float)
+    nh = g["_nh"].first().to_numpy(dtype=float)
+    exact = nh >= Nh
+    fpc = np.where(exact, 0.0, 1.0 - nh / Nh)
+    out, errs = {}, {}
+    for name, (col, func) in spec.items():
+        if func == "sum":
+            x = s[col].astype(float)
+            sx = x.groupby(s[key], sort=False).sum().to_numpy()
+            sxx = (x * x).groupby(s[key], sort=False).sum().to_numpy()
+            # Domain-total estimator: y = x on the group's rows, 0 on the rest
+            # of its stratum's sample
+            with np.errstate(divide="ignore", invalid="ignore"):
+                var_y = np.where(nh > 1, (sxx - sx * sx / nh) / (nh - 1), 0.0)
+                err = Z95 * Nh * np.sqrt(np.maximum(var_y, 0) * fpc / nh)
+            out[name] = sx * Nh / nh
+            errs[f"{name}_err"] = err
+        elif func == "mean":
+            m = g[col].count().to_numpy(dtype=float)
+            sd = g[col].std(ddof=1).to_numpy(dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                err = np.where(exact, 0.0, Z95 * sd * np.sqrt(fpc / m))
+            out[name] = g[col].mean().to_numpy()
+            errs[f"{name}_err"] = err
+        else:
+            out[name] = g[col].agg(func).to_numpy()
+    index = g["_Nh"].first().index
+    return pd.DataFrame({key: index, **out, **errs}).reset_index(drop=True)
+
+
+def describe(s, df):
+    """One-line label for results computed on s (a sample of df)."""
+    share = len(s) / len(df) if len(df) else 1
+    return (f"\u2248 Approximate: stratified sample of {len(s):,} of {len(df):,} rows "
+            f"({share:.0%}). \u00b1 is a 95% interval; distinct counts are lower bounds, "
+            f"and rarely cited pages may be missing, for sampled domains.")
@@ -0,0 +1,191 @@
+# benchmark.py — Offline benchmark suite for the pipeline hot paths
+# Times ingestion, Awin processing, the domain/URL aggregations, matching,
+# enrichment and gap analysis on synthetic data (see synthetic.py) at one
+# or more scales, without API keys or network. Results are written as JSON
+# so runs can be compared over time.
+#
+# Usage:
+#   python scripts/benchmark.py                       # 1k, 10k, 100k rows
+#   python scripts/benchmark.py --scales 1k 1M --repeat 3
+#   python scripts/benchmark.py --scales 10M --stages peec_ingest domain_report
+#
+# Rough memory needs: payload dicts dominate, ~1.5 GB per million rows, so
+# 10M needs a large machine.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import __main__
+from datetime import datetime
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+import hostnames
+import run_pipeline
+import synthetic
+
+STAGES = [
+    "build_row", "peec_ingest", "peec_index", "awin_process",
+    "domain_report", "url_report", "awin_domain_agg", "match",
+    "enrich_build", "enrich_filter", "gap",
+]
+DEFAULT_SCALES = ["1k", "10k", "100k"]
+
+
+def _timed(fn, repeat=1, setup=None):
+    """Best-of-repeat wall time of fn(); returns (seconds, last result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        t = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4), result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_scale(n, repeat=1, stages=None, seed=0):
+    """Run every selected stage at scale n; returns {stage: {seconds, rows}}."""
+    stages = set(stages or STAGES)
+    u = synthetic.make_universe(n, seed=seed)
+    start, end = u.start_date, u.end_date
+    out = {}
+
+    t = time.perf_counter()
+    url_rows = synthetic.peec_url_rows(u)
+    tx_raw = synthetic.awin_transactions(u)
+    out["_generate"] = {"seconds": round(time.perf_counter() - t, 4),
+                        "rows": len(url_rows) + len(tx_raw)}
+
+    def record(stage, fn, rows=None, setup=None):
+        if stage not in stages:
+            return fn()  # still needed as input for later stages
+        secs, result = _timed(fn, repeat=repeat, setup=setup)
+        out[stage] = {"seconds": secs,
+                      "rows": rows(result) if rows else (len(result) if result is not None else 0)}
+        print(f"   {stage:<16} {secs:>9.4f}s  rows={out[stage]['rows']:,}")
+        return result
+
+    __main__._enrich_state = {}
+    run_pipeline._cells.clear()
+    with synthetic.offline_api(u, {"urls": url_rows, "transactions": tx_raw}):
+        cell03 = run_pipeline._cell("cell_03_peec_client.py")
+        cell04 = run_pipeline._cell("cell_04_peec_data_pull.py")
+        cell07 = run_pipeline._cell("cell_07_awin_transactions.py")
+
+        cell03["_lookups"].load()  # fetched on first use; keep it out of build_row
+        record("build_row", lambda: [cell03["_build_row"](r) for r in url_rows])
+        detail = record("peec_ingest", lambda: cell04["pull_peec_detail"](start, end))
+        record("peec_index", lambda: cell04["_publish_detail"](detail), rows=lambda _: len(detail))
+        tx = record("awin_process", lambda: cell07["process_awin_transactions"](tx_raw))
+        cell07["_publish_awin_tx"](tx)
+
+        cell05 = run_pipeline._cell("cell_05_domain_report.py")
+        domain_agg = record("domain_report", lambda: cell05["build_domain_report"](detail))
+        cell05["_publish_domain_report"](domain_agg)
+        cell06 = run_pipeline._cell("cell_06_url_report.py")
+        record("url_report", lambda: cell06["build_url_report"](detail))
+
+        cell09 = run_pipeline._cell("cell_09_enriched_report.py")
+        awin_domains = record("awin_domain_agg", lambda: cell09["_aggregate_awin_domains"](tx))
+
+        def _match():
+            peec = domain_agg.copy()
+            peec["_peec_host"] = hostnames.normalise(peec["Domain"], "host")
+            return cell09["_match_domains"](peec, awin_domains)
+
+        record("match", _match)
+        merged = record(
+            "enrich_build",
+            lambda: cell09["build_enriched"](domain_agg, tx, 1, start, end,
+                                             status=lambda *_: None)[0],
+            setup=lambda: __main__._enrich_state.clear(),
+        )
+        if merged is not None:
+            record("enrich_filter", lambda: cell09["filter_enriched"](merged)[0])
+
+        cell10 = run_pipeline._cell("cell_10_gap_analysis.py")
+
+        def _gap():
+            gap_domains = cell10["find_gap_domains"](domain_agg, tx)
+            cache = cell10["build_gap"](gap_domains)
+            return None if cache is None or cache["urls"].empty else cell10["rank_gap"](cache)
+
+        record("gap", _gap)
+    return out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    p.add_argument("--scales", nargs="+", default=DEFAULT_SCALES,
+                   help="Row counts, e.g. 1k 100k 1M 10M (default: %(default)s)")
+    p.add_argument("--repeat", type=int, default=1, help="Best-of-N timing per stage")
+    p.add_argument("--stages", nargs="+", choices=STAGES, help="Only time these stages")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", help="Results JSON (default: peec_awin_workspace/logs/bench_<time>.json)")
+    args = p.parse_args(argv)
+
+    # Cells write their CSVs into a throwaway workspace, not the real one
+    os.environ.setdefault("PEEC_API_KEY", "synthetic")
+    os.environ.setdefault("AWAPI", "synthetic")
+    tmp = tempfile.TemporaryDirectory(prefix="peec_awin_bench_")
+    run_pipeline._configure_session({
+        "env_file": None, "workspace": tmp.name, "project_id": "synthetic",
+        "project_name": "Synthetic Project", "advertiser_id": 1,
+        "start": "2026-01-01", "end": "2026-03-31",
+    })
+
+    import numpy as np
+    import pandas as pd
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "scales": {},
+    }
+    for scale in args.scales:
+        n = synthetic.parse_scale(scale)
+        print(f"\u23f3 {n:,} rows")
+        results["scales"][str(n)] = bench_scale(n, repeat=args.repeat,
+                                                stages=args.stages, seed=args.seed)
+
+    out = Path(args.out) if args.out else (
+        Path("peec_awin_workspace") / "logs" / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    tmp.cleanup()
+    print(f"\n\U0001f4dd Results: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,38 @@
 # cell_00_pip_installs.py — Install runtime dependencies
-# Run this cell once per kernel session.
-
-import subprocess, sys
-subprocess.check_call([
-    sys.executable, "-m", "pip", "install", "--quiet",
-    "requests", "pandas", "python-dotenv", "ipywidgets",
-])
-print("\u2705 Dependencies installed.")
+# Run this cell once per kernel session. Packages that are already installed
+# at a recent enough version are skipped, so re-runs don't invoke pip.
+
+import re, subprocess, sys
+from importlib import metadata
+
+REQUIRED_PACKAGES = {
+    "requests": "2.25.0",
+    "pandas": "1.3.0",
+    "python-dotenv": "0.19.0",
+    "ipywidgets": "7.6.0",
+}
+
+
+def _version_tuple(v):
+    return tuple(int(p) for p in re.findall(r"\d+", v)[:3])
+
+
+_to_install = []
+for _pkg, _minimum in REQUIRED_PACKAGES.items():
+    try:
+        if _version_tuple(metadata.version(_pkg)) >= _version_tuple(_minimum):
+            continue
+    except metadata.PackageNotFoundError:
+        pass
+    _to_install.append(f"{_pkg}>={_minimum}")
+
+if _to_install:
+    subprocess.check_call(
+        [sys.executable, "-m", "pip", "install", "--quiet", "--disable-pip-version-check",
+         *_to_install],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    print(f"\u2705 Installed: {', '.join(_to_install)}")
+else:
+    print("\u2705 Dependencies already satisfied.")
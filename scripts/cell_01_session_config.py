@@ -4,15 +4,22 @@
 
 import os
 import sys
+import threading
 import __main__
 from datetime import date, timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
 import ipywidgets as widgets
-import requests
 from IPython.display import display, HTML
 
+# Make helper modules in scripts/ importable
+_scripts_dir = str(__main__.PATHS["scripts"])
+if _scripts_dir not in sys.path:
+    sys.path.insert(0, _scripts_dir)
+
+import http_telemetry
+
 # ── Environment detection ────────────────────────────────────────
 try:
     from google.colab import userdata  # type: ignore
@@ -59,26 +66,42 @@ _load_key("AWAPI", "AWAPI", "Awin")
 print("\U0001f510 Both API keys configured.\n")
 
 
-# ── Fetch PEEC projects for dropdown ─────────────────────────────
-PEEC_BASE = "https://api.peec.ai/customer/v1"
+# ── PEEC projects for the dropdown (loaded in the background) ────
+PEEC_BASE = os.environ.get("PEEC_BASE_URL", "https://api.peec.ai/customer/v1").rstrip("/")
+PROJECTS_TIMEOUT_S = 30
 _headers = {
     "X-API-Key": os.environ["PEEC_API_KEY"],
     "Content-Type": "application/json",
 }
 
-print("\u23f3 Loading PEEC projects...")
-_projects_resp = requests.get(
-    f"{PEEC_BASE}/projects",
-    headers=_headers,
-    params={"limit": 1000, "offset": 0},
-)
-_projects_resp.raise_for_status()
-_project_list = _projects_resp.json()["data"]
-print(f"\u2705 Found {len(_project_list)} project(s).\n")
 
-_project_options = {
-    f"{p['name']} ({p['status']})": p["id"] for p in _project_list
-}
+def _load_projects():
+    """
+    Fetch the project list and fill the dropdown. Runs on a background
+    thread so the widgets render straight away; Confirm stays disabled
+    until the list has arrived.
+    """
+    try:
+        resp, data = http_telemetry.request(
+            "GET", f"{PEEC_BASE}/projects", api="peec", headers=_headers,
+            params={"limit": 1000, "offset": 0}, timeout=PROJECTS_TIMEOUT_S,
+        )
+        if resp.status_code != 200 or not isinstance(data, dict):
+            raise http_telemetry.APIError(
+                f"Peec API error {resp.status_code}: {getattr(resp, 'text', '')[:300]}",
+                resp.status_code,
+            )
+        projects = data["data"]
+    except Exception as exc:
+        _projects_note.value = (
+            f'<div class="peec-sub">\u274c Could not load PEEC projects: {exc}. '
+            f'Re-run this cell to try again.</div>'
+        )
+        return
+    _project_dd.options = {f"{p['name']} ({p['status']})": p["id"] for p in projects}
+    _project_dd.disabled = False
+    _confirm_btn.disabled = False
+    _projects_note.value = f'<div class="peec-sub">\u2705 Found {len(projects)} project(s).</div>'
 
 
 # ── Session config widgets ───────────────────────────────────────
@@ -88,7 +111,8 @@ _cfg_header = widgets.HTML(
 )
 
 _project_dd = widgets.Dropdown(
-    options=_project_options,
+    options=[],
+    disabled=True,
     description="PEEC Project:",
     style={"description_width": "110px"},
     layout=widgets.Layout(width="450px"),
@@ -119,8 +143,10 @@ _confirm_btn = widgets.Button(
     description="  Confirm Settings",
     button_style="success",
     icon="check",
+    disabled=True,
     layout=widgets.Layout(width="200px", height="36px"),
 )
+_projects_note = widgets.HTML('<div class="peec-sub">\u23f3 Loading PEEC projects...</div>')
 _cfg_status = widgets.HTML("")
 _cfg_output = widgets.Output()
 
@@ -138,6 +164,10 @@ def _on_confirm(b):
             print("\u26a0\ufe0f Start date must be before end date.")
             return
 
+        if _project_dd.value is None:
+            print("\u26a0\ufe0f Please choose a PEEC project.")
+            return
+
         adv_text = _adv_id.value.strip()
         if not adv_text or not adv_text.isdigit() or int(adv_text) == 0:
             print("\u26a0\ufe0f Please enter a valid Awin Advertiser ID.")
@@ -165,6 +195,7 @@ _confirm_btn.on_click(_on_confirm)
 display(
     _cfg_header,
     _project_dd,
+    _projects_note,
     _adv_id,
     widgets.HBox(
         [_start_picker, _end_picker],
@@ -174,3 +205,5 @@ display(
     _cfg_output,
     _cfg_status,
 )
+
+threading.Thread(target=_load_projects, name="peec_projects", daemon=True).start()
@@ -1,17 +1,18 @@
 # cell_03_peec_client.py — PeecClient, shared helpers, lookup tables
-# Produces globals: peec, prompt_lookup, tag_lookup, topic_lookup,
+# Produces globals: peec, report_spec, prompt_lookup, tag_lookup, topic_lookup,
 #   _extract_domain, _extract_subdomain, _build_row, _scroll_table,
-#   _normalise_host, download_file
+#   _normalise_host, _frame_fingerprint, _grouped_agg, download_file
 
 import os
-import re
+import sys
 import shutil
+import threading
 import __main__
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from urllib.parse import urlparse
 
-import requests
-import pandas as pd
 from IPython.display import HTML
 
 # ── Prerequisites ────────────────────────────────────────────────
@@ -25,86 +26,187 @@ PROJECT_NAME = __main__.PROJECT_NAME
 IN_COLAB = __main__.IN_COLAB
 PATHS = __main__.PATHS
 
-PEEC_BASE = "https://api.peec.ai/customer/v1"
+# PEEC_BASE_URL overrides the API host (e.g. a local stub server for load tests)
+PEEC_BASE = os.environ.get("PEEC_BASE_URL", "https://api.peec.ai/customer/v1").rstrip("/")
+
+# Frames at least this long are aggregated on the process-pool backend
+PARALLEL_AGG_MIN_ROWS = 1_000_000
+
+# Make helper modules in scripts/ importable (needed by pool workers)
+if str(PATHS["scripts"]) not in sys.path:
+    sys.path.insert(0, str(PATHS["scripts"]))
+
+import hostnames
+import http_telemetry
 
 
 # ══════════════════════════════════════════════════════════════════
 # PeecClient
 # ══════════════════════════════════════════════════════════════════
+REPORT_PAGE_SIZE = 1000
+
+ReportSpec = namedtuple("ReportSpec", "endpoint dimensions start_date end_date project_id")
+
+
+def report_spec(endpoint, start_date, end_date, dimensions=(), project_id=None):
+    """
+    Hashable report request for PeecClient.fetch_reports, e.g.
+    report_spec("urls", sd, ed, dimensions=["prompt_id", "model_id"]).
+    Dimension order doesn't change a breakdown, so it is normalised.
+    """
+    return ReportSpec(endpoint, tuple(sorted(dimensions or ())), start_date, end_date,
+                      project_id or PROJECT_ID)
+
+
 class PeecClient:
     """Lightweight wrapper around the Peec AI Customer API."""
 
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None):
         self.api_key = api_key or os.environ["PEEC_API_KEY"]
+        self.base_url = (base_url or PEEC_BASE).rstrip("/")
         self.headers = {
             "X-API-Key": self.api_key,
             "Content-Type": "application/json",
         }
 
+    def _get(self, path, params, check=False):
+        """
+        GET through http_telemetry (retries 429/5xx, records latency/bytes/rows).
+        check=True raises http_telemetry.APIError on a non-200 response.
+        """
+        resp, data = http_telemetry.request(
+            "GET", f"{self.base_url}{path}", api="peec", headers=self.headers, params=params,
+        )
+        if check and resp.status_code != 200:
+            raise http_telemetry.APIError(
+                f"Peec API error {resp.status_code}: {getattr(resp, 'text', '')[:300]}",
+                resp.status_code,
+            )
+        return data
+
+    def _post(self, path, payload):
+        return http_telemetry.request(
+            "POST", f"{self.base_url}{path}", api="peec", headers=self.headers, json=payload,
+        )[1]
+
     # ── project / lookup endpoints (GET) ─────────────────────────
     def get_projects(self, limit=1000, offset=0):
-        return requests.get(
-            f"{PEEC_BASE}/projects",
-            headers=self.headers,
-            params={"limit": limit, "offset": offset},
-        ).json()
+        return self._get("/projects", {"limit": limit, "offset": offset})
 
     def get_brands(self, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/brands", headers=self.headers, params=params).json()
+        return self._get("/brands", params)
 
     def get_prompts(self, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/prompts", headers=self.headers, params=params).json()
+        return self._get("/prompts", params)
 
     def get_tags(self, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/tags", headers=self.headers, params=params).json()
+        return self._get("/tags", params)
 
     def get_topics(self, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/topics", headers=self.headers, params=params).json()
+        return self._get("/topics", params)
 
     def get_models(self, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/models", headers=self.headers, params=params).json()
+        return self._get("/models", params)
 
     def get_chats(self, start_date, end_date, project_id=None, limit=1000, offset=0):
         params = {"limit": limit, "offset": offset, "start_date": start_date, "end_date": end_date}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(f"{PEEC_BASE}/chats", headers=self.headers, params=params).json()
+        return self._get("/chats", params, check=True)
 
     def get_chat(self, chat_id, project_id=None):
         params = {}
         if project_id:
             params["project_id"] = project_id
-        return requests.get(
-            f"{PEEC_BASE}/chats/{chat_id}/content", headers=self.headers, params=params
-        ).json()
+        return self._get(f"/chats/{chat_id}/content", params, check=True)
 
     # ── report endpoints (POST) ──────────────────────────────────
-    def _report(self, endpoint, start_date, end_date, dimensions=None,
-                project_id=None, limit=1000, offset=0):
+    @staticmethod
+    def _report_payload(start_date, end_date, dimensions=None, project_id=None,
+                        limit=1000, offset=0):
         payload = {"limit": limit, "offset": offset,
                    "start_date": start_date, "end_date": end_date}
         if dimensions:
             payload["dimensions"] = dimensions
         if project_id:
             payload["project_id"] = project_id
-        return requests.post(
-            f"{PEEC_BASE}/reports/{endpoint}", headers=self.headers, json=payload
-        ).json()
+        return payload
+
+    def _report(self, endpoint, start_date, end_date, **kwargs):
+        return self._post(f"/reports/{endpoint}", self._report_payload(start_date, end_date, **kwargs))
+
+    def iter_report(self, endpoint, start_date, end_date, page_size=REPORT_PAGE_SIZE,
+                    journal=None, **kwargs):
+        """
+        Yield every "data" row of a report, paging by limit/offset until an
+        empty page. Pages may come back shorter than page_size (servers cap
+        it), so offset advances by the rows received. Each page is parsed as
+        its body streams in, so no whole payload is held (see
+        http_telemetry.stream_rows). Raises on a non-200 response. With a
+        journal.Journal, completed pages are checkpointed and replayed on a
+        retry.
+        """
+        dims = "-".join(kwargs.get("dimensions") or ()) or "total"
+        offset, first = 0, None
+        while True:
+            def page(offset=offset):
+                return http_telemetry.stream_rows(
+                    "POST", f"{self.base_url}/reports/{endpoint}", prefix="data.item", api="peec",
+                    error_prefix="Peec API error", headers=self.headers,
+                    json=self._report_payload(start_date, end_date, limit=page_size,
+                                              offset=offset, **kwargs),
+                )
+            rows = journal.replay_or_record(f"{endpoint}_{dims}_{offset}", page) if journal else page()
+            n = 0
+            for row in rows:
+                # A later page opening with the first row means the endpoint
+                # ignores offset and has already sent everything
+                if offset and not n and row == first:
+                    return
+                if first is None:
+                    first = row
+                n += 1
+                yield row
+            if not n:
+                return
+            offset += n
+
+    def fetch_reports(self, specs, workers=4, journal=None, transforms=None):
+        """
+        Fetch several reports concurrently. specs are ReportSpecs (see
+        report_spec); identical specs are fetched once. Returns
+        {spec: list of rows}, each row passed through transforms[spec]
+        when given (applied as the rows stream in). Raises the first error.
+        """
+        transforms = transforms or {}
+        unique = list(dict.fromkeys(specs))
+
+        def fetch(spec):
+            fn = transforms.get(spec)
+            rows = self.iter_report(
+                spec.endpoint, spec.start_date, spec.end_date, journal=journal,
+                dimensions=list(spec.dimensions), project_id=spec.project_id,
+            )
+            return [fn(r) for r in rows] if fn else list(rows)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as pool:
+            futures = {spec: pool.submit(fetch, spec) for spec in unique}
+            return {spec: fut.result() for spec, fut in futures.items()}
 
     def report_brands(self, start_date, end_date, **kwargs):
         return self._report("brands", start_date, end_date, **kwargs)
@@ -119,49 +221,57 @@ class PeecClient:
 # ══════════════════════════════════════════════════════════════════
 # Shared helpers
 # ══════════════════════════════════════════════════════════════════
-def _extract_domain(url):
-    if not url:
-        return ""
-    if not url.startswith("http"):
-        url = "https://" + url
-    try:
-        host = urlparse(url).netloc.lower()
-        return re.sub(r"^www\.", "", host)
-    except Exception:
-        return url.split("/")[0].lower()
-
-
-def _extract_subdomain(url):
-    if not url:
-        return ""
-    if not url.startswith("http"):
-        url = "https://" + url
-    try:
-        return urlparse(url).netloc.lower()
-    except Exception:
-        return url.split("/")[0].lower()
-
-
-def _build_row(r):
-    raw_url = r.get("urlNormalized") or r.get("url", "")
+# URL / domain -> host rules live in hostnames.py (memoised, persisted)
+_extract_domain = hostnames.extract_domain
+_extract_subdomain = hostnames.extract_subdomain
+_normalise_host = hostnames.normalise_host
+
+
+def _row_builder(prompts):
+    """
+    Row builder for one project's report rows (prompts: prompt ID -> text).
+    A _LazyLookup is resolved on the first row, not when the builder is made.
+    """
+    prompt_text = None
+
+    def build_row(r):
+        nonlocal prompt_text
+        if prompt_text is None:
+            prompt_text = getattr(prompts, "data", prompts).get
+        raw_url = r.get("urlNormalized") or r.get("url", "")
+        return {
+            "URL": raw_url,
+            "Full URL": r.get("url", ""),
+            "Domain": _extract_domain(raw_url),
+            "Subdomain": _extract_subdomain(raw_url),
+            "Title": r.get("title"),
+            "Page Type": r.get("classification"),
+            "Prompt": prompt_text(
+                (r.get("prompt") or {}).get("id", ""),
+                (r.get("prompt") or {}).get("id", ""),
+            ),
+            "Prompt ID": (r.get("prompt") or {}).get("id"),
+            "Model": (r.get("model") or {}).get("id"),
+            "citation_avg": r.get("citation_avg", 0),
+            "usage_count": r.get("usage_count", 0),
+        }
+    return build_row
+
+
+def _prompt_lookup(prompts_raw):
     return {
-        "URL": raw_url,
-        "Full URL": r.get("url", ""),
-        "Domain": _extract_domain(raw_url),
-        "Subdomain": _extract_subdomain(raw_url),
-        "Title": r.get("title"),
-        "Page Type": r.get("classification"),
-        "Prompt": prompt_lookup.get(
-            (r.get("prompt") or {}).get("id", ""),
-            (r.get("prompt") or {}).get("id", ""),
-        ),
-        "Prompt ID": (r.get("prompt") or {}).get("id"),
-        "Model": (r.get("model") or {}).get("id"),
-        "citation_avg": r.get("citation_avg", 0),
-        "usage_count": r.get("usage_count", 0),
+        p["id"]: p["messages"][0]["content"] if p.get("messages") else p["id"]
+        for p in prompts_raw
     }
 
 
+def _build_row_for(project_id):
+    """Row builder for another project (fetches its prompts), e.g. for fan-out pulls."""
+    if project_id == PROJECT_ID:
+        return _build_row
+    return _row_builder(_prompt_lookup(peec.get_prompts(project_id=project_id)["data"]))
+
+
 def _scroll_table(df):
     """Render full dataframe inside a scrollable container with sticky headers."""
     return HTML(
@@ -171,28 +281,28 @@ def _scroll_table(df):
     )
 
 
-def _normalise_host(domain):
+def _frame_fingerprint(df):
+    """
+    Content hash of a DataFrame (column names + cell values, index ignored).
+    Returns None for a missing frame so "never pulled" is distinct from "empty".
+    Used to detect whether an upstream result changed between runs.
+    """
+    import pipeline
+    return pipeline.frame_fingerprint(df)
+
+
+def _grouped_agg(df, key, **spec):
     """
-    Normalise a domain / URL to its bare hostname for matching.
-
-    Steps:
-      1. Lowercase & strip whitespace
-      2. Remove protocol  (http:// or https://)
-      3. Remove www. prefix
-      4. Remove any path, query-string, or fragment
-      5. Remove trailing dots / slashes
-
-    Examples:
-      https://www.spacenk.com/uk/brands  ->  spacenk.com
-      rebeccajones.substack.com           ->  rebeccajones.substack.com
-      www.substack.com                    ->  substack.com
+    Same result as df.groupby(key, as_index=False).agg(**spec).
+    Frames of PARALLEL_AGG_MIN_ROWS or more are hash-partitioned by key
+    across a process pool (see parallel_agg.py); smaller frames, or specs
+    the backend can't run, use pandas directly.
     """
-    s = str(domain).lower().strip()
-    s = re.sub(r"^https?://", "", s)
-    s = re.sub(r"^www\.", "", s)
-    s = s.split("/")[0].split("?")[0].split("#")[0]
-    s = s.rstrip(".")
-    return s
+    if len(df) >= PARALLEL_AGG_MIN_ROWS and (os.cpu_count() or 1) > 1:
+        import parallel_agg
+        if parallel_agg.supports(spec):
+            return parallel_agg.groupby_agg(df, key, spec)
+    return df.groupby(key, as_index=False).agg(**spec)
 
 
 def download_file(filepath, filename=None):
@@ -217,28 +327,81 @@ def download_file(filepath, filename=None):
 
 
 # ══════════════════════════════════════════════════════════════════
-# Fetch lookups & instantiate client
+# Lookups (fetched on first use) & client
 # ══════════════════════════════════════════════════════════════════
-print(f"\u23f3 Loading lookups for {PROJECT_NAME}...")
+class _Lookups:
+    """
+    The project's prompt / tag / topic / model lookups. Nothing is fetched
+    until one is first read; then all four endpoints are fetched together
+    (they are independent, so concurrently) and kept for the session.
+    """
+
+    def __init__(self, client, project_id):
+        self.client = client
+        self.project_id = project_id
+        self._data = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:  # report pages build rows on several threads
+            if self._data is None:
+                print(f"\u23f3 Loading lookups for {PROJECT_NAME}...")
+                c = self.client
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    futures = [pool.submit(fn, project_id=self.project_id)
+                               for fn in (c.get_prompts, c.get_tags, c.get_topics, c.get_models)]
+                prompts, tags, topics, models = [f.result()["data"] for f in futures]
+                self._data = {
+                    "prompts": _prompt_lookup(prompts),
+                    "tags": {t["id"]: t["name"] for t in tags},
+                    "topics": {t["id"]: t["name"] for t in topics},
+                    "models": models,
+                }
+                print(
+                    f"\u2705 Lookups loaded \u2014 {len(self._data['prompts'])} prompts, "
+                    f"{len(self._data['tags'])} tags, {len(self._data['topics'])} topics, "
+                    f"{len(models)} models"
+                )
+        return self._data
+
+
+class _LazyLookup(Mapping):
+    """Read-only ID -> name mapping backed by one of the _Lookups."""
+
+    def __init__(self, lookups, name):
+        self._lookups = lookups
+        self._name = name
+
+    @property
+    def data(self):
+        return self._lookups.load()[self._name]
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __repr__(self):
+        loaded = self._lookups._data is not None
+        return repr(self.data) if loaded else f"<{self._name} lookup: not loaded yet>"
 
-peec = PeecClient()
 
-_prompts_raw = peec.get_prompts(project_id=PROJECT_ID)["data"]
-_tags_raw = peec.get_tags(project_id=PROJECT_ID)["data"]
-_topics_raw = peec.get_topics(project_id=PROJECT_ID)["data"]
-_models_raw = peec.get_models(project_id=PROJECT_ID)["data"]
+peec = PeecClient()
+_lookups = _Lookups(peec, PROJECT_ID)
 
-prompt_lookup = {
-    p["id"]: p["messages"][0]["content"] if p.get("messages") else p["id"]
-    for p in _prompts_raw
-}
-tag_lookup = {t["id"]: t["name"] for t in _tags_raw}
-topic_lookup = {t["id"]: t["name"] for t in _topics_raw}
+prompt_lookup = _LazyLookup(_lookups, "prompts")
+_build_row = _row_builder(prompt_lookup)
+tag_lookup = _LazyLookup(_lookups, "tags")
+topic_lookup = _LazyLookup(_lookups, "topics")
 
-print(
-    f"\u2705 Ready \u2014 {len(prompt_lookup)} prompts, {len(tag_lookup)} tags, "
-    f"{len(topic_lookup)} topics, {len(_models_raw)} models"
-)
+print(f"\u2705 Peec client ready for {PROJECT_NAME} (lookups load on first use)")
 
 # ── Export to __main__ ───────────────────────────────────────────
 __main__.peec = peec
@@ -248,6 +411,10 @@ __main__.topic_lookup = topic_lookup
 __main__._extract_domain = _extract_domain
 __main__._extract_subdomain = _extract_subdomain
 __main__._build_row = _build_row
+__main__._build_row_for = _build_row_for
+__main__.report_spec = report_spec
 __main__._scroll_table = _scroll_table
 __main__._normalise_host = _normalise_host
+__main__._frame_fingerprint = _frame_fingerprint
+__main__._grouped_agg = _grouped_agg
 __main__.download_file = download_file
@@ -1,26 +1,186 @@
 # cell_04_peec_data_pull.py — Pull PEEC citation data
-# Uses session date range and project. Produces: df_detail
+# Uses session date range and project.
+# Produces: df_detail (sorted by Domain), detail_domain_index, MODEL_IDS,
+#   domain_model_mask, url_model_mask, _render_model_codes
 
 import __main__
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display
 
+import hostnames
+import http_telemetry
+import journal
+import pipeline
+import profiling
+import report_memo
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["peec", "prompt_lookup", "SESSION_START_DATE", "SESSION_END_DATE",
-           "PROJECT_ID", "PROJECT_NAME", "_build_row", "_scroll_table", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["peec", "prompt_lookup", "SESSION_START_DATE", "SESSION_END_DATE",
+                  "PROJECT_ID", "PROJECT_NAME", "_build_row", "report_spec",
+                  "_scroll_table", "PATHS"], "cell_04")
 
 peec = __main__.peec
 _build_row = __main__._build_row
+report_spec = __main__.report_spec
 _scroll_table = __main__._scroll_table
 PROJECT_ID = __main__.PROJECT_ID
 PROJECT_NAME = __main__.PROJECT_NAME
 PATHS = __main__.PATHS
+HEADLESS = getattr(__main__, "HEADLESS", False)
 
 # ── State ────────────────────────────────────────────────────────
 df_detail = None
+detail_domain_index = None
+MODEL_IDS = ()
+domain_model_mask = None
+url_model_mask = None
+
+
+# ── Domain row-range index ───────────────────────────────────────
+def _build_domain_index(df):
+    """
+    Map each domain to its (start, stop) row range in df, which must already
+    be sorted by Domain. Lets downstream cells slice a domain's detail rows
+    without scanning or copying the whole frame.
+    """
+    dom = df["Domain"].to_numpy()
+    if len(dom) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, dom[1:] != dom[:-1]])
+    stops = np.r_[starts[1:], len(dom)]
+    return dict(zip(dom[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+
+# ── Model bitmasks ───────────────────────────────────────────────
+# Masks travel with the model IDs their bits index, so masks captured before
+# a re-pull (whose model list may differ) still decode correctly
+ModelMasks = namedtuple("ModelMasks", "model_ids masks")
+
+
+def _build_model_masks(df):
+    """
+    Encode the set of models citing each domain / URL as a bitmask over
+    MODEL_IDS (bit i set = MODEL_IDS[i] cites it). Built once per pull so the
+    reports never re-group df_detail just to list model codes.
+    Returns (model_ids, ModelMasks for domains, ModelMasks for URLs).
+    """
+    model_ids = tuple(sorted(df["Model"].dropna().astype(str).unique()))
+    models = df["Model"].astype(str).where(df["Model"].notna())
+    codes = pd.Categorical(models, categories=model_ids).codes
+    has = codes >= 0
+    if len(model_ids) <= 63:
+        bits = np.left_shift(np.int64(1), codes[has].astype(np.int64))
+    else:  # beyond int64 width: fall back to Python ints
+        bits = np.array([1 << int(c) for c in codes[has]], dtype=object)
+
+    frame = pd.DataFrame({
+        "Domain": df["Domain"].values[has],
+        "URL": df["URL"].values[has],
+        "_code": codes[has],
+        "_bit": bits,
+    })
+    domain_masks = frame.drop_duplicates(["Domain", "_code"]).groupby("Domain")["_bit"].sum()
+    url_masks = frame.drop_duplicates(["URL", "_code"]).groupby("URL")["_bit"].sum()
+    return model_ids, ModelMasks(model_ids, domain_masks), ModelMasks(model_ids, url_masks)
+
+
+def _render_model_codes(keys, model_masks, width=3):
+    """
+    Render the model codes for the given domains / URLs only, e.g.
+    "cha, cla, gem", from a ModelMasks (domain_model_mask / url_model_mask).
+    Each model ID is truncated to `width` characters, de-duped and sorted.
+    Distinct masks are rendered once and reused.
+    """
+    model_ids, masks = model_masks
+    rendered = {}
+
+    def _one(mask):
+        if mask not in rendered:
+            m = int(mask)
+            out = []
+            for i, mid in enumerate(model_ids):
+                if m >> i & 1:
+                    code = mid[:width]
+                    if not out or out[-1] != code:
+                        out.append(code)
+            rendered[mask] = ", ".join(out)
+        return rendered[mask]
+
+    values = masks.reindex(pd.Index(keys), fill_value=0)
+    return [_one(m) for m in values.tolist()]
+
+
+# ── Pull + publish ───────────────────────────────────────────────
+def pull_peec_detail(start_date, end_date, project_id=PROJECT_ID, resume=True, build_row=None):
+    """
+    Fetch domain classifications and the URL report (prompt x model
+    breakdown) and build the detail frame, sorted by Domain.
+    Returns None if the API returned no rows. build_row defaults to the
+    session project's row builder (pass _build_row_for(project_id) when
+    pulling another project).
+
+    Both reports are fetched in one concurrent round (peec.fetch_reports),
+    every page checkpointed in the run journal as it arrives, so a retry
+    after a failure re-uses what already arrived (resume=False always
+    fetches everything).
+    """
+    build_row = build_row or _build_row
+    jr = journal.Journal("peec_detail", {
+        "project_id": project_id, "start": start_date, "end": end_date,
+        "base_url": peec.base_url,
+    }, enabled=resume)
+    domains = report_spec("domains", start_date, end_date, project_id=project_id)
+    urls = report_spec("urls", start_date, end_date, project_id=project_id,
+                       dimensions=["prompt_id", "model_id"])
+
+    print("\u23f3 Fetching domain classifications and URL report (prompt \u00d7 model breakdown)...")
+    # URL rows are built as the body streams in, so the raw payload is never
+    # held alongside the built rows
+    with profiling.stage("peec_api_reports", cell="cell_04") as rec:
+        reports = peec.fetch_reports([domains, urls], journal=jr,
+                                     transforms={urls: build_row})
+        rows = reports[urls]
+        rec["rows"] = len(rows) + len(reports[domains])
+        rec["resumed"] = bool(jr.resumed)
+    domain_class = {
+        r["domain"]: r.get("classification", "Unknown")
+        for r in reports.pop(domains) if r.get("domain")
+    }
+    del reports
+    if jr.resumed:
+        print(f"   \u21bb Resumed from journal: {len(jr.resumed)} report page(s)")
+    jr.finish()
+    if not rows:
+        return None
+
+    with profiling.stage("peec_build_rows", cell="cell_04", rows=len(rows)):
+        df = pd.DataFrame(rows)
+        del rows
+        df["Domain Type"] = df["Domain"].map(domain_class).fillna("Unknown")
+        # Stable sort keeps per-URL row order, so "first" aggregations are unchanged
+        return df.sort_values("Domain", kind="mergesort").reset_index(drop=True)
+
+
+def _publish_detail(df):
+    """Store df_detail plus its domain index and model bitmasks on __main__."""
+    global df_detail, detail_domain_index, MODEL_IDS, domain_model_mask, url_model_mask
+    df_detail = df
+    with profiling.stage("peec_index", cell="cell_04", rows=len(df)):
+        detail_domain_index = _build_domain_index(df)
+        MODEL_IDS, domain_model_mask, url_model_mask = _build_model_masks(df)
+    __main__.df_detail = df_detail
+    __main__.detail_domain_index = detail_domain_index
+    __main__.MODEL_IDS = MODEL_IDS
+    __main__.domain_model_mask = domain_model_mask
+    __main__.url_model_mask = url_model_mask
+    pipeline.built("cell_04")
+    report_memo.invalidate()  # report results of the previous pull
+    hostnames.save()
+
 
 # ── Widgets ──────────────────────────────────────────────────────
 header = widgets.HTML(
@@ -38,37 +198,14 @@ pull_output = widgets.Output()
 
 
 def on_pull(b):
-    global df_detail
     with pull_output:
         pull_output.clear_output()
         pull_stats.value = ""
-        sd = __main__.SESSION_START_DATE
-        ed = __main__.SESSION_END_DATE
-
-        print("\u23f3 Fetching domain classifications...")
-        domains_report = peec.report_domains(
-            start_date=sd, end_date=ed, project_id=PROJECT_ID,
-        )
-        domain_class = {
-            r["domain"]: r.get("classification", "Unknown")
-            for r in domains_report.get("data", []) if r.get("domain")
-        }
-
-        print("\u23f3 Fetching URL report (prompt \u00d7 model breakdown)...")
-        report = peec.report_urls(
-            start_date=sd, end_date=ed, project_id=PROJECT_ID,
-            dimensions=["prompt_id", "model_id"],
-        )
-
-        rows = report.get("data", [])
-        if not rows:
+        df = pull_peec_detail(__main__.SESSION_START_DATE, __main__.SESSION_END_DATE)
+        if df is None:
             print("\u26a0\ufe0f No data returned for this date range.")
             return
-
-        df = pd.DataFrame([_build_row(r) for r in rows])
-        df["Domain Type"] = df["Domain"].map(domain_class).fillna("Unknown")
-        df_detail = df
-        __main__.df_detail = df_detail
+        _publish_detail(df)
 
         pull_output.clear_output()
         pull_stats.value = (
@@ -81,6 +218,10 @@ def on_pull(b):
         )
 
 
+__main__._render_model_codes = _render_model_codes
+
 pull_btn.on_click(on_pull)
 
-display(header, pull_btn, pull_output, pull_stats)
+if not HEADLESS:
+    display(header, pull_btn, pull_output, pull_stats, profiling.panel("cell_04"),
+            http_telemetry.panel("peec"))
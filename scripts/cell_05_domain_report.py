@@ -1,20 +1,28 @@
 # cell_05_domain_report.py — Domain-level aggregation report
 # Produces: df_domain_result
 
+import threading
+
 import __main__
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import approx
+import pipeline
+import profiling
+import report_memo
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["df_detail", "_scroll_table", "download_file", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["df_detail", "_scroll_table", "_grouped_agg", "download_file", "PATHS"],
+                 "cell_05")
 
 df_detail = __main__.df_detail
 _scroll_table = __main__._scroll_table
+_grouped_agg = __main__._grouped_agg
 download_file = __main__.download_file
 PATHS = __main__.PATHS
+HEADLESS = getattr(__main__, "HEADLESS", False)
 
 DOMAIN_CSV = str(PATHS["output"] / "peec_domain_report.csv")
 df_domain_result = None
@@ -41,6 +49,16 @@ d_domain_search = widgets.Text(
     style={"description_width": "120px"}, layout=widgets.Layout(width="380px"),
 )
 
+# Large pulls filter a stratified sample; "Compute exact" runs the full report
+d_approx = widgets.Checkbox(
+    value=df_detail is not None and len(df_detail) >= approx.APPROX_MIN_ROWS,
+    description="Approximate (sampled)", indent=False,
+    layout=widgets.Layout(width="200px", margin="8px 0 0 12px"),
+)
+d_exact_btn = widgets.Button(
+    description="  Compute exact", icon="check",
+    layout=widgets.Layout(width="160px", height="36px"),
+)
 d_dl_btn = widgets.Button(
     description="  \u2b07 Download CSV", button_style="success",
     layout=widgets.Layout(width="160px", height="36px"),
@@ -52,64 +70,113 @@ d_table = widgets.Output(layout=widgets.Layout(
 ))
 
 
-def _run_domain_report():
-    global df_domain_result
-    d_stats.value = ""
-    with d_table:
-        d_table.clear_output(wait=True)
-
-    if df_detail is None:
-        with d_table:
-            d_table.clear_output(wait=True)
-            display(HTML("\u26a0\ufe0f Pull data first."))
-        return
-
-    df = df_detail.copy()
+@profiling.instrument("domain_groupby", cell="cell_05")
+def build_domain_report(df, model="All", prompt_query="", page_type="All",
+                        domain_type="All", domain_query="", approximate=False):
+    """
+    Filter df_detail and aggregate to one row per domain, sorted by citations.
+    Returns None if no rows survive the pre-aggregation filters.
+    approximate=True estimates the report from approx.sample(df), adding
+    "\u00b1" columns and a label in .attrs["approx"].
+    """
+    full = df
+    if approximate:
+        df = approx.sample(df)
 
     # Pre-aggregation filters
-    if d_model.value != "All":
-        df = df[df["Model"] == d_model.value]
-    pq = d_prompt_search.value.strip().lower()
+    if model != "All":
+        df = df[df["Model"] == model]
+    pq = prompt_query.strip().lower()
     if pq:
         df = df[df["Prompt"].astype(str).str.lower().str.contains(pq, na=False)]
-    if d_page_type.value != "All":
-        df = df[df["Page Type"] == d_page_type.value]
+    if page_type != "All":
+        df = df[df["Page Type"] == page_type]
 
     if df.empty:
-        d_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
-        return
+        return None
 
     # Aggregate
-    agg = (
-        df.groupby("Domain", as_index=False)
-        .agg(
-            Domain_Type=("Domain Type", "first"),
-            Total_Citations=("usage_count", "sum"),
-            Avg_Citation_Pos=("citation_avg", "mean"),
-            Unique_Pages=("URL", "nunique"),
-            Unique_Subdomains=("Subdomain", "nunique"),
-            Models_Present=("Model", "nunique"),
-            Prompts_Appearing_In=("Prompt", "nunique"),
-        )
+    agg = (approx.grouped_agg if approximate else _grouped_agg)(
+        df, "Domain",
+        Domain_Type=("Domain Type", "first"),
+        Total_Citations=("usage_count", "sum"),
+        Avg_Citation_Pos=("citation_avg", "mean"),
+        Unique_Pages=("URL", "nunique"),
+        Unique_Subdomains=("Subdomain", "nunique"),
+        Models_Present=("Model", "nunique"),
+        Prompts_Appearing_In=("Prompt", "nunique"),
     )
     agg.columns = [
         "Domain", "Domain Type", "Total Citations", "Avg Citation Pos",
         "Unique Pages", "Unique Subdomains", "Models Present", "Prompts Appearing In",
-    ]
+    ] + (["Total Citations \u00b1", "Avg Citation Pos \u00b1"] if approximate else [])
     agg["Avg Citation Pos"] = agg["Avg Citation Pos"].round(2)
+    if approximate:
+        agg["Total Citations"] = agg["Total Citations"].round().astype(int)
+        agg["Total Citations \u00b1"] = agg["Total Citations \u00b1"].round().astype(int)
+        agg["Avg Citation Pos \u00b1"] = agg["Avg Citation Pos \u00b1"].round(2)
 
     # Post-aggregation filters
-    if d_domain_type.value != "All":
-        agg = agg[agg["Domain Type"] == d_domain_type.value]
-    dq = d_domain_search.value.strip().lower()
+    if domain_type != "All":
+        agg = agg[agg["Domain Type"] == domain_type]
+    dq = domain_query.strip().lower()
     if dq:
         agg = agg[agg["Domain"].str.lower().str.contains(dq, na=False)]
 
     agg = agg.sort_values("Total Citations", ascending=False).reset_index(drop=True)
+    if approximate:
+        agg.attrs["approx"] = approx.describe(df, full)
+    return agg
+
+
+def _publish_domain_report(agg):
+    """Store df_domain_result on __main__ and save the CSV."""
+    global df_domain_result
     df_domain_result = agg
     __main__.df_domain_result = df_domain_result
-    agg.to_csv(DOMAIN_CSV, index=False)
+    pipeline.built("cell_05")
+    with profiling.stage("domain_to_csv", cell="cell_05", rows=len(agg)):
+        agg.to_csv(DOMAIN_CSV, index=False)
+
+
+_d_exact_run = {"token": None}  # latest background exact run
+_d_memo = report_memo.memo("domain_report")  # recent (agg, HTML) per filter state
+
+
+def _domain_filters():
+    return dict(
+        model=d_model.value,
+        prompt_query=d_prompt_search.value,
+        page_type=d_page_type.value,
+        domain_type=d_domain_type.value,
+        domain_query=d_domain_search.value,
+    )
 
+
+def _domain_html(agg):
+    with profiling.stage("domain_to_html", cell="cell_05", rows=len(agg)):
+        html = agg.to_html(index=True, escape=False, max_cols=None, max_rows=None)
+    return '<div class="peec-scroll" style="max-height:none;overflow:visible;">' + html + "</div>"
+
+
+def _domain_report(filters, approximate=False):
+    """
+    (agg, table HTML) for a filter state, served from _d_memo when the same
+    state was computed recently on this df_detail. agg is None if no rows match.
+    """
+    key = _d_memo.key([df_detail], casefold=("prompt_query", "domain_query"),
+                      approximate=approximate, **filters)
+    hit = _d_memo.get(key)
+    if hit is None:
+        agg = build_domain_report(df_detail, approximate=approximate, **filters)
+        hit = (agg, None if agg is None else _domain_html(agg))
+        _d_memo.put(key, hit)
+    return hit
+
+
+def _show_domain_report(agg, html):
+    """Render stats + table (callable from the background exact run)."""
+    label = agg.attrs.get("approx")
     d_stats.value = (
         f'<div>'
         f'<span class="peec-stat">\U0001f310 Domains: <b>{len(agg):,}</b></span>'
@@ -117,14 +184,64 @@ def _run_domain_report():
         f'<span class="peec-stat">\U0001f4cd Avg Citation Pos: <b>{agg["Avg Citation Pos"].mean():.1f}</b></span>'
         f'<span class="peec-stat">\U0001f4c4 Total Unique Pages: <b>{agg["Unique Pages"].sum():,.0f}</b></span>'
         f'</div>'
+        + (f'<div class="peec-sub">{label} Until <b>Compute exact</b> finishes, Download CSV '
+           f'is off and later cells (08\u201310) use the last exact report.</div>'
+           if label else "")
     )
+    d_dl_btn.disabled = bool(label)  # the CSV holds the last exact report, not this one
+    d_table.clear_output(wait=True)
+    d_table.append_display_data(HTML(html))
+
+
+def _run_domain_report(exact=False):
+    _d_exact_run["token"] = None  # a filter change supersedes a pending exact run
+    d_stats.value = ""
     with d_table:
         d_table.clear_output(wait=True)
-        display(HTML(
-            '<div class="peec-scroll" style="max-height:none;overflow:visible;">'
-            + agg.to_html(index=True, escape=False, max_cols=None, max_rows=None)
-            + "</div>"
-        ))
+
+    if df_detail is None:
+        with d_table:
+            d_table.clear_output(wait=True)
+            display(HTML("\u26a0\ufe0f Pull data first."))
+        return
+
+    approximate = d_approx.value and not exact
+    agg, html = _domain_report(_domain_filters(), approximate)
+    if agg is None:
+        d_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
+        return
+    # Estimates never reach df_domain_result / the CSV; a memo hit already
+    # published is not written again
+    if not approximate and agg is not df_domain_result:
+        _publish_domain_report(agg)
+    _show_domain_report(agg, html)
+
+
+def _on_d_exact(b):
+    """Run the exact report for the current filters on a background thread."""
+    if df_detail is None:
+        return
+    token = _d_exact_run["token"] = object()
+    filters = _domain_filters()
+    d_stats.value = '<div class="peec-stat">\u23f3 Computing exact report...</div>'
+
+    def work():
+        try:
+            agg, html = _domain_report(filters)
+        except Exception as e:
+            if _d_exact_run["token"] is token:
+                d_stats.value = f'<div class="peec-stat">\u274c {type(e).__name__}: {e}</div>'
+            return
+        if _d_exact_run["token"] is not token:  # filters changed meanwhile
+            return
+        if agg is None:
+            d_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
+            return
+        if agg is not df_domain_result:
+            _publish_domain_report(agg)
+        _show_domain_report(agg, html)
+
+    threading.Thread(target=work, name="domain_exact", daemon=True).start()
 
 
 def _init_domain_filters():
@@ -149,23 +266,26 @@ def _on_d_dl(b):
 
 
 d_dl_btn.on_click(_on_d_dl)
+d_exact_btn.on_click(_on_d_exact)
 
 _init_domain_filters()
 
-display(
-    widgets.HTML(
-        '<div class="peec-header">\U0001f310 Domain-Level Report</div>'
-        '<div class="peec-sub">One row per domain \u2014 citations summed across models (filter to drill down)</div>'
-    ),
-    widgets.HTML('<div class="peec-section">Filters</div>'),
-    widgets.HBox([d_page_type, d_domain_type, d_model], layout=widgets.Layout(margin="0 0 4px 0")),
-    widgets.HBox([d_prompt_search, d_domain_search], layout=widgets.Layout(margin="0 0 8px 0")),
-    d_dl_btn,
-    d_stats,
-    d_table,
-)
-
-_run_domain_report()
+# Batch (headless) runs call build_domain_report() / _publish_domain_report() directly
+if not HEADLESS:
+    display(
+        widgets.HTML(
+            '<div class="peec-header">\U0001f310 Domain-Level Report</div>'
+            '<div class="peec-sub">One row per domain \u2014 citations summed across models (filter to drill down)</div>'
+        ),
+        widgets.HTML('<div class="peec-section">Filters</div>'),
+        widgets.HBox([d_page_type, d_domain_type, d_model], layout=widgets.Layout(margin="0 0 4px 0")),
+        widgets.HBox([d_prompt_search, d_domain_search], layout=widgets.Layout(margin="0 0 8px 0")),
+        widgets.HBox([d_dl_btn, d_exact_btn, d_approx]),
+        d_stats,
+        d_table,
+        profiling.panel("cell_05"),
+    )
+    _run_domain_report(exact=True)
 
 # Attach filter observers AFTER initial run to prevent double-trigger
 d_page_type.observe(_on_d_filter, names="value")
@@ -173,3 +293,4 @@ d_domain_type.observe(_on_d_filter, names="value")
 d_model.observe(_on_d_filter, names="value")
 d_prompt_search.observe(_on_d_filter, names="value")
 d_domain_search.observe(_on_d_filter, names="value")
+d_approx.observe(_on_d_filter, names="value")
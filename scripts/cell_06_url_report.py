@@ -1,20 +1,28 @@
 # cell_06_url_report.py — URL / page-level aggregation report
 # Produces: df_url_result
 
+import threading
+
 import __main__
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import approx
+import pipeline
+import profiling
+import report_memo
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["df_detail", "_scroll_table", "download_file", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["df_detail", "_scroll_table", "_grouped_agg", "download_file", "PATHS"],
+                 "cell_06")
 
 df_detail = __main__.df_detail
 _scroll_table = __main__._scroll_table
+_grouped_agg = __main__._grouped_agg
 download_file = __main__.download_file
 PATHS = __main__.PATHS
+HEADLESS = getattr(__main__, "HEADLESS", False)
 
 URL_CSV = str(PATHS["output"] / "peec_url_report.csv")
 df_url_result = None
@@ -45,6 +53,16 @@ u_url_search = widgets.Text(
     style={"description_width": "120px"}, layout=widgets.Layout(width="380px"),
 )
 
+# Large pulls filter a stratified sample; "Compute exact" runs the full report
+u_approx = widgets.Checkbox(
+    value=df_detail is not None and len(df_detail) >= approx.APPROX_MIN_ROWS,
+    description="Approximate (sampled)", indent=False,
+    layout=widgets.Layout(width="200px", margin="8px 0 0 12px"),
+)
+u_exact_btn = widgets.Button(
+    description="  Compute exact", icon="check",
+    layout=widgets.Layout(width="160px", height="36px"),
+)
 u_dl_btn = widgets.Button(
     description="  \u2b07 Download CSV", button_style="success",
     layout=widgets.Layout(width="160px", height="36px"),
@@ -56,88 +74,107 @@ u_table = widgets.Output(layout=widgets.Layout(
 ))
 
 
-def _run_url_report():
-    global df_url_result
-    u_stats.value = ""
-    with u_table:
-        u_table.clear_output(wait=True)
-
-    if df_detail is None:
-        with u_table:
-            u_table.clear_output(wait=True)
-            display(HTML("\u26a0\ufe0f Pull data first."))
-        return
-
-    df = df_detail.copy()
+@profiling.instrument("url_groupby", cell="cell_06")
+def build_url_report(df, model="All", prompt_query="", title_query="",
+                     page_type="All", domain_type="All", url_query="", approximate=False):
+    """
+    Filter df_detail and aggregate to one row per URL, sorted by citations.
+    Returns None if no rows survive the pre-aggregation filters.
+    approximate=True estimates the report from approx.sample(df), adding
+    "\u00b1" columns and a label in .attrs["approx"].
+    """
+    full = df
+    if approximate:
+        df = approx.sample(df)
 
     # Pre-aggregation filters
-    if u_model.value != "All":
-        df = df[df["Model"] == u_model.value]
-    pq = u_prompt_search.value.strip().lower()
+    if model != "All":
+        df = df[df["Model"] == model]
+    pq = prompt_query.strip().lower()
     if pq:
         df = df[df["Prompt"].astype(str).str.lower().str.contains(pq, na=False)]
-    tq = u_title_search.value.strip().lower()
+    tq = title_query.strip().lower()
     if tq:
         df = df[df["Title"].astype(str).str.lower().str.contains(tq, na=False)]
-    if u_page_type.value != "All":
-        df = df[df["Page Type"] == u_page_type.value]
-    if u_domain_type.value != "All":
-        df = df[df["Domain Type"] == u_domain_type.value]
+    if page_type != "All":
+        df = df[df["Page Type"] == page_type]
+    if domain_type != "All":
+        df = df[df["Domain Type"] == domain_type]
 
     if df.empty:
-        u_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
-        return
+        return None
 
     # Aggregate: one row per URL
-    agg = (
-        df.groupby("URL", as_index=False)
-        .agg(
-            Full_URL=("Full URL", "first"),
-            Domain=("Domain", "first"),
-            Title=("Title", "first"),
-            Page_Type=("Page Type", "first"),
-            Domain_Type=("Domain Type", "first"),
-            Avg_Citation_Pos=("citation_avg", "mean"),
-            Total_Citations=("usage_count", "sum"),
-            Models_Present=("Model", "nunique"),
-            Prompt_Count=("Prompt", "nunique"),
-        )
+    agg = (approx.grouped_agg if approximate else _grouped_agg)(
+        df, "URL",
+        Full_URL=("Full URL", "first"),
+        Domain=("Domain", "first"),
+        Title=("Title", "first"),
+        Page_Type=("Page Type", "first"),
+        Domain_Type=("Domain Type", "first"),
+        Avg_Citation_Pos=("citation_avg", "mean"),
+        Total_Citations=("usage_count", "sum"),
+        Models_Present=("Model", "nunique"),
+        Prompt_Count=("Prompt", "nunique"),
     )
     agg.columns = [
         "URL", "Full URL", "Domain", "Title", "Page Type",
         "Domain Type", "Avg Citation Pos", "Total Citations",
         "Models Present", "Prompt Count",
-    ]
+    ] + (["Avg Citation Pos \u00b1", "Total Citations \u00b1"] if approximate else [])
     agg["Avg Citation Pos"] = agg["Avg Citation Pos"].round(2)
+    if approximate:
+        agg["Total Citations"] = agg["Total Citations"].round().astype(int)
+        agg["Total Citations \u00b1"] = agg["Total Citations \u00b1"].round().astype(int)
+        agg["Avg Citation Pos \u00b1"] = agg["Avg Citation Pos \u00b1"].round(2)
 
     # URL text filter (post-agg)
-    uq = u_url_search.value.strip().lower()
+    uq = url_query.strip().lower()
     if uq:
         agg = agg[agg["URL"].str.lower().str.contains(uq, na=False)]
 
     agg = agg.sort_values("Total Citations", ascending=False).reset_index(drop=True)
+    if approximate:
+        agg.attrs["approx"] = approx.describe(df, full)
+    return agg
+
 
-    # Save full data to CSV
+def _publish_url_report(agg):
+    """Store df_url_result on __main__ and save the CSV (full data, no HTML)."""
+    global df_url_result
+    _u_published["agg"] = agg
     csv_df = agg[["Domain", "Title", "Page Type", "Domain Type",
                    "Avg Citation Pos", "Total Citations", "Models Present",
                    "Prompt Count", "Full URL"]].copy()
     df_url_result = csv_df.copy()
     __main__.df_url_result = df_url_result
-    csv_df.to_csv(URL_CSV, index=False)
+    pipeline.built("cell_06")
+    with profiling.stage("url_to_csv", cell="cell_06", rows=len(csv_df)):
+        csv_df.to_csv(URL_CSV, index=False)
 
-    u_stats.value = (
-        f'<div>'
-        f'<span class="peec-stat">\U0001f517 URLs: <b>{len(agg):,}</b></span>'
-        f'<span class="peec-stat">\U0001f310 Domains: <b>{agg["Domain"].nunique():,}</b></span>'
-        f'<span class="peec-stat">\U0001f522 Total Citations: <b>{agg["Total Citations"].sum():,.0f}</b></span>'
-        f'<span class="peec-stat">\U0001f4cd Avg Citation Pos: <b>{agg["Avg Citation Pos"].mean():.1f}</b></span>'
-        f'</div>'
+
+_u_exact_run = {"token": None}  # latest background exact run
+_u_published = {"agg": None}     # report behind df_url_result
+_u_memo = report_memo.memo("url_report")  # recent (agg, HTML) per filter state
+
+
+def _url_filters():
+    return dict(
+        model=u_model.value,
+        prompt_query=u_prompt_search.value,
+        title_query=u_title_search.value,
+        page_type=u_page_type.value,
+        domain_type=u_domain_type.value,
+        url_query=u_url_search.value,
     )
 
-    # Build display version: clickable truncated link as last column
+
+def _url_html(agg):
+    """Table HTML: display columns with a clickable truncated link as the last column."""
     display_df = agg[["Domain", "Title", "Page Type", "Domain Type",
                       "Avg Citation Pos", "Total Citations", "Models Present",
-                      "Prompt Count"]].copy()
+                      "Prompt Count"]
+                     + [c for c in agg.columns if c.endswith("\u00b1")]].copy()
 
     def _make_link(idx):
         full = agg.loc[idx, "Full URL"] if idx < len(agg) else ""
@@ -146,15 +183,95 @@ def _run_url_report():
         truncated = full[:70] + "..." if len(full) > 70 else full
         return f'<a href="{full}" target="_blank" title="{full}">{truncated}</a>'
 
-    display_df["Link"] = [_make_link(i) for i in range(len(agg))]
+    with profiling.stage("url_to_html", cell="cell_06", rows=len(agg)):
+        display_df["Link"] = [_make_link(i) for i in range(len(agg))]
+        html = display_df.to_html(index=True, escape=False, max_cols=None, max_rows=None)
+    return '<div class="peec-scroll" style="max-height:none;overflow:visible;">' + html + "</div>"
+
+
+def _url_report(filters, approximate=False):
+    """
+    (agg, table HTML) for a filter state, served from _u_memo when the same
+    state was computed recently on this df_detail. agg is None if no rows match.
+    """
+    key = _u_memo.key([df_detail], casefold=("prompt_query", "title_query", "url_query"),
+                      approximate=approximate, **filters)
+    hit = _u_memo.get(key)
+    if hit is None:
+        agg = build_url_report(df_detail, approximate=approximate, **filters)
+        hit = (agg, None if agg is None else _url_html(agg))
+        _u_memo.put(key, hit)
+    return hit
+
+
+def _show_url_report(agg, html):
+    """Render stats + table (callable from the background exact run)."""
+    label = agg.attrs.get("approx")
+    u_stats.value = (
+        f'<div>'
+        f'<span class="peec-stat">\U0001f517 URLs: <b>{len(agg):,}</b></span>'
+        f'<span class="peec-stat">\U0001f310 Domains: <b>{agg["Domain"].nunique():,}</b></span>'
+        f'<span class="peec-stat">\U0001f522 Total Citations: <b>{agg["Total Citations"].sum():,.0f}</b></span>'
+        f'<span class="peec-stat">\U0001f4cd Avg Citation Pos: <b>{agg["Avg Citation Pos"].mean():.1f}</b></span>'
+        f'</div>'
+        + (f'<div class="peec-sub">{label} Download CSV is off until <b>Compute exact</b> '
+           f'finishes (the CSV holds the last exact report).</div>'
+           if label else "")
+    )
+    u_dl_btn.disabled = bool(label)  # the CSV holds the last exact report, not this one
+    u_table.clear_output(wait=True)
+    u_table.append_display_data(HTML(html))
+
 
+def _run_url_report(exact=False):
+    _u_exact_run["token"] = None  # a filter change supersedes a pending exact run
+    u_stats.value = ""
     with u_table:
         u_table.clear_output(wait=True)
-        display(HTML(
-            '<div class="peec-scroll" style="max-height:none;overflow:visible;">'
-            + display_df.to_html(index=True, escape=False, max_cols=None, max_rows=None)
-            + "</div>"
-        ))
+
+    if df_detail is None:
+        with u_table:
+            u_table.clear_output(wait=True)
+            display(HTML("\u26a0\ufe0f Pull data first."))
+        return
+
+    approximate = u_approx.value and not exact
+    agg, html = _url_report(_url_filters(), approximate)
+    if agg is None:
+        u_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
+        return
+    # Estimates never reach df_url_result / the CSV; a memo hit already
+    # published is not written again
+    if not approximate and agg is not _u_published["agg"]:
+        _publish_url_report(agg)
+    _show_url_report(agg, html)
+
+
+def _on_u_exact(b):
+    """Run the exact report for the current filters on a background thread."""
+    if df_detail is None:
+        return
+    token = _u_exact_run["token"] = object()
+    filters = _url_filters()
+    u_stats.value = '<div class="peec-stat">\u23f3 Computing exact report...</div>'
+
+    def work():
+        try:
+            agg, html = _url_report(filters)
+        except Exception as e:
+            if _u_exact_run["token"] is token:
+                u_stats.value = f'<div class="peec-stat">\u274c {type(e).__name__}: {e}</div>'
+            return
+        if _u_exact_run["token"] is not token:  # filters changed meanwhile
+            return
+        if agg is None:
+            u_stats.value = '<div class="peec-stat">\u26a0\ufe0f No rows match filters</div>'
+            return
+        if agg is not _u_published["agg"]:
+            _publish_url_report(agg)
+        _show_url_report(agg, html)
+
+    threading.Thread(target=work, name="url_exact", daemon=True).start()
 
 
 def _init_url_filters():
@@ -179,24 +296,27 @@ def _on_u_dl(b):
 
 
 u_dl_btn.on_click(_on_u_dl)
+u_exact_btn.on_click(_on_u_exact)
 
 _init_url_filters()
 
-display(
-    widgets.HTML(
-        '<div class="peec-header">\U0001f517 URL / Page-Level Report</div>'
-        '<div class="peec-sub">One row per URL \u2014 citations summed across models (filter to drill down)</div>'
-    ),
-    widgets.HTML('<div class="peec-section">Filters</div>'),
-    widgets.HBox([u_page_type, u_domain_type, u_model], layout=widgets.Layout(margin="0 0 4px 0")),
-    widgets.HBox([u_prompt_search, u_title_search], layout=widgets.Layout(margin="0 0 4px 0")),
-    u_url_search,
-    u_dl_btn,
-    u_stats,
-    u_table,
-)
-
-_run_url_report()
+# Batch (headless) runs call build_url_report() / _publish_url_report() directly
+if not HEADLESS:
+    display(
+        widgets.HTML(
+            '<div class="peec-header">\U0001f517 URL / Page-Level Report</div>'
+            '<div class="peec-sub">One row per URL \u2014 citations summed across models (filter to drill down)</div>'
+        ),
+        widgets.HTML('<div class="peec-section">Filters</div>'),
+        widgets.HBox([u_page_type, u_domain_type, u_model], layout=widgets.Layout(margin="0 0 4px 0")),
+        widgets.HBox([u_prompt_search, u_title_search], layout=widgets.Layout(margin="0 0 4px 0")),
+        u_url_search,
+        widgets.HBox([u_dl_btn, u_exact_btn, u_approx]),
+        u_stats,
+        u_table,
+        profiling.panel("cell_06"),
+    )
+    _run_url_report(exact=True)
 
 # Attach filter observers AFTER initial run to prevent double-trigger
 u_page_type.observe(_on_u_filter, names="value")
@@ -205,3 +325,4 @@ u_model.observe(_on_u_filter, names="value")
 u_prompt_search.observe(_on_u_filter, names="value")
 u_title_search.observe(_on_u_filter, names="value")
 u_url_search.observe(_on_u_filter, names="value")
+u_approx.observe(_on_u_filter, names="value")
@@ -1,23 +1,26 @@
 # cell_07_awin_transactions.py — Awin transaction fetch & processing
 # Uses session dates and advertiser ID. Produces: df_awin_tx
 
+import json
 import os
-import re
+import threading
 import time
 import __main__
 from datetime import datetime, timedelta
-from urllib.parse import urlparse
 
-import requests
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import hostnames
+import http_telemetry
+import journal
+import pipeline
+import profiling
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["ADVERTISER_ID", "SESSION_START_DATE", "SESSION_END_DATE",
-           "_scroll_table", "download_file", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["ADVERTISER_ID", "SESSION_START_DATE", "SESSION_END_DATE",
+                  "_scroll_table", "download_file", "PATHS"], "cell_07")
 
 if not os.environ.get("AWAPI"):
     raise RuntimeError("AWAPI not set in environment. Run the Session Config cell first.")
@@ -28,46 +31,143 @@ SESSION_END_DATE = __main__.SESSION_END_DATE
 _scroll_table = __main__._scroll_table
 download_file = __main__.download_file
 PATHS = __main__.PATHS
+HEADLESS = getattr(__main__, "HEADLESS", False)
+
+# AWIN_BASE_URL overrides the API host (e.g. a local stub server for load tests)
+AWIN_BASE = os.environ.get("AWIN_BASE_URL", "https://api.awin.com").rstrip("/")
 
 AWIN_TX_CSV = str(PATHS["output"] / "awin_transactions.csv")
 df_awin_tx = None
 
 
+# ── Adaptive chunk windows ───────────────────────────────────────
+# Awin allows at most 31 days per request. A window that errors (5xx,
+# timeout, dropped connection) or passes any of the limits below is split
+# in half and the halves fetched instead; a window well under every limit
+# lets the next one double again. The window size each advertiser settles
+# on is saved in PATHS["logs"]/awin_windows.json and used as the starting
+# size next time.
+AWIN_MAX_DAYS = 31
+AWIN_CHUNK_MAX_ROWS = 100_000
+AWIN_CHUNK_MAX_MB = 100
+AWIN_CHUNK_MAX_S = 120
+AWIN_READ_TIMEOUT_S = 120
+AWIN_WINDOWS_FILE = PATHS["logs"] / "awin_windows.json"
+_windows_lock = threading.Lock()  # fan-out pulls share the file
+
+
+class _ChunkTooLarge(Exception):
+    pass
+
+
+def _window_days(advertiser_id):
+    """Learned window size for an advertiser (AWIN_MAX_DAYS if none)."""
+    try:
+        with open(AWIN_WINDOWS_FILE, encoding="utf-8") as f:
+            days = json.load(f).get(str(advertiser_id), AWIN_MAX_DAYS)
+    except (OSError, ValueError):
+        days = AWIN_MAX_DAYS
+    return max(1, min(int(days), AWIN_MAX_DAYS))
+
+
+def _save_window_days(advertiser_id, days):
+    with _windows_lock:
+        try:
+            with open(AWIN_WINDOWS_FILE, encoding="utf-8") as f:
+                learned = json.load(f)
+        except (OSError, ValueError):
+            learned = {}
+        if learned.get(str(advertiser_id)) == days:
+            return
+        learned[str(advertiser_id)] = days
+        try:
+            with open(AWIN_WINDOWS_FILE, "w", encoding="utf-8") as f:
+                json.dump(learned, f, indent=2)
+        except OSError:
+            pass
+
+
+def _over_limit(rows, nbytes, seconds, share=1.0):
+    """Name of the first limit passed at share x its value, else None."""
+    if rows > AWIN_CHUNK_MAX_ROWS * share:
+        return f"{rows:,} rows"
+    if nbytes > AWIN_CHUNK_MAX_MB * 2**20 * share:
+        return f"{nbytes / 2**20:.0f} MB"
+    if seconds > AWIN_CHUNK_MAX_S * share:
+        return f"{seconds:.0f} s"
+    return None
+
+
+def _splittable(err):
+    """Errors a smaller window may avoid: 5xx, timeouts, dropped streams."""
+    status = getattr(err, "status", None)
+    return status is None or status >= 500
+
+
 # ── Awin transaction API ────────────────────────────────────────
-def fetch_awin_transactions(advertiser_id, start_date, end_date,
-                            date_type="transaction", timezone="UTC",
-                            status=None, publisher_id=None):
+def iter_awin_transactions(advertiser_id, start_date, end_date,
+                           date_type="transaction", timezone="UTC",
+                           status=None, publisher_id=None, base_url=None,
+                           resume=True):
     """
-    Fetch transactions from Awin API.
-    Handles the 31-day max window by chunking automatically.
+    Yield transactions from the Awin API as each chunk's body is parsed
+    (see http_telemetry.stream_rows), so the raw payload is never held
+    whole. Chunks the range into windows of at most 31 days, sized
+    adaptively per advertiser (see AWIN_CHUNK_MAX_*). base_url defaults
+    to AWIN_BASE.
+
+    Each completed chunk is checkpointed in the run journal; if the fetch
+    fails part-way, calling again with the same arguments replays the
+    completed chunks from disk and resumes at the failed one
+    (resume=False always fetches everything). Replayed chunks keep the
+    boundaries they were fetched with, whatever the window size is now.
     """
     awin_key = os.environ.get("AWAPI")
     if not awin_key:
         raise ValueError("No AWAPI key found in environment.")
-
-    all_transactions = []
-    chunk_start = datetime.strptime(start_date, "%Y-%m-%d")
-    chunk_end_limit = datetime.strptime(end_date, "%Y-%m-%d")
-
+    base_url = (base_url or AWIN_BASE).rstrip("/")
+    url = f"{base_url}/advertisers/{advertiser_id}/transactions/"
+    endpoint = http_telemetry.endpoint_label(url, "awin")
+    jr = journal.Journal("awin_tx", {
+        "advertiser_id": advertiser_id, "start": start_date, "end": end_date,
+        "date_type": date_type, "timezone": timezone, "status": status,
+        "publisher_id": publisher_id, "base_url": base_url,
+    }, enabled=resume)
+
+    days = _window_days(advertiser_id)
+    # End day of each completed chunk by start day ("chunk_<start>_<end>")
+    done_ends = {}
+    for stem in jr.completed():
+        parts = stem.split("_")
+        if len(parts) == 3 and parts[0] == "chunk":
+            done_ends[parts[1]] = datetime.strptime(parts[2], "%Y-%m-%d")
+    cursor = datetime.strptime(start_date, "%Y-%m-%d")
+    last_day = datetime.strptime(end_date, "%Y-%m-%d")
+    split = []      # halves of split windows, next one last
+    seen = set()    # IDs already yielded by windows that were then split
     chunk_num = 0
-    while chunk_start < chunk_end_limit:
-        chunk_end = min(chunk_start + timedelta(days=30), chunk_end_limit)
+    requested = False
+    while split or cursor <= last_day:
+        if split:
+            win_start, win_end = split.pop()
+        else:
+            win_start = cursor
+            win_end = done_ends.get(f"{cursor:%Y-%m-%d}") or min(
+                cursor + timedelta(days=days - 1), last_day)
+            cursor = win_end + timedelta(days=1)
+        span = (win_end - win_start).days + 1
         chunk_num += 1
 
-        sd_str = chunk_start.strftime("%Y-%m-%dT00:00:00")
-        ed_str = chunk_end.strftime("%Y-%m-%dT23:59:59")
-
         print(
             f"  \U0001f4e6 Chunk {chunk_num}: "
-            f"{chunk_start.strftime('%Y-%m-%d')} \u2192 {chunk_end.strftime('%Y-%m-%d')}",
+            f"{win_start.strftime('%Y-%m-%d')} \u2192 {win_end.strftime('%Y-%m-%d')}",
             end="",
         )
 
-        url = f"https://api.awin.com/advertisers/{advertiser_id}/transactions/"
         params = {
             "accessToken": awin_key,
-            "startDate": sd_str,
-            "endDate": ed_str,
+            "startDate": win_start.strftime("%Y-%m-%dT00:00:00"),
+            "endDate": win_end.strftime("%Y-%m-%dT23:59:59"),
             "dateType": date_type,
             "timezone": timezone,
         }
@@ -76,50 +176,123 @@ def fetch_awin_transactions(advertiser_id, start_date, end_date,
         if publisher_id:
             params["publisherId"] = str(publisher_id)
 
-        resp = requests.get(url, params=params)
-        if resp.status_code != 200:
-            print(f" \u274c Error {resp.status_code}")
-            raise Exception(f"Awin API error {resp.status_code}: {resp.text[:300]}")
-
-        data = resp.json()
-        print(f" \u2192 {len(data)} transactions")
-        all_transactions.extend(data)
-
-        chunk_start = chunk_end + timedelta(days=1)
-        if chunk_start < chunk_end_limit:
-            time.sleep(0.5)  # rate limit courtesy
-
-    return all_transactions
-
-
+        unit = f"chunk_{win_start:%Y-%m-%d}_{win_end:%Y-%m-%d}"
+        resumed = jr.done(unit)
+        if requested and not resumed:
+            # rate limit courtesy
+            http_telemetry.pace(0.5, endpoint)
+        requested = requested or not resumed
+        progress = {}
+        rows = jr.replay_or_record(unit, lambda: http_telemetry.stream_rows(
+            "GET", url, prefix="item", api="awin", error_prefix="Awin API error",
+            progress=progress, params=params, timeout=(30, AWIN_READ_TIMEOUT_S),
+        ))
+
+        # Streamed: stage time includes the consumer's per-row work
+        with profiling.stage("awin_api", cell="cell_07", chunk=chunk_num, days=span,
+                             resumed=resumed) as rec:
+            n = 0
+            ids = []
+            t0 = time.perf_counter()
+            try:
+                for tx in rows:
+                    n += 1
+                    if n % 1000 == 0 and span > 1 and not resumed:
+                        over = _over_limit(n, progress["tell"](), time.perf_counter() - t0)
+                        if over:
+                            raise _ChunkTooLarge(over)
+                    if seen and tx.get("id") in seen:
+                        continue
+                    ids.append(tx.get("id"))
+                    yield tx
+            except Exception as e:
+                rows.close()
+                if resumed or span == 1 or not _splittable(e):
+                    print(" \u274c Error")
+                    raise
+                # Re-fetch as two halves, skipping the rows already yielded
+                seen.update(ids)
+                half = span // 2
+                split += [(win_start + timedelta(days=half), win_end),
+                          (win_start, win_start + timedelta(days=half - 1))]
+                days = min(days, half)
+                _save_window_days(advertiser_id, days)
+                rec["rows"] = n
+                rec["split"] = str(e)[:100]
+                print(f" \u2702\ufe0f {str(e)[:60]} \u2014 splitting into {half}+{span - half} days")
+                continue
+            rec["rows"] = n
+        print(f" \u2192 {n} transactions" + (" (from journal)" if resumed else ""))
+
+        if not resumed:
+            nbytes = progress["tell"]() if "tell" in progress else 0
+            elapsed = time.perf_counter() - t0
+            if span > 1 and _over_limit(n, nbytes, elapsed, share=0.5):
+                days = min(days, max(1, span // 2))
+            elif span >= days and not _over_limit(n, nbytes, elapsed, share=0.25):
+                days = min(AWIN_MAX_DAYS, days * 2)
+            _save_window_days(advertiser_id, days)
+
+    jr.finish()
+
+
+def fetch_awin_transactions(advertiser_id, start_date, end_date, **kwargs):
+    """List form of iter_awin_transactions() (same arguments)."""
+    return list(iter_awin_transactions(advertiser_id, start_date, end_date, **kwargs))
+
+
+# (column, API field, default) for the flat fields; the nested amounts are
+# unpacked separately
+_TX_FIELDS = [
+    ("Transaction ID", "id", None),
+    ("Advertiser ID", "advertiserId", None),
+    ("Advertiser Name", "advertiserName", None),
+    ("Publisher ID", "publisherId", None),
+    ("Publisher Name", "siteName", ""),
+    ("Publisher URL", "publisherUrl", ""),
+    ("Click Ref", "clickRef", ""),
+    ("Order Ref", "orderRef", ""),
+    ("Transaction Date", "transactionDate", ""),
+    ("Validation Date", "validationDate", ""),
+    ("Type", "type", ""),
+    ("Status", "status", ""),
+    ("Click Device", "clickDevice", ""),
+    ("Transaction Device", "transactionDevice", ""),
+    ("Lapse Time (s)", "lapseTime", 0),
+]
+_TX_COLUMNS = [
+    "Transaction ID", "Advertiser ID", "Advertiser Name", "Publisher ID",
+    "Publisher Name", "Publisher URL", "Click Ref", "Order Ref",
+    "Transaction Date", "Validation Date", "Type", "Status",
+    "Sale Amount", "Currency", "Commission Amount",
+    "Click Device", "Transaction Device", "Lapse Time (s)",
+]
+
+
+@profiling.instrument("awin_process", cell="cell_07")
 def process_awin_transactions(raw):
-    if not raw:
-        return pd.DataFrame()
-
-    rows = []
+    """
+    Build the transactions frame from a list or iterator of API rows.
+    Rows are flattened straight into per-column lists in one pass (no
+    per-row dicts); dates become datetime columns.
+    """
+    cols = {c: [] for c, _, _ in _TX_FIELDS}
+    flat = [(cols[c].append, key, default) for c, key, default in _TX_FIELDS]
+    sale, currency, commission = [], [], []
     for tx in raw:
-        rows.append({
-            "Transaction ID": tx.get("id"),
-            "Advertiser ID": tx.get("advertiserId"),
-            "Advertiser Name": tx.get("advertiserName"),
-            "Publisher ID": tx.get("publisherId"),
-            "Publisher Name": tx.get("siteName", ""),
-            "Publisher URL": tx.get("publisherUrl", ""),
-            "Click Ref": tx.get("clickRef", ""),
-            "Order Ref": tx.get("orderRef", ""),
-            "Transaction Date": tx.get("transactionDate", ""),
-            "Validation Date": tx.get("validationDate", ""),
-            "Type": tx.get("type", ""),
-            "Status": tx.get("status", ""),
-            "Sale Amount": tx.get("saleAmount", {}).get("amount", 0),
-            "Currency": tx.get("saleAmount", {}).get("currency", ""),
-            "Commission Amount": tx.get("commissionAmount", {}).get("amount", 0),
-            "Click Device": tx.get("clickDevice", ""),
-            "Transaction Device": tx.get("transactionDevice", ""),
-            "Lapse Time (s)": tx.get("lapseTime", 0),
-        })
-
-    df = pd.DataFrame(rows)
+        for append, key, default in flat:
+            append(tx.get(key, default))
+        s = tx.get("saleAmount") or {}
+        sale.append(s.get("amount", 0))
+        currency.append(s.get("currency", ""))
+        commission.append((tx.get("commissionAmount") or {}).get("amount", 0))
+
+    if not sale:
+        return pd.DataFrame()
+    cols["Sale Amount"] = sale
+    cols["Currency"] = currency
+    cols["Commission Amount"] = commission
+    df = pd.DataFrame(cols, columns=_TX_COLUMNS)
 
     # Numeric types
     for c in ["Sale Amount", "Commission Amount", "Lapse Time (s)"]:
@@ -127,23 +300,27 @@ def process_awin_transactions(raw):
     df["Sale Amount"] = df["Sale Amount"].round(2)
     df["Commission Amount"] = df["Commission Amount"].round(2)
 
-    # Extract publisher domain from URL
-    def _pub_domain(url):
-        if not url:
-            return ""
-        if not str(url).startswith("http"):
-            url = "https://" + str(url)
-        try:
-            host = urlparse(url).netloc.lower()
-            return re.sub(r"^www\.", "", host)
-        except Exception:
-            return ""
+    # Real datetimes (missing / unparseable -> NaT, sorted last)
+    for c in ["Transaction Date", "Validation Date"]:
+        df[c] = pd.to_datetime(df[c], errors="coerce")
 
-    df["Publisher Domain"] = df["Publisher URL"].apply(_pub_domain)
-    df = df.sort_values("Transaction Date", ascending=False).reset_index(drop=True)
+    # Each distinct URL is parsed once (and reused across sessions)
+    df["Publisher Domain"] = hostnames.normalise(df["Publisher URL"], "publisher")
+    df = df.sort_values("Transaction Date", ascending=False, kind="mergesort").reset_index(drop=True)
     return df
 
 
+def _publish_awin_tx(df):
+    """Store df_awin_tx on __main__ and save the CSV."""
+    global df_awin_tx
+    df_awin_tx = df
+    __main__.df_awin_tx = df_awin_tx
+    pipeline.built("cell_07")
+    hostnames.save()
+    with profiling.stage("awin_to_csv", cell="cell_07", rows=len(df)):
+        df.to_csv(AWIN_TX_CSV, index=False)
+
+
 # ── Widgets ──────────────────────────────────────────────────────
 tx_header = widgets.HTML(
     '<div class="peec-header">\U0001f4ca Awin Transaction Report</div>'
@@ -171,7 +348,6 @@ tx_status_msg = widgets.HTML("")
 
 
 def on_tx_pull(b):
-    global df_awin_tx
     tx_stats.value = ""
     tx_status_msg.value = "\u23f3 Fetching transactions..."
     sd = SESSION_START_DATE
@@ -180,16 +356,13 @@ def on_tx_pull(b):
     status = None if tx_status.value == "All" else tx_status.value
 
     try:
-        raw = fetch_awin_transactions(adv, sd, ed, status=status)
-        df = process_awin_transactions(raw)
+        df = process_awin_transactions(iter_awin_transactions(adv, sd, ed, status=status))
 
         if df.empty:
             tx_status_msg.value = "\u26a0\ufe0f No transactions returned."
             return
 
-        df_awin_tx = df
-        __main__.df_awin_tx = df_awin_tx
-        df.to_csv(AWIN_TX_CSV, index=False)
+        _publish_awin_tx(df)
 
         total_rev = df["Sale Amount"].sum()
         total_comm = df["Commission Amount"].sum()
@@ -223,13 +396,16 @@ def on_tx_dl(b):
 tx_pull_btn.on_click(on_tx_pull)
 tx_dl_btn.on_click(on_tx_dl)
 
-display(
-    tx_header,
-    tx_status,
-    widgets.HBox(
-        [tx_pull_btn, tx_dl_btn],
-        layout=widgets.Layout(margin="8px 0 10px 0"),
-    ),
-    tx_stats,
-    tx_status_msg,
-)
+if not HEADLESS:
+    display(
+        tx_header,
+        tx_status,
+        widgets.HBox(
+            [tx_pull_btn, tx_dl_btn],
+            layout=widgets.Layout(margin="8px 0 10px 0"),
+        ),
+        tx_stats,
+        tx_status_msg,
+        profiling.panel("cell_07"),
+        http_telemetry.panel("awin"),
+    )
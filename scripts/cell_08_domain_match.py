@@ -7,11 +7,11 @@ import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import pipeline
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["df_domain_result", "df_awin_tx", "_normalise_host",
-           "_scroll_table", "download_file", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["df_domain_result", "df_awin_tx", "_normalise_host", "_scroll_table",
+                  "download_file", "PATHS"], "cell_08")
 
 df_domain_result = __main__.df_domain_result
 df_awin_tx = __main__.df_awin_tx
@@ -137,6 +137,7 @@ def run_match(b=None):
         df_m = df_m.sort_values("Peec Citations", ascending=False).reset_index(drop=True)
         df_matched = df_m
         __main__.df_matched = df_matched
+        pipeline.built("cell_08")
         df_m.to_csv(MATCH_CSV, index=False)
 
         peec_matched = df_m["Peec Domain"].nunique()
@@ -1,21 +1,26 @@
 # cell_09_enriched_report.py — Domain Match + Enriched Report (consolidated)
 # Matches PEEC domains to Awin publisher domains, pulls publisher report
 # for accurate names, adds AI model data, and applies exclude filter.
-# Produces: df_enriched
+# Rebuilds are incremental: only stages whose inputs changed are recomputed.
+# Produces: df_enriched, awin_host_keys
 
 import os
 import __main__
-import requests
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import hostnames
+import http_telemetry
+import pipeline
+import profiling
+import report_memo
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["df_domain_result", "df_awin_tx", "df_detail",
-           "_normalise_host", "_scroll_table", "download_file",
-           "PATHS", "ADVERTISER_ID", "SESSION_START_DATE", "SESSION_END_DATE"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["df_domain_result", "df_awin_tx", "df_detail", "domain_model_mask",
+                  "_render_model_codes", "_normalise_host", "_frame_fingerprint",
+                  "_scroll_table", "download_file", "PATHS", "ADVERTISER_ID",
+                  "SESSION_START_DATE", "SESSION_END_DATE"], "cell_09")
 
 if not os.environ.get("AWAPI"):
     raise RuntimeError("AWAPI not set in environment. Run the Session Config cell first.")
@@ -24,24 +29,30 @@ df_domain_result = __main__.df_domain_result
 df_awin_tx = __main__.df_awin_tx
 df_detail = __main__.df_detail
 _normalise_host = __main__._normalise_host
+_frame_fingerprint = __main__._frame_fingerprint
 _scroll_table = __main__._scroll_table
 download_file = __main__.download_file
 PATHS = __main__.PATHS
 ADVERTISER_ID = __main__.ADVERTISER_ID
 SESSION_START_DATE = __main__.SESSION_START_DATE
 SESSION_END_DATE = __main__.SESSION_END_DATE
+HEADLESS = getattr(__main__, "HEADLESS", False)
+
+AWIN_BASE = os.environ.get("AWIN_BASE_URL", "https://api.awin.com").rstrip("/")
 
 ENRICHED_CSV = str(PATHS["output"] / "peec_awin_enriched.csv")
 PUB_REPORT_CSV = str(PATHS["output"] / "awin_publisher_report.csv")
 df_enriched = None
 _enriched_cache = None  # holds pre-filter merged DataFrame after build phase
+_enrich_memo = report_memo.memo("enriched_report")  # recent filter results per build
 
 
 # ── Awin publisher report (for publisher names) ──────────────────
-def _fetch_publisher_report(advertiser_id, start_date, end_date):
-    """Fetch publisher performance report from Awin API."""
+def _fetch_publisher_report(advertiser_id, start_date, end_date, base_url=None):
+    """Fetch publisher performance report from Awin API (base_url defaults to AWIN_BASE)."""
     awin_key = os.environ.get("AWAPI")
-    url = f"https://api.awin.com/advertisers/{advertiser_id}/reports/publisher"
+    base_url = (base_url or AWIN_BASE).rstrip("/")
+    url = f"{base_url}/advertisers/{advertiser_id}/reports/publisher"
     params = {
         "accessToken": awin_key,
         "startDate": start_date,
@@ -49,10 +60,10 @@ def _fetch_publisher_report(advertiser_id, start_date, end_date):
         "dateType": "transaction",
         "timezone": "UTC",
     }
-    resp = requests.get(url, params=params)
+    resp, data = http_telemetry.request("GET", url, api="awin", params=params)
     if resp.status_code != 200:
         raise Exception(f"Awin publisher report error {resp.status_code}: {resp.text[:300]}")
-    return resp.json()
+    return data
 
 
 def _process_publisher_report(raw):
@@ -113,19 +124,6 @@ def _row_excluded(row, exclude_keywords):
     return any(kw in peec_d or kw in awin_d for kw in exclude_keywords)
 
 
-def _build_model_lookup(detail_df):
-    """
-    Build a dict: domain -> "cla, goo, ope, per, ..."
-    Each model ID is truncated to 3 characters, de-duped, and sorted.
-    """
-    if detail_df is None or detail_df.empty:
-        return {}
-    tmp = detail_df.dropna(subset=["Model"])[["Domain", "Model"]].copy()
-    tmp["_code"] = tmp["Model"].astype(str).str[:3]
-    tmp = tmp[["Domain", "_code"]].drop_duplicates().sort_values(["Domain", "_code"])
-    return tmp.groupby("Domain")["_code"].agg(", ".join).to_dict()
-
-
 # ── Widgets ──────────────────────────────────────────────────────
 enrich_table = widgets.Output(layout=widgets.Layout(
     max_height='600px', overflow_y='auto', overflow_x='auto',
@@ -184,26 +182,21 @@ enrich_sort_dir = widgets.Dropdown(
 )
 
 
-def run_enrich(b=None):
-    """Build phase: aggregate, match, fetch publisher names, cache result."""
-    global _enriched_cache
-    enrich_stats.value = ""
-    with enrich_table:
-        enrich_table.clear_output(wait=True)
-    enrich_status_msg.value = ""
+# ── Dependency-tracked build pipeline ────────────────────────────
+# Each stage caches its output together with the fingerprint(s) of the
+# inputs it was built from, so a rebuild only redoes stages whose inputs
+# changed. State lives on __main__ so it survives re-running this cell.
+_AWIN_TX_HASH_COLS = ["Transaction ID", "Publisher Domain", "Publisher ID",
+                      "Publisher Name", "Sale Amount", "Commission Amount"]
 
-    if df_domain_result is None or df_domain_result.empty:
-        enrich_status_msg.value = "\u26a0\ufe0f Run the Domain Report first."
-        return
-    if df_awin_tx is None or df_awin_tx.empty:
-        enrich_status_msg.value = "\u26a0\ufe0f Run the Awin Transaction Report first."
-        return
+_enrich_state = getattr(__main__, "_enrich_state", None) or {}
+__main__._enrich_state = _enrich_state
 
-    # ── Step 1: Aggregate Awin transactions by publisher domain ──
-    enrich_status_msg.value = "\u23f3 Building Awin publisher domain summary..."
 
+def _aggregate_awin_domains(tx):
+    """Aggregate Awin transactions to one row per (publisher domain, publisher ID)."""
     awin_domains = (
-        df_awin_tx[df_awin_tx["Publisher Domain"] != ""]
+        tx[tx["Publisher Domain"] != ""]
         .groupby(["Publisher Domain", "Publisher ID"], as_index=False)
         .agg(
             Publisher_Name=("Publisher Name", "first"),
@@ -222,17 +215,57 @@ def run_enrich(b=None):
         awin_domains["Awin Revenue"]
         / awin_domains["Awin Transactions"].replace(0, pd.NA)
     ).round(2)
+    awin_domains["_awin_host"] = hostnames.normalise(awin_domains["Awin Domain"], "host")
+    return awin_domains
 
-    # ── Step 2: Normalise hostnames and match ────────────────────
-    awin_domains["_awin_host"] = awin_domains["Awin Domain"].apply(_normalise_host)
-    peec = df_domain_result.copy()
-    peec["_peec_host"] = peec["Domain"].apply(_normalise_host)
 
-    enrich_status_msg.value = (
-        f"\u23f3 Matching {len(peec)} Peec domains against "
-        f"{len(awin_domains)} Awin publisher domains..."
-    )
+def _awin_domain_digests(tx):
+    """
+    Per publisher domain digest of its transactions (order-sensitive, so a
+    re-ordering that changes the "first" publisher name is also detected).
+    """
+    tx = tx[tx["Publisher Domain"] != ""]
+    if tx.empty:
+        return pd.Series(dtype="uint64")
+    row_hash = pd.util.hash_pandas_object(tx[_AWIN_TX_HASH_COLS], index=False).values
+    pos = tx.groupby("Publisher Domain").cumcount().to_numpy(dtype="uint64") + 1
+    weighted = pd.Series(row_hash * pos, index=tx["Publisher Domain"].values)
+    return weighted.groupby(level=0).sum()
+
+
+@profiling.instrument("enrich_awin_domains", cell="cell_09", rows=lambda r: len(r[0]))
+def _stage_awin_domains(tx):
+    """Stage 1: Awin domain summary, incrementally updated per changed domain."""
+    fp = _frame_fingerprint(tx)
+    cached = _enrich_state.get("awin_domains")
+    if cached is not None and cached["fp"] == fp:
+        return cached["df"], set()
+
+    digests = _awin_domain_digests(tx)
+    if cached is None:
+        df = _aggregate_awin_domains(tx)
+        changed = set(df["Awin Domain"])
+    else:
+        prev = cached["digests"]
+        both = digests.index.intersection(prev.index)
+        changed = (
+            set(digests.index.difference(prev.index))
+            | set(prev.index.difference(digests.index))
+            | set(both[digests[both].values != prev[both].values])
+        )
+        keep = cached["df"][~cached["df"]["Awin Domain"].isin(changed)]
+        fresh = _aggregate_awin_domains(tx[tx["Publisher Domain"].isin(changed)])
+        df = (
+            pd.concat([keep, fresh], ignore_index=True)
+            .sort_values(["Awin Domain", "Publisher ID"])
+            .reset_index(drop=True)
+        )
+    _enrich_state["awin_domains"] = {"fp": fp, "df": df, "digests": digests}
+    return df, changed
 
+
+def _match_domains(peec, awin_domains):
+    """Exact match of normalised Peec hosts against normalised Awin hosts."""
     awin_lookup = {}
     for _, a in awin_domains.iterrows():
         host = a["_awin_host"]
@@ -240,7 +273,7 @@ def run_enrich(b=None):
             awin_lookup.setdefault(host, []).append(a)
 
     matches = []
-    for _, p in peec.iterrows():
+    for pos, p in peec.iterrows():
         ph = p["_peec_host"]
         if not ph or len(ph) < 3:
             continue
@@ -260,51 +293,109 @@ def run_enrich(b=None):
                     "Awin Revenue": a["Awin Revenue"],
                     "Awin Commission": a["Awin Commission"],
                     "Awin AOV": a["Awin AOV"],
+                    "_peec_pos": pos,
+                    "_awin_host": a["_awin_host"],
                 })
+    return pd.DataFrame(matches)
+
+
+@profiling.instrument("enrich_match", cell="cell_09", rows=lambda r: len(r[1]))
+def _stage_match(domain_result, awin_domains, changed_awin_domains):
+    """
+    Stage 2: Peec <> Awin match. When only some Awin domains changed, only
+    pairs touching those domains' hosts are recomputed.
+    """
+    peec_fp = _frame_fingerprint(domain_result)
+    awin_fp = _enrich_state["awin_domains"]["fp"]
+    cached = _enrich_state.get("match")
+    if cached is not None and cached["peec_fp"] == peec_fp and cached["awin_fp"] == awin_fp:
+        return cached["peec"], cached["df"]
+
+    if cached is not None and cached["peec_fp"] == peec_fp:
+        peec = cached["peec"]
+        changed_hosts = {_normalise_host(d) for d in changed_awin_domains}
+        keep = cached["df"]
+        if not keep.empty:
+            keep = keep[~keep["_awin_host"].isin(changed_hosts)]
+        fresh = _match_domains(
+            peec[peec["_peec_host"].isin(changed_hosts)],
+            awin_domains[awin_domains["_awin_host"].isin(changed_hosts)],
+        )
+        df = pd.concat([keep, fresh], ignore_index=True)
+        if not df.empty:
+            df = df.sort_values(
+                ["_peec_pos", "Awin Domain", "Publisher ID"], kind="mergesort",
+            ).reset_index(drop=True)
+    else:
+        peec = domain_result.copy()
+        peec["_peec_host"] = hostnames.normalise(peec["Domain"], "host")
+        df = _match_domains(peec, awin_domains)
+
+    _enrich_state["match"] = {"peec_fp": peec_fp, "awin_fp": awin_fp, "peec": peec, "df": df}
+    return peec, df
+
+
+@profiling.instrument("enrich_publisher_names", cell="cell_09")
+def _stage_publisher_names(advertiser_id, start_date, end_date):
+    """
+    Stage 3: publisher ID -> name lookup from the Awin publisher report.
+    advertiser_id may be a tuple (fan-out reports across advertisers), in
+    which case the reports are combined.
+    """
+    key = (advertiser_id, start_date, end_date)
+    cached = _enrich_state.get("pub_names")
+    if cached is not None and cached["key"] == key:
+        return cached["lookup"]
+
+    if isinstance(advertiser_id, (list, tuple)):
+        parts = [_process_publisher_report(_fetch_publisher_report(a, start_date, end_date))
+                 .assign(**{"Advertiser ID": a}) for a in advertiser_id]
+        df_pub = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    else:
+        df_pub = _process_publisher_report(_fetch_publisher_report(advertiser_id, start_date, end_date))
+    lookup = {}
+    if not df_pub.empty:
+        df_pub.to_csv(PUB_REPORT_CSV, index=False)
+        lookup = dict(zip(df_pub["Publisher ID"].astype(int), df_pub["Publisher Name"]))
+    _enrich_state["pub_names"] = {"key": key, "lookup": lookup}
+    return lookup
 
-    if not matches:
-        peec_hosts = sorted(peec["_peec_host"].unique())[:30]
-        awin_hosts = sorted(awin_domains["_awin_host"].unique())[:30]
-        enrich_status_msg.value = "\u26a0\ufe0f No domain matches found."
-        _enriched_cache = None
-        with enrich_table:
-            enrich_table.clear_output(wait=True)
-            display(HTML(
-                "<div><b>Peec normalised hosts (first 30):</b><br>"
-                + "<br>".join(f"&nbsp;&nbsp;{s}" for s in peec_hosts)
-                + "<br><br><b>Awin publisher normalised hosts (first 30):</b><br>"
-                + "<br>".join(f"&nbsp;&nbsp;{s}" for s in awin_hosts)
-                + "<br><br>Compare the lists above for near-misses.</div>"
-            ))
-        return
 
-    merged = pd.DataFrame(matches)
+def build_enriched(df_domain_result, df_awin_tx, advertiser_id, start_date, end_date,
+                   status=print):
+    """
+    Build phase: aggregate Awin domains, match against Peec domains, backfill
+    publisher names. Only stages whose inputs changed since the previous
+    build are recomputed. Returns (merged, peec, awin_domains); merged is
+    None when nothing matched.
+    """
+    # ── Step 1: Aggregate Awin transactions by publisher domain ──
+    status("\u23f3 Building Awin publisher domain summary...")
+    awin_domains, changed = _stage_awin_domains(df_awin_tx)
+    hosts = awin_domains["_awin_host"]
+    __main__.awin_host_keys = frozenset(hosts[hosts.str.len() >= 3])
+    _enrich_state["host_keys_source"] = df_awin_tx
+
+    # ── Step 2: Normalise hostnames and match ────────────────────
+    status(
+        f"\u23f3 Matching {len(df_domain_result)} Peec domains against "
+        f"{len(awin_domains)} Awin publisher domains..."
+    )
+    peec, matches = _stage_match(df_domain_result, awin_domains, changed)
+    if matches.empty:
+        return None, peec, awin_domains
+
+    merged = matches.drop(columns=["_peec_pos", "_awin_host"])
 
     # ── Add count of Awin publisher IDs per PEEC domain ──────────
     pub_counts = merged.groupby("Peec Domain")["Publisher ID"].nunique().rename("Awin IDs on Domain")
     merged = merged.merge(pub_counts, on="Peec Domain", how="left")
 
-    # ── Populate domain type filter ──────────────────────────────
-    available_types = sorted(merged["Domain Type"].dropna().unique().tolist())
-    enrich_domain_type.options = ["All"] + available_types
-
     # ── Step 3: Pull publisher report for accurate names ─────────
-    enrich_status_msg.value = "\u23f3 Fetching Awin publisher report for publisher names..."
+    status("\u23f3 Fetching Awin publisher report for publisher names...")
     try:
-        raw_pub = _fetch_publisher_report(
-            ADVERTISER_ID, SESSION_START_DATE, SESSION_END_DATE
-        )
-        df_pub = _process_publisher_report(raw_pub)
-        if not df_pub.empty:
-            df_pub.to_csv(PUB_REPORT_CSV, index=False)
-
-            # Build name lookup and backfill
-            pub_name_lookup = dict(
-                zip(
-                    df_pub["Publisher ID"].astype(int),
-                    df_pub["Publisher Name"],
-                )
-            )
+        pub_name_lookup = _stage_publisher_names(advertiser_id, start_date, end_date)
+        if pub_name_lookup:
             merged["Publisher ID"] = merged["Publisher ID"].astype(int)
             merged["Publisher Name"] = merged["Publisher ID"].map(pub_name_lookup).fillna(
                 merged["Publisher Name"]
@@ -312,34 +403,24 @@ def run_enrich(b=None):
     except Exception as e:
         pass  # Fall back to publisher names from transaction data
 
-    # ── Step 4: Add Models column from df_detail ─────────────────
-    model_lookup = _build_model_lookup(df_detail)
-    merged["Models"] = merged["Peec Domain"].map(model_lookup).fillna("")
+    return merged, peec, awin_domains
 
-    # ── Cache the full (unfiltered) result ────────────────────────
-    _enriched_cache = merged.copy()
-
-    # ── Now apply filters and render ──────────────────────────────
-    _apply_enrich_filters()
-
-
-def _apply_enrich_filters(change=None):
-    """Filter/display phase: apply filters, sort, render stats + table.
-    Called after build, and reactively when any filter/sort widget changes."""
-    global df_enriched
-
-    if _enriched_cache is None:
-        return
-
-    merged = _enriched_cache.copy()
 
+@profiling.instrument("enrich_filter", cell="cell_09", rows=lambda r: len(r[0]))
+def filter_enriched(merged, domain_types=(), exclude="", publisher_name="",
+                    publisher_id="", sort_by="Peec Citations", ascending=False):
+    """
+    Filter phase: apply domain type / exclude / publisher filters to the
+    cached build result, add model codes, select columns and sort.
+    Returns (df_enriched, excluded_count).
+    """
     # ── Domain type filter ────────────────────────────────────────
-    selected_types = list(enrich_domain_type.value)
+    selected_types = list(domain_types)
     if selected_types and "All" not in selected_types:
         merged = merged[merged["Domain Type"].isin(selected_types)]
 
     # ── Exclude keywords filter ───────────────────────────────────
-    exclude_keywords = _parse_exclude_keywords(enrich_exclude.value)
+    exclude_keywords = _parse_exclude_keywords(exclude)
     excluded_count = 0
     if exclude_keywords:
         mask = merged.apply(lambda row: _row_excluded(row, exclude_keywords), axis=1)
@@ -347,14 +428,19 @@ def _apply_enrich_filters(change=None):
         merged = merged[~mask].reset_index(drop=True)
 
     # ── Publisher name / ID filters ───────────────────────────────
-    pn_q = enrich_pub_name.value.strip().lower()
+    pn_q = publisher_name.strip().lower()
     if pn_q:
         merged = merged[merged["Publisher Name"].astype(str).str.lower().str.contains(pn_q, na=False)]
 
-    pi_q = enrich_pub_id.value.strip()
+    pi_q = publisher_id.strip()
     if pi_q:
         merged = merged[merged["Publisher ID"].astype(str).str.contains(pi_q, na=False)]
 
+    # ── Models column (rendered for the surviving rows only) ──────
+    merged = merged.assign(Models=__main__._render_model_codes(
+        merged["Peec Domain"], __main__.domain_model_mask, width=3,
+    ))
+
     # ── Select and order output columns ───────────────────────────
     output_cols = [
         "Peec Domain",
@@ -377,16 +463,109 @@ def _apply_enrich_filters(change=None):
     merged = merged[output_cols]
 
     # ── Sort ──────────────────────────────────────────────────────
-    sort_col = enrich_sort_by.value
-    sort_asc = enrich_sort_dir.value == "Ascending"
-    if sort_col in merged.columns:
-        merged = merged.sort_values(sort_col, ascending=sort_asc).reset_index(drop=True)
+    if sort_by in merged.columns:
+        merged = merged.sort_values(sort_by, ascending=ascending).reset_index(drop=True)
     else:
         merged = merged.sort_values("Peec Citations", ascending=False).reset_index(drop=True)
+    return merged, excluded_count
 
-    df_enriched = merged
+
+def _publish_enriched(df):
+    """Store df_enriched on __main__ and save the CSV."""
+    global df_enriched
+    df_enriched = df
     __main__.df_enriched = df_enriched
-    merged.to_csv(ENRICHED_CSV, index=False)
+    pipeline.built("cell_09")
+    hostnames.save()
+    with profiling.stage("enrich_to_csv", cell="cell_09", rows=len(df)):
+        df.to_csv(ENRICHED_CSV, index=False)
+
+
+def run_enrich(b=None):
+    """Build phase: aggregate, match, fetch publisher names, cache result.
+    Reads the latest upstream frames from __main__ and only recomputes the
+    stages whose inputs changed since the previous build."""
+    global _enriched_cache
+    enrich_stats.value = ""
+    with enrich_table:
+        enrich_table.clear_output(wait=True)
+    enrich_status_msg.value = ""
+
+    df_domain_result = getattr(__main__, "df_domain_result", None)
+    df_awin_tx = getattr(__main__, "df_awin_tx", None)
+
+    if df_domain_result is None or df_domain_result.empty:
+        enrich_status_msg.value = "\u26a0\ufe0f Run the Domain Report first."
+        return
+    if df_awin_tx is None or df_awin_tx.empty:
+        enrich_status_msg.value = "\u26a0\ufe0f Run the Awin Transaction Report first."
+        return
+
+    def _status(msg):
+        enrich_status_msg.value = msg
+
+    merged, peec, awin_domains = build_enriched(
+        df_domain_result, df_awin_tx,
+        ADVERTISER_ID, SESSION_START_DATE, SESSION_END_DATE, status=_status,
+    )
+
+    if merged is None:
+        peec_hosts = sorted(peec["_peec_host"].unique())[:30]
+        awin_hosts = sorted(awin_domains["_awin_host"].unique())[:30]
+        enrich_status_msg.value = "\u26a0\ufe0f No domain matches found."
+        _enriched_cache = None
+        with enrich_table:
+            enrich_table.clear_output(wait=True)
+            display(HTML(
+                "<div><b>Peec normalised hosts (first 30):</b><br>"
+                + "<br>".join(f"&nbsp;&nbsp;{s}" for s in peec_hosts)
+                + "<br><br><b>Awin publisher normalised hosts (first 30):</b><br>"
+                + "<br>".join(f"&nbsp;&nbsp;{s}" for s in awin_hosts)
+                + "<br><br>Compare the lists above for near-misses.</div>"
+            ))
+        return
+
+    # ── Populate domain type filter ──────────────────────────────
+    available_types = sorted(merged["Domain Type"].dropna().unique().tolist())
+    enrich_domain_type.options = ["All"] + available_types
+
+    # ── Cache the full (unfiltered) result ────────────────────────
+    _enriched_cache = merged.copy()
+
+    # ── Now apply filters and render ──────────────────────────────
+    _apply_enrich_filters()
+
+
+def _apply_enrich_filters(change=None):
+    """Filter/display phase: apply filters, sort, render stats + table.
+    Called after build, and reactively when any filter/sort widget changes."""
+    if _enriched_cache is None:
+        return
+
+    filters = dict(
+        domain_types=enrich_domain_type.value,
+        exclude=enrich_exclude.value,
+        publisher_name=enrich_pub_name.value,
+        publisher_id=enrich_pub_id.value,
+        sort_by=enrich_sort_by.value,
+        ascending=enrich_sort_dir.value == "Ascending",
+    )
+    # Keyed on this build and df_detail (the Models column reads its masks);
+    # exclude is keyed by its parsed keywords, so "a, b" and "B,a" match
+    key = _enrich_memo.key(
+        [_enriched_cache, getattr(__main__, "df_detail", None)], casefold=("publisher_name",),
+        **{**filters, "exclude": _parse_exclude_keywords(filters["exclude"])},
+    )
+    hit = _enrich_memo.get(key)
+    if hit is None:
+        merged, excluded_count = filter_enriched(_enriched_cache.copy(), **filters)
+        with profiling.stage("enrich_to_html", cell="cell_09", rows=len(merged)):
+            html = merged.to_html(index=True, escape=False, max_cols=None, max_rows=None)
+        hit = (merged, excluded_count, html)
+        _enrich_memo.put(key, hit)
+    merged, excluded_count, html = hit
+    if merged is not df_enriched:
+        _publish_enriched(merged)
 
     # ── Stats ────────────────────────────────────────────────────
     matched_domains = merged["Peec Domain"].nunique()
@@ -417,8 +596,7 @@ def _apply_enrich_filters(change=None):
         enrich_table.clear_output(wait=True)
         display(HTML(
             '<div class="peec-scroll" style="max-height:none;overflow:visible;">'
-            + merged.to_html(index=True, escape=False, max_cols=None, max_rows=None)
-            + "</div>"
+            + html + "</div>"
         ))
 
 
@@ -431,37 +609,39 @@ def on_enrich_dl(b):
 enrich_run_btn.on_click(run_enrich)
 enrich_dl_btn.on_click(on_enrich_dl)
 
-display(
-    widgets.HTML(
-        '<div class="peec-header">\U0001f4ca Enriched Report \u2014 Domain Match + Citations + Transactions</div>'
-        '<div class="peec-sub">Matches Peec citation domains to Awin publisher domains, '
-        "enriches with AI model data and transaction metrics</div>"
-    ),
-    widgets.HTML(
-        '<div class="peec-section" style="margin-bottom:8px">'
-        "\u2139\ufe0f <b>Models</b> = AI models citing this domain (3-char codes) &nbsp;|&nbsp; "
-        "<b>Publisher Name</b> = from Awin publisher report</div>"
-    ),
-    enrich_domain_type,
-    widgets.HTML('<div style="font-size:11px;color:#888;margin:-4px 0 4px 0">'
-                 'Ctrl+click to select types to include (none selected = show all)</div>'),
-    widgets.HBox(
-        [enrich_pub_name, enrich_pub_id],
-        layout=widgets.Layout(margin="0 0 4px 0"),
-    ),
-    enrich_exclude,
-    widgets.HBox(
-        [enrich_sort_by, enrich_sort_dir],
-        layout=widgets.Layout(margin="4px 0 4px 0"),
-    ),
-    widgets.HBox(
-        [enrich_run_btn, enrich_dl_btn],
-        layout=widgets.Layout(margin="8px 0 10px 0"),
-    ),
-    enrich_stats,
-    enrich_status_msg,
-    enrich_table,
-)
+if not HEADLESS:
+    display(
+        widgets.HTML(
+            '<div class="peec-header">\U0001f4ca Enriched Report \u2014 Domain Match + Citations + Transactions</div>'
+            '<div class="peec-sub">Matches Peec citation domains to Awin publisher domains, '
+            "enriches with AI model data and transaction metrics</div>"
+        ),
+        widgets.HTML(
+            '<div class="peec-section" style="margin-bottom:8px">'
+            "\u2139\ufe0f <b>Models</b> = AI models citing this domain (3-char codes) &nbsp;|&nbsp; "
+            "<b>Publisher Name</b> = from Awin publisher report</div>"
+        ),
+        enrich_domain_type,
+        widgets.HTML('<div style="font-size:11px;color:#888;margin:-4px 0 4px 0">'
+                     'Ctrl+click to select types to include (none selected = show all)</div>'),
+        widgets.HBox(
+            [enrich_pub_name, enrich_pub_id],
+            layout=widgets.Layout(margin="0 0 4px 0"),
+        ),
+        enrich_exclude,
+        widgets.HBox(
+            [enrich_sort_by, enrich_sort_dir],
+            layout=widgets.Layout(margin="4px 0 4px 0"),
+        ),
+        widgets.HBox(
+            [enrich_run_btn, enrich_dl_btn],
+            layout=widgets.Layout(margin="8px 0 10px 0"),
+        ),
+        enrich_stats,
+        enrich_status_msg,
+        enrich_table,
+        profiling.panel("cell_09"),
+    )
 
 # Attach filter/sort observers for reactive updates (after display to avoid trigger during init)
 enrich_domain_type.observe(_apply_enrich_filters, names="value")
@@ -1,24 +1,36 @@
 # cell_10_gap_analysis.py — Gap analysis: PEEC-cited domains NOT in Awin
-# Identifies potential recruitment targets.
+# Identifies potential recruitment targets via a hash anti-join of Peec hosts
+# against the matcher's Awin host keys (no enriched report needed), ranked by
+# a weighted opportunity score that re-ranks instantly as weights change.
 # Produces: df_gap
 
 import __main__
+import numpy as np
 import pandas as pd
 import ipywidgets as widgets
 from IPython.display import display, HTML
 
+import hostnames
+import pipeline
+import profiling
+import report_memo
+
 # ── Prerequisites ────────────────────────────────────────────────
-for _r in ["df_detail", "df_domain_result", "df_enriched",
-           "_scroll_table", "download_file", "PATHS"]:
-    if not hasattr(__main__, _r) or getattr(__main__, _r) is None:
-        raise RuntimeError(f"Missing '{_r}'. Run earlier cells first.")
+pipeline.require(["df_detail", "df_domain_result", "df_awin_tx", "detail_domain_index",
+                  "url_model_mask", "_render_model_codes", "_grouped_agg", "_scroll_table",
+                  "download_file", "PATHS"], "cell_10")
 
 df_detail = __main__.df_detail
 df_domain_result = __main__.df_domain_result
-df_enriched = __main__.df_enriched
+df_awin_tx = __main__.df_awin_tx
+detail_domain_index = __main__.detail_domain_index
+_grouped_agg = __main__._grouped_agg
+url_model_mask = __main__.url_model_mask
+_render_model_codes = __main__._render_model_codes
 _scroll_table = __main__._scroll_table
 download_file = __main__.download_file
 PATHS = __main__.PATHS
+HEADLESS = getattr(__main__, "HEADLESS", False)
 
 GAP_CSV = str(PATHS["output"] / "peec_awin_gap_analysis.csv")
 df_gap = None
@@ -55,6 +67,34 @@ gap_exclude = widgets.Text(
     style={"description_width": "120px"},
     layout=widgets.Layout(width="600px"),
 )
+gap_rank_by = widgets.Dropdown(
+    options=["Opportunity Score", "Domain Total Citations"],
+    value="Opportunity Score", description="Rank by:",
+    style={"description_width": "60px"}, layout=widgets.Layout(width="280px"),
+)
+gap_top_n = widgets.Dropdown(
+    options=[("All URLs", 0), ("Top 100", 100), ("Top 500", 500), ("Top 1,000", 1000)],
+    value=0, description="Show:",
+    style={"description_width": "50px"}, layout=widgets.Layout(width="200px"),
+)
+
+
+# ── Opportunity score weights ────────────────────────────────────
+# One slider per column of the domain feature matrix (same order).
+SCORE_FEATURES = ["Citations", "Position", "Model Breadth", "Prompt Breadth", "Page Type Mix"]
+_DEFAULT_WEIGHTS = [0.40, 0.20, 0.15, 0.15, 0.10]
+gap_weights = [
+    widgets.FloatSlider(
+        value=w, min=0.0, max=1.0, step=0.05, description=f"{name}:",
+        readout_format=".2f", continuous_update=False,
+        style={"description_width": "110px"}, layout=widgets.Layout(width="320px"),
+    )
+    for name, w in zip(SCORE_FEATURES, _DEFAULT_WEIGHTS)
+]
+
+_gap_cache = None  # holds unranked gap URLs + domain feature matrix after build phase
+_gap_published = {"agg": None}  # ranking behind df_gap
+_gap_memo = report_memo.memo("gap_report")  # recent rankings per build
 
 
 def _parse_keywords(text):
@@ -63,52 +103,88 @@ def _parse_keywords(text):
     return [kw.strip().lower() for kw in text.split(",") if kw.strip()]
 
 
-def run_gap(b=None):
-    global df_gap
-    gap_stats.value = ""
-    with gap_table:
-        gap_table.clear_output(wait=True)
-    gap_status_msg.value = ""
-
-    if df_detail is None or df_detail.empty:
-        gap_status_msg.value = "\u26a0\ufe0f Run the Peec Citation Data pull cell first."
-        return
-    if df_domain_result is None or df_domain_result.empty:
-        gap_status_msg.value = "\u26a0\ufe0f Run the Domain-Level Report cell first."
-        return
-    if df_enriched is None or df_enriched.empty:
-        gap_status_msg.value = "\u26a0\ufe0f Run the Enriched Report cell first."
-        return
-
-    gap_status_msg.value = "\u23f3 Identifying Peec domains not matched to Awin publishers..."
-
-    # ── Get matched domains from enriched report ─────────────
-    matched_domains = set(df_enriched["Peec Domain"].str.lower().unique())
-
-    # ── Get all Peec domains ─────────────────────────────────
-    all_peec = df_domain_result.copy()
-    all_peec["_domain_lower"] = all_peec["Domain"].str.lower()
-
-    # Filter to unmatched only
-    gap_domains = all_peec[~all_peec["_domain_lower"].isin(matched_domains)].copy()
-    gap_domains = gap_domains.drop(columns=["_domain_lower"])
-
-    if gap_domains.empty:
-        gap_status_msg.value = "\U0001f389 Every Peec-cited domain is matched to an Awin publisher!"
-        return
-
-    # ── Populate domain type filter ──────────────────────────
-    available_types = sorted(gap_domains["Domain Type"].dropna().unique().tolist())
-    gap_domain_type.options = ["All"] + available_types
-    if gap_domain_type.value not in gap_domain_type.options:
-        gap_domain_type.value = "All"
-
+def _awin_host_keys(tx):
+    """
+    Normalised Awin host keys, as used by the domain matcher. Reuses the set
+    published by the enriched report when it was built from this same pull.
+    """
+    state = getattr(__main__, "_enrich_state", {})
+    if state.get("host_keys_source") is tx and hasattr(__main__, "awin_host_keys"):
+        return __main__.awin_host_keys
+    hosts = hostnames.normalise(tx["Publisher Domain"].unique(), "host")
+    return frozenset(h for h in hosts.tolist() if h and len(h) >= 3)
+
+
+@profiling.instrument("gap_find", cell="cell_10")
+def find_gap_domains(domain_result, awin_tx):
+    """Hash anti-join: Peec domains whose normalised host has no Awin match."""
+    awin_hosts = _awin_host_keys(awin_tx)
+    codes, hosts = hostnames.factorize(domain_result["Domain"], "host")
+    matched = np.array([h in awin_hosts for h in hosts.tolist()], dtype=bool)
+    return domain_result[~matched[codes]]
+
+
+def _detail_rows(domains):
+    """Slice df_detail for the given domains via the precomputed row ranges."""
+    ranges = [detail_domain_index[d] for d in domains if d in detail_domain_index]
+    if not ranges:
+        return df_detail.iloc[0:0]
+    rows = np.sort(np.concatenate([np.arange(a, b) for a, b in ranges]))
+    return df_detail.iloc[rows]
+
+
+def _minmax(col):
+    """Scale a feature column to 0..1 (a constant column scales to 0)."""
+    lo, hi = col.min(), col.max()
+    return (col - lo) / (hi - lo) if hi > lo else np.zeros_like(col)
+
+
+def _domain_features(gap_domains, detail):
+    """
+    Array-backed feature matrix, one row per gap domain, columns as in
+    SCORE_FEATURES, each scaled to 0..1:
+      citations (log-scaled), inverse avg position, share of models citing,
+      prompt breadth, and share of page types the domain is cited through.
+    """
+    page_types = detail.groupby("Domain")["Page Type"].nunique()
+    n_page_types = max(detail["Page Type"].nunique(), 1)
+    n_models = max(len(getattr(__main__, "MODEL_IDS", ())), 1)
+
+    citations = gap_domains["Total Citations"].to_numpy(dtype=float)
+    avg_pos = gap_domains["Avg Citation Pos"].to_numpy(dtype=float)
+    inv_pos = np.divide(1.0, avg_pos, out=np.zeros_like(avg_pos), where=avg_pos > 0)
+    X = np.column_stack([
+        _minmax(np.log1p(citations)),
+        _minmax(inv_pos),
+        gap_domains["Models Present"].to_numpy(dtype=float) / n_models,
+        _minmax(gap_domains["Prompts Appearing In"].to_numpy(dtype=float)),
+        page_types.reindex(gap_domains["Domain"], fill_value=0).to_numpy(dtype=float) / n_page_types,
+    ])
+    return np.nan_to_num(X)
+
+
+def _score_domains(X, weights):
+    """Weighted opportunity score (0-100) for every row of the feature matrix."""
+    w = np.array(weights, dtype=float)
+    total = w.sum()
+    if total <= 0:
+        return np.zeros(len(X))
+    return np.round(X @ (w / total) * 100, 1)
+
+
+@profiling.instrument("gap_build", cell="cell_10", rows=lambda c: len(c["urls"]))
+def build_gap(gap_domains, domain_type="All", include="", exclude=""):
+    """
+    Build phase: filter the gap domains, aggregate their URLs and build the
+    domain feature matrix. Returns the cache consumed by rank_gap(), or None
+    if no domain survives the filters.
+    """
     # ── Apply domain type filter ─────────────────────────────
-    if gap_domain_type.value != "All":
-        gap_domains = gap_domains[gap_domains["Domain Type"] == gap_domain_type.value]
+    if domain_type != "All":
+        gap_domains = gap_domains[gap_domains["Domain Type"] == domain_type]
 
     # ── Apply domain keyword include filter ──────────────────
-    include_kws = _parse_keywords(gap_domain_search.value)
+    include_kws = _parse_keywords(include)
     if include_kws:
         mask = gap_domains["Domain"].str.lower().apply(
             lambda d: any(kw in d for kw in include_kws)
@@ -116,7 +192,7 @@ def run_gap(b=None):
         gap_domains = gap_domains[mask]
 
     # ── Apply domain keyword exclude filter ──────────────────
-    exclude_kws = _parse_keywords(gap_exclude.value)
+    exclude_kws = _parse_keywords(exclude)
     excluded_count = 0
     if exclude_kws:
         mask = gap_domains["Domain"].str.lower().apply(
@@ -126,44 +202,30 @@ def run_gap(b=None):
         gap_domains = gap_domains[~mask]
 
     if gap_domains.empty:
-        gap_stats.value = '<div class="peec-stat">\u26a0\ufe0f No domains match current filters</div>'
-        gap_status_msg.value = ""
-        return
+        return None
 
     # ── Build URL-level detail for gap domains ───────────────
-    gap_domain_set = set(gap_domains["Domain"].str.lower())
-
-    detail = df_detail.copy()
-    detail["_domain_lower"] = detail["Domain"].str.lower()
-    detail = detail[detail["_domain_lower"].isin(gap_domain_set)].copy()
-    detail = detail.drop(columns=["_domain_lower"])
-
+    detail = _detail_rows(gap_domains["Domain"])
     if detail.empty:
-        gap_status_msg.value = "\u26a0\ufe0f No URL-level detail found for gap domains."
-        return
+        return {"urls": pd.DataFrame(), "excluded_count": excluded_count}
 
     # Aggregate: one row per URL
-    url_agg = (
-        detail.groupby("URL", as_index=False)
-        .agg(
-            Full_URL=("Full URL", "first"),
-            Domain=("Domain", "first"),
-            Title=("Title", "first"),
-            Page_Type=("Page Type", "first"),
-            Domain_Type=("Domain Type", "first"),
-            Citations=("usage_count", "sum"),
-            Avg_Pos=("citation_avg", "mean"),
-            Models=("Model", lambda x: ", ".join(
-                sorted(set(str(m)[:5] for m in x.dropna()))
-            )),
-            Model_Count=("Model", "nunique"),
-            Prompt_Count=("Prompt", "nunique"),
-        )
+    url_agg = _grouped_agg(
+        detail, "URL",
+        Full_URL=("Full URL", "first"),
+        Domain=("Domain", "first"),
+        Title=("Title", "first"),
+        Page_Type=("Page Type", "first"),
+        Domain_Type=("Domain Type", "first"),
+        Citations=("usage_count", "sum"),
+        Avg_Pos=("citation_avg", "mean"),
+        Model_Count=("Model", "nunique"),
+        Prompt_Count=("Prompt", "nunique"),
     )
     url_agg.columns = [
         "URL", "Full URL", "Domain", "Title", "Page Type",
         "Domain Type", "Citations", "Avg Pos",
-        "Models", "Model Count", "Prompt Count",
+        "Model Count", "Prompt Count",
     ]
     url_agg["Avg Pos"] = url_agg["Avg Pos"].round(2)
 
@@ -175,13 +237,122 @@ def run_gap(b=None):
         domain_totals, left_on="Domain", right_index=True, how="left",
     )
 
-    # Sort: highest domain citation total first, then highest URL citations
-    url_agg = url_agg.sort_values(
-        ["Domain Total Citations", "Citations"],
-        ascending=[False, False],
-    ).reset_index(drop=True)
+    # ── Unranked result + domain feature matrix ──────────────
+    gap_domains = gap_domains.reset_index(drop=True)
+    return {
+        "urls": url_agg,
+        "url_domain_pos": pd.Index(gap_domains["Domain"]).get_indexer(url_agg["Domain"]),
+        "features": _domain_features(gap_domains, detail),
+        "excluded_count": excluded_count,
+    }
+
+
+@profiling.instrument("gap_rank", cell="cell_10")
+def rank_gap(cache, weights=_DEFAULT_WEIGHTS, rank_by="Opportunity Score", top_n=0):
+    """
+    Rank phase: score every gap domain in one pass over the feature matrix,
+    then order (or top-N select) the gap URLs and add model codes.
+    """
+    url_agg = cache["urls"].copy()
+    scores = _score_domains(cache["features"], weights)
+    url_agg.insert(
+        url_agg.columns.get_loc("Domain Total Citations") + 1,
+        "Opportunity Score", scores[cache["url_domain_pos"]],
+    )
+
+    # Sort: best domain first (by score or citation total), then highest
+    # URL citations. A top-N view selects with nlargest instead of sorting
+    # every gap URL.
+    order = ["Domain Total Citations", "Citations"]
+    if rank_by == "Opportunity Score":
+        order = ["Opportunity Score"] + order
+    if top_n:
+        url_agg = url_agg.nlargest(top_n, order, keep="first")
+    else:
+        url_agg = url_agg.sort_values(order, ascending=[False] * len(order))
+    url_agg = url_agg.reset_index(drop=True)
+
+    # Model codes from the per-URL bitmasks precomputed at pull time
+    url_agg.insert(
+        url_agg.columns.get_loc("Model Count"), "Models",
+        _render_model_codes(url_agg["URL"], url_model_mask, width=5),
+    )
+    return url_agg
 
-    # ── Build display version with clickable links ───────────
+
+def _publish_gap(url_agg):
+    """Store df_gap on __main__ and save the CSV (full URLs, no HTML)."""
+    global df_gap
+    _gap_published["agg"] = url_agg
+    csv_df = url_agg[[
+        "Domain", "Domain Type", "Domain Total Citations", "Opportunity Score",
+        "Title", "Citations", "Avg Pos",
+        "Models", "Model Count", "Prompt Count",
+        "Full URL",
+    ]].copy()
+    df_gap = csv_df
+    __main__.df_gap = df_gap
+    pipeline.built("cell_10")
+    hostnames.save()
+    with profiling.stage("gap_to_csv", cell="cell_10", rows=len(csv_df)):
+        csv_df.to_csv(GAP_CSV, index=False)
+
+
+def run_gap(b=None):
+    """Build phase: anti-join, filter, aggregate gap URLs and domain features."""
+    global _gap_cache
+    _gap_cache = None
+    gap_stats.value = ""
+    with gap_table:
+        gap_table.clear_output(wait=True)
+    gap_status_msg.value = ""
+
+    if df_detail is None or df_detail.empty:
+        gap_status_msg.value = "\u26a0\ufe0f Run the Peec Citation Data pull cell first."
+        return
+    if df_domain_result is None or df_domain_result.empty:
+        gap_status_msg.value = "\u26a0\ufe0f Run the Domain-Level Report cell first."
+        return
+    if df_awin_tx is None or df_awin_tx.empty:
+        gap_status_msg.value = "\u26a0\ufe0f Run the Awin Transaction Report cell first."
+        return
+
+    gap_status_msg.value = "\u23f3 Identifying Peec domains not matched to Awin publishers..."
+
+    # ── Anti-join Peec domains against the matcher's Awin host keys ──
+    gap_domains = find_gap_domains(df_domain_result, df_awin_tx)
+
+    if gap_domains.empty:
+        gap_status_msg.value = "\U0001f389 Every Peec-cited domain is matched to an Awin publisher!"
+        return
+
+    # ── Populate domain type filter ──────────────────────────
+    available_types = sorted(gap_domains["Domain Type"].dropna().unique().tolist())
+    gap_domain_type.options = ["All"] + available_types
+    if gap_domain_type.value not in gap_domain_type.options:
+        gap_domain_type.value = "All"
+
+    cache = build_gap(
+        gap_domains,
+        domain_type=gap_domain_type.value,
+        include=gap_domain_search.value,
+        exclude=gap_exclude.value,
+    )
+    if cache is None:
+        gap_stats.value = '<div class="peec-stat">\u26a0\ufe0f No domains match current filters</div>'
+        gap_status_msg.value = ""
+        return
+    if cache["urls"].empty:
+        gap_status_msg.value = "\u26a0\ufe0f No URL-level detail found for gap domains."
+        return
+
+    # ── Cache the unranked result, then rank and render ──────
+    _gap_cache = cache
+    _rank_gap()
+
+
+def _gap_display(url_agg):
+    """Table HTML (clickable links) and stats counts for a ranked url_agg."""
     def _make_link(full_url):
         if not full_url:
             return ""
@@ -192,31 +363,43 @@ def run_gap(b=None):
         )
 
     display_df = url_agg[[
-        "Domain", "Domain Type", "Domain Total Citations",
+        "Domain", "Domain Type", "Domain Total Citations", "Opportunity Score",
         "Title", "Citations", "Avg Pos",
         "Models", "Model Count", "Prompt Count",
     ]].copy()
     display_df["Link"] = url_agg["Full URL"].apply(_make_link)
 
-    # ── Save CSV (full URLs, no HTML) ────────────────────────
-    csv_df = url_agg[[
-        "Domain", "Domain Type", "Domain Total Citations",
-        "Title", "Citations", "Avg Pos",
-        "Models", "Model Count", "Prompt Count",
-        "Full URL",
-    ]].copy()
-    df_gap = csv_df
-    __main__.df_gap = df_gap
-    csv_df.to_csv(GAP_CSV, index=False)
-
-    # ── Stats ────────────────────────────────────────────────
-    n_domains = display_df["Domain"].nunique()
-    n_urls = len(display_df)
-    total_citations = display_df["Citations"].sum()
-    domain_total_citations = (
-        display_df.drop_duplicates("Domain")["Domain Total Citations"].sum()
+    stats = (
+        display_df["Domain"].nunique(),
+        len(display_df),
+        display_df["Citations"].sum(),
+        display_df.drop_duplicates("Domain")["Domain Total Citations"].sum(),
     )
+    with profiling.stage("gap_to_html", cell="cell_10", rows=len(display_df)):
+        html = display_df.to_html(index=True, escape=False, max_cols=None, max_rows=None)
+    return '<div class="peec-scroll" style="max-height:none;overflow:visible;">' + html + "</div>", stats
 
+
+def _rank_gap(change=None):
+    """Rank/display phase: score domains, select rows, render stats + table.
+    Called after build, and reactively when weights, rank or top-N change."""
+    if _gap_cache is None:
+        return
+
+    weights = [w.value for w in gap_weights]
+    key = _gap_memo.key([_gap_cache["urls"], df_detail], weights=tuple(weights),
+                        rank_by=gap_rank_by.value, top_n=gap_top_n.value)
+    hit = _gap_memo.get(key)
+    if hit is None:
+        url_agg = rank_gap(_gap_cache, weights=weights, rank_by=gap_rank_by.value,
+                           top_n=gap_top_n.value)
+        hit = (url_agg, *_gap_display(url_agg))
+        _gap_memo.put(key, hit)
+    url_agg, html, (n_domains, n_urls, total_citations, domain_total_citations) = hit
+    if url_agg is not _gap_published["agg"]:
+        _publish_gap(url_agg)
+
+    excluded_count = _gap_cache["excluded_count"]
     excluded_note = (
         f' &nbsp;|&nbsp; \U0001f6ab Excluded: <b>{excluded_count}</b>'
         if excluded_count else ""
@@ -238,11 +421,7 @@ def run_gap(b=None):
 
     with gap_table:
         gap_table.clear_output(wait=True)
-        display(HTML(
-            '<div class="peec-scroll" style="max-height:none;overflow:visible;">'
-            + display_df.to_html(index=True, escape=False, max_cols=None, max_rows=None)
-            + "</div>"
-        ))
+        display(HTML(html))
 
 
 def on_gap_dl(b):
@@ -254,21 +433,32 @@ def on_gap_dl(b):
 gap_run_btn.on_click(run_gap)
 gap_dl_btn.on_click(on_gap_dl)
 
-display(
-    widgets.HTML(
-        '<div class="peec-header">\U0001f50d Gap Analysis \u2014 AI-Cited Domains NOT in Awin</div>'
-        '<div class="peec-sub">Identifies domains and pages cited by AI models where you have '
-        "no Awin publisher relationship \u2014 potential recruitment targets</div>"
-    ),
-    widgets.HTML('<div class="peec-section">Filters</div>'),
-    widgets.HBox([gap_domain_type], layout=widgets.Layout(margin="0 0 4px 0")),
-    gap_domain_search,
-    gap_exclude,
-    widgets.HBox(
-        [gap_run_btn, gap_dl_btn],
-        layout=widgets.Layout(margin="8px 0 10px 0"),
-    ),
-    gap_stats,
-    gap_status_msg,
-    gap_table,
-)
+if not HEADLESS:
+    display(
+        widgets.HTML(
+            '<div class="peec-header">\U0001f50d Gap Analysis \u2014 AI-Cited Domains NOT in Awin</div>'
+            '<div class="peec-sub">Identifies domains and pages cited by AI models where you have '
+            "no Awin publisher relationship \u2014 potential recruitment targets</div>"
+        ),
+        widgets.HTML('<div class="peec-section">Filters</div>'),
+        widgets.HBox([gap_domain_type, gap_top_n], layout=widgets.Layout(margin="0 0 4px 0")),
+        gap_domain_search,
+        gap_exclude,
+        widgets.HTML('<div class="peec-section">Opportunity Score Weights</div>'),
+        widgets.HBox(gap_weights[:3], layout=widgets.Layout(margin="0 0 4px 0")),
+        widgets.HBox(gap_weights[3:] + [gap_rank_by], layout=widgets.Layout(margin="0 0 4px 0")),
+        widgets.HBox(
+            [gap_run_btn, gap_dl_btn],
+            layout=widgets.Layout(margin="8px 0 10px 0"),
+        ),
+        gap_stats,
+        gap_status_msg,
+        gap_table,
+        profiling.panel("cell_10"),
+    )
+
+# Attach rank observers (after display to avoid trigger during init)
+gap_rank_by.observe(_rank_gap, names="value")
+gap_top_n.observe(_rank_gap, names="value")
+for _w in gap_weights:
+    _w.observe(_rank_gap, names="value")
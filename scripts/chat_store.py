@@ -0,0 +1,234 @@
+# chat_store.py — Bulk Peec chat harvester and compressed local chat store
+# Imported (not exec'd). harvest() pages through PeecClient.get_chats for a
+# date range and fetches each new chat's content (get_chat) on a bounded
+# thread pool. Contents are stored zlib-compressed in a SQLite file (default
+# PATHS["output"]/chats.sqlite), one row per chat ID, indexed by prompt and
+# model so they can be joined against df_detail ("Prompt ID", "Model"):
+#
+#   stats = chat_store.harvest(peec, "2026-01-01", "2026-01-31", project_id=pid)
+#   store = chat_store.ChatStore()
+#   idx = store.index(prompt_ids=df_detail["Prompt ID"].unique())
+#   df = df_detail.merge(idx, on=["Prompt ID", "Model"])
+#   answer = store.content(idx["Chat ID"].iloc[0])
+#
+# Chats already in the store are never fetched again, so re-running a
+# harvest (or one that was interrupted) only downloads what is missing.
+
+import json
+import sqlite3
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+STORE_NAME = "chats.sqlite"
+PAGE_SIZE = 1000
+WORKERS = 8
+COMMIT_EVERY = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id     TEXT PRIMARY KEY,
+    project_id  TEXT,
+    prompt_id   TEXT,
+    model_id    TEXT,
+    date        TEXT,
+    raw_bytes   INTEGER,
+    content     BLOB,
+    fetched_at  REAL
+);
+CREATE INDEX IF NOT EXISTS chats_prompt_model ON chats (prompt_id, model_id);
+CREATE INDEX IF NOT EXISTS chats_model ON chats (model_id);
+"""
+
+
+def _default_path():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    if not paths:
+        raise RuntimeError("Missing 'PATHS'. Run the session config cell first, or pass a path.")
+    return paths["output"] / STORE_NAME
+
+
+def _ref(chat, key):
+    """ID of a chat's prompt / model, whether nested ({"prompt": {"id"}}) or flat."""
+    value = chat.get(key)
+    if isinstance(value, dict):
+        return value.get("id")
+    return value if value is not None else chat.get(f"{key}_id")
+
+
+# ── Store ────────────────────────────────────────────────────────
+class ChatStore:
+    """
+    SQLite file of chat contents keyed by chat ID. Use from one thread
+    (harvest() fetches on a pool but writes from the calling thread).
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else _default_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(_SCHEMA)
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def missing(self, chat_ids):
+        """The chat IDs (in order) not yet in the store."""
+        have = set()
+        ids = list(chat_ids)
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            q = f"SELECT chat_id FROM chats WHERE chat_id IN ({','.join('?' * len(batch))})"
+            have.update(r[0] for r in self.db.execute(q, batch))
+        return [c for c in ids if c not in have]
+
+    def put(self, chat, content, project_id=None):
+        raw = json.dumps(content, separators=(",", ":")).encode("utf-8")
+        self.db.execute(
+            "INSERT OR REPLACE INTO chats VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (chat["id"], project_id, _ref(chat, "prompt"), _ref(chat, "model"),
+             chat.get("date") or chat.get("created_at"), len(raw), zlib.compress(raw, 6),
+             time.time()),
+        )
+
+    def commit(self):
+        self.db.commit()
+
+    def content(self, chat_id):
+        """Decompressed content of one chat (None if not stored)."""
+        row = self.db.execute("SELECT content FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+    def index(self, prompt_ids=None, model_ids=None, project_id=None):
+        """
+        Chat index as a DataFrame (Chat ID, Project ID, Prompt ID, Model,
+        Date, Bytes), optionally limited to some prompts / models / project.
+        Column names match df_detail for joins.
+        """
+        import pandas as pd
+
+        where, args = [], []
+        for col, values in (("prompt_id", prompt_ids), ("model_id", model_ids)):
+            if values is not None:
+                values = [str(v) for v in values]
+                if not values:
+                    where.append("0")
+                    continue
+                where.append(f"{col} IN ({','.join('?' * len(values))})")
+                args += values
+        if project_id is not None:
+            where.append("project_id = ?")
+            args.append(project_id)
+        q = ("SELECT chat_id, project_id, prompt_id, model_id, date, raw_bytes FROM chats"
+             + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY chat_id")
+        return pd.DataFrame(
+            self.db.execute(q, args).fetchall(),
+            columns=["Chat ID", "Project ID", "Prompt ID", "Model", "Date", "Bytes"],
+        )
+
+    def stats(self):
+        n, raw, stored = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(content)), 0) FROM chats"
+        ).fetchone()
+        return {"chats": n, "raw_mb": round(raw / 2**20, 2), "stored_mb": round(stored / 2**20, 2)}
+
+
+# ── Harvest ──────────────────────────────────────────────────────
+def iter_chats(client, start_date, end_date, project_id=None, page_size=PAGE_SIZE):
+    """
+    Yield each chat listed for the range once, paging through get_chats.
+    Pages may be shorter than page_size (servers cap it), so offset
+    advances by the chats received.
+    """
+    seen = set()
+    offset = 0
+    while True:
+        page = (client.get_chats(start_date, end_date, project_id=project_id,
+                                 limit=page_size, offset=offset) or {}).get("data") or []
+        new = 0
+        for chat in page:
+            if chat.get("id") and chat["id"] not in seen:
+                seen.add(chat["id"])
+                new += 1
+                yield chat
+        # An empty page ends the listing; so does a page with nothing new
+        # (an endpoint that ignores offset)
+        if not new:
+            return
+        offset += len(page)
+
+
+def harvest(client, start_date, end_date, project_id=None, store=None, workers=WORKERS,
+            status=print):
+    """
+    List the range's chats and download the content of those not already in
+    store (default ChatStore()), `workers` requests at a time.
+    A chat whose download fails (get_chat raises) is left out and retried
+    by the next harvest.
+    Returns counts: listed, new, fetched, failed, plus the store's stats().
+    """
+    import profiling  # scripts/ is on sys.path wherever harvests run
+
+    own_store = store is None
+    if own_store:
+        store = ChatStore()
+    try:
+        with profiling.stage("chat_list", cell="chats") as rec:
+            chats = {c["id"]: c for c in iter_chats(client, start_date, end_date, project_id)}
+            todo = store.missing(chats)
+            rec["rows"] = len(chats)
+        status(f"\u23f3 {len(chats):,} chats listed, {len(todo):,} not yet stored")
+
+        fetched = failed = 0
+        with profiling.stage("chat_fetch", cell="chats") as rec, \
+                ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="chats") as pool:
+            queue = iter(todo)
+            pending = {}
+
+            def submit(n):
+                if n <= 0:
+                    return
+                for chat_id in queue:
+                    pending[pool.submit(client.get_chat, chat_id, project_id=project_id)] = chat_id
+                    n -= 1
+                    if not n:
+                        return
+
+            submit(workers * 2)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    chat_id = pending.pop(fut)
+                    try:
+                        content = fut.result()
+                    except Exception:
+                        failed += 1
+                        continue
+                    store.put(chats[chat_id], content, project_id=project_id)
+                    fetched += 1
+                    if fetched % COMMIT_EVERY == 0:
+                        store.commit()
+                        status(f"   \u2026 {fetched:,}/{len(todo):,} chats")
+                submit(len(done))
+            store.commit()
+            rec["rows"] = fetched
+        result = {"listed": len(chats), "new": len(todo), "fetched": fetched, "failed": failed,
+                  **store.stats()}
+    finally:
+        if own_store:
+            store.close()
+    status(f"\u2705 Chats: {fetched:,} downloaded, {failed:,} failed, "
+           f"{len(chats) - len(todo):,} already stored")
+    return result
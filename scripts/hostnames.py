@@ -0,0 +1,233 @@
+# hostnames.py — Memoised hostname normalisation shared by all cells
+# Imported (not exec'd). One place for the URL/domain -> host rules used for
+# Peec rows, Awin publisher URLs and Peec <> Awin matching:
+#
+#   "domain"     https://www.example.com/a  -> example.com       (_extract_domain)
+#   "subdomain"  https://blog.example.com/a -> blog.example.com  (_extract_subdomain)
+#   "host"       www.Example.com/path?q     -> example.com       (_normalise_host)
+#   "publisher"  http://www.example.com/    -> example.com       (Awin publisher URL)
+#
+# Results are kept in a bounded LRU memo per kind, so strings that repeat
+# thousands of times are parsed once. Batch calls work on unique values:
+#
+#   hosts = hostnames.normalise(df["Domain"], "host")          # aligned array
+#   codes, uniques = hostnames.factorize(df["Domain"], "host") # uniques[codes]
+#
+# The host-level kinds ("host", "publisher": a few thousand distinct domains
+# that recur every session) are saved to PATHS["logs"]/hostnames.json
+# (save(), called after each pull) and reloaded on first use in a new
+# session. The URL-keyed kinds are memoised in memory only: they grow with
+# the pull (up to MEMO_SIZE full URLs) and rarely repeat across sessions.
+# Bump RULES_VERSION when a rule changes so stale files are ignored.
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+RULES_VERSION = 1
+MEMO_SIZE = 500_000   # entries per kind
+STORE_NAME = "hostnames.json"
+PERSIST_KINDS = ("host", "publisher")
+
+
+# ── Rules ────────────────────────────────────────────────────────
+def _domain(url):
+    if not url:
+        return ""
+    if not url.startswith("http"):
+        url = "https://" + url
+    try:
+        host = urlparse(url).netloc.lower()
+        return re.sub(r"^www\.", "", host)
+    except Exception:
+        return url.split("/")[0].lower()
+
+
+def _subdomain(url):
+    if not url:
+        return ""
+    if not url.startswith("http"):
+        url = "https://" + url
+    try:
+        return urlparse(url).netloc.lower()
+    except Exception:
+        return url.split("/")[0].lower()
+
+
+def _host(domain):
+    """
+    Lowercase, strip protocol, www. and any path / query / fragment:
+      https://www.spacenk.com/uk/brands  ->  spacenk.com
+      rebeccajones.substack.com           ->  rebeccajones.substack.com
+    """
+    s = str(domain).lower().strip()
+    s = re.sub(r"^https?://", "", s)
+    s = re.sub(r"^www\.", "", s)
+    s = s.split("/")[0].split("?")[0].split("#")[0]
+    s = s.rstrip(".")
+    return s
+
+
+def _publisher(url):
+    if not url:
+        return ""
+    url = str(url)
+    if not url.startswith("http"):
+        url = "https://" + url
+    try:
+        host = urlparse(url).netloc.lower()
+        return re.sub(r"^www\.", "", host)
+    except Exception:
+        return ""
+
+
+RULES = {"domain": _domain, "subdomain": _subdomain, "host": _host, "publisher": _publisher}
+
+
+# ── Memo ─────────────────────────────────────────────────────────
+class _LRU:
+    """Bounded raw -> normalised map; least recently used entries drop first."""
+
+    def __init__(self, fn, maxsize):
+        self.fn = fn
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = self.misses = 0
+        self.dirty = False
+
+    def get(self, key):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            value = self.data[key] = self.fn(key)
+            self.dirty = True
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        else:
+            self.hits += 1
+            self.data.move_to_end(key)
+        return value
+
+
+_memo = {kind: _LRU(fn, MEMO_SIZE) for kind, fn in RULES.items()}
+_lock = threading.Lock()
+_save_lock = threading.Lock()  # concurrent publishes share one temp file
+_loaded = False
+
+
+def _store_path():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    return paths["logs"] / STORE_NAME if paths else None
+
+
+def load(path=None):
+    """Merge a saved mapping into the memo (ignored if missing or stale)."""
+    global _loaded
+    _loaded = True
+    path = path or _store_path()
+    if path is None or not path.is_file():
+        return 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if saved.get("version") != RULES_VERSION:
+        return 0
+    n = 0
+    with _lock:
+        for kind, mapping in saved.get("kinds", {}).items():
+            if kind in PERSIST_KINDS:
+                memo = _memo[kind]
+                for raw, norm in mapping.items():
+                    memo.data.setdefault(raw, norm)
+                    n += 1
+                while len(memo.data) > memo.maxsize:
+                    memo.data.popitem(last=False)
+    return n
+
+
+def save(path=None):
+    """Write the PERSIST_KINDS memos to the workspace if anything new was computed."""
+    path = path or _store_path()
+    if path is None or not any(_memo[k].dirty for k in PERSIST_KINDS):
+        return None
+    with _lock:
+        payload = {"version": RULES_VERSION,
+                   "kinds": {kind: dict(_memo[kind].data) for kind in PERSIST_KINDS}}
+        for kind in PERSIST_KINDS:
+            _memo[kind].dirty = False
+    tmp = path.with_suffix(".tmp")
+    with _save_lock:
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            tmp.replace(path)
+        except OSError:
+            return None
+    return path
+
+
+def _ensure_loaded():
+    if not _loaded:
+        load()
+
+
+# ── Scalar API ───────────────────────────────────────────────────
+def normalise_one(value, kind="host"):
+    """Memoised normalisation of a single value."""
+    _ensure_loaded()
+    if not isinstance(value, str):
+        return RULES[kind](value)  # None / NaN: not worth memoising
+    with _lock:
+        return _memo[kind].get(value)
+
+
+def extract_domain(url):
+    return normalise_one(url, "domain")
+
+
+def extract_subdomain(url):
+    return normalise_one(url, "subdomain")
+
+
+def normalise_host(domain):
+    return normalise_one(domain, "host")
+
+
+def publisher_domain(url):
+    return normalise_one(url, "publisher")
+
+
+# ── Batch API ────────────────────────────────────────────────────
+def factorize(values, kind="host"):
+    """
+    Normalise a column via its unique values. Returns (codes, uniques) with
+    uniques an object array of distinct normalised values and
+    uniques[codes] the normalised column. Missing values (None / NaN)
+    normalise to "".
+    """
+    import numpy as np
+    import pandas as pd
+
+    raw_codes, raw_uniques = pd.factorize(pd.Series(values, dtype=object))
+    norm = [normalise_one(v, kind) for v in raw_uniques.tolist()]
+    norm.append("")  # raw code -1 (missing) indexes this
+    norm_codes, uniques = pd.factorize(pd.Series(norm, dtype=object))
+    return norm_codes[raw_codes], np.asarray(uniques, dtype=object)
+
+
+def normalise(values, kind="host"):
+    """Normalised values aligned with the input (object ndarray)."""
+    codes, uniques = factorize(values, kind)
+    return uniques[codes]
+
+
+def stats():
+    """Memo size and hit/miss counts per kind."""
+    return {kind: {"size": len(m.data), "hits": m.hits, "misses": m.misses}
+            for kind, m in _memo.items()}
@@ -0,0 +1,502 @@
+# http_telemetry.py — Per-request metrics for the Peec and Awin API calls
+# Imported (not exec'd). PeecClient and the Awin fetchers send every request
+# through request(), which retries 429 / 5xx responses (honouring
+# Retry-After) and records one entry per call:
+#   endpoint, method, status, latency_s, ttfb_s, bytes, rows, retries,
+#   throttle_s (time spent waiting before retries)
+# Entries are appended to PATHS["logs"]/http.jsonl and folded into running
+# per-endpoint totals as they arrive; summary() reports those (p50/p95
+# latency and TTFB from a bounded sample, rows/s, MB/s, retries, waits).
+# CALLS keeps only the latest MAX_CALLS entries; the log has them all.
+#
+#   resp, data = http_telemetry.request("GET", url, endpoint="awin /transactions",
+#                                       params=params)
+#
+# Endpoints are labelled "<api> <path>" with IDs replaced by {id}, so e.g.
+# all transaction chunks aggregate under one key.
+#
+# Payloads: every request advertises the encodings urllib3 can decode
+# (gzip/deflate, plus br / zstd when brotli / zstandard are installed), and
+# bodies are decoded with orjson when it is installed. stream_rows() yields
+# the rows of a large response one at a time (incremental parse via ijson
+# when installed), so callers never hold the raw payload and its rows at
+# once:
+#
+#   for row in http_telemetry.stream_rows("POST", url, prefix="data.item", json=payload):
+#       ...
+#
+# Connections: requests go through one pooled requests.Session per host
+# (up to POOL_SIZE keep-alive connections), shared by every thread, so
+# concurrent pulls reuse connections instead of opening one per call.
+# set_rate_limit(host, per_second) spaces all calls to a host, whichever
+# thread makes them; the wait counts as pacing time.
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from urllib.parse import urlparse
+
+LOG_NAME = "http.jsonl"
+MAX_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_S = 0.5       # first retry wait when there is no Retry-After
+MAX_WAIT_S = 30.0
+POOL_SIZE = 16        # keep-alive connections per host
+MAX_CALLS = 5_000     # recent entries kept in CALLS
+LATENCY_SAMPLE = 512  # latencies / TTFBs sampled per endpoint for p50 / p95
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+CALLS = deque(maxlen=MAX_CALLS)
+PACING = {}  # endpoint -> seconds slept between calls (e.g. Awin chunk courtesy)
+RATE_LIMITS = {}  # host -> max requests per second (set_rate_limit)
+_listeners = {}
+_lock = threading.Lock()
+_totals = {}  # endpoint -> running aggregate (see _fold)
+_rng = random.Random(0)
+
+
+class APIError(Exception):
+    """Non-200 final response from stream_rows(); status is the HTTP status."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# ── Labels ───────────────────────────────────────────────────────
+def endpoint_label(url, api=None):
+    """'https://api.awin.com/advertisers/123/transactions/' -> 'awin /advertisers/{id}/transactions'."""
+    parts = urlparse(url)
+    path = re.sub(r"/\d+(?=/|$)", "/{id}", parts.path.rstrip("/"))
+    path = re.sub(r"/chats/[^/]+/content$", "/chats/{id}/content", path)
+    path = re.sub(r"^/customer/v\d+", "", path)
+    api = api or ("awin" if "awin" in parts.netloc else "peec")
+    return f"{api} {path or '/'}"
+
+
+def _rows(data):
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict) and isinstance(data.get("data"), list):
+        return len(data["data"])
+    return None
+
+
+def _retry_after(resp, attempt):
+    value = (getattr(resp, "headers", None) or {}).get("Retry-After")
+    try:
+        wait = float(value)
+    except (TypeError, ValueError):
+        wait = BACKOFF_S * 2 ** attempt
+    return min(max(wait, 0.0), MAX_WAIT_S)
+
+
+def _log_path():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    return paths["logs"] / LOG_NAME if paths else None
+
+
+def _emit(rec):
+    with _lock:
+        CALLS.append(rec)
+        _fold(_totals, rec)
+        path = _log_path()
+        if path is not None:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec) + "\n")
+            except OSError:
+                pass  # telemetry must never break a run
+    for fn in list(_listeners.values()):
+        try:
+            fn(rec)
+        except Exception:
+            pass
+
+
+# ── Requests ─────────────────────────────────────────────────────
+_accept_encoding = None
+
+
+def accept_encoding():
+    """Content codings urllib3 can decode here, e.g. 'gzip,deflate,br'."""
+    global _accept_encoding
+    if _accept_encoding is None:
+        try:
+            from urllib3.util.request import ACCEPT_ENCODING
+            _accept_encoding = ACCEPT_ENCODING
+        except ImportError:
+            _accept_encoding = "gzip, deflate"
+    return _accept_encoding
+
+
+def decode(resp):
+    """Parse a response body (orjson if available); None if it isn't JSON."""
+    content = getattr(resp, "content", None)
+    try:
+        if isinstance(content, (bytes, bytearray)):
+            return _loads(content) if content else None
+        return resp.json()  # test transports without a raw body
+    except ValueError:
+        return None
+
+
+_sessions = {}
+_next_slot = {}
+_rate_lock = threading.Lock()
+
+
+def session(url):
+    """Shared requests.Session (connection pool) for url's scheme and host."""
+    import requests
+
+    parts = urlparse(url)
+    key = (parts.scheme, parts.netloc)
+    with _lock:
+        s = _sessions.get(key)
+        if s is None:
+            s = _sessions[key] = requests.Session()
+            s.mount(f"{parts.scheme}://", requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_SIZE,
+            ))
+    return s
+
+
+def set_rate_limit(host, per_second):
+    """Cap calls to host (e.g. "api.awin.com") across all threads; None removes it."""
+    with _rate_lock:
+        if per_second:
+            RATE_LIMITS[host] = float(per_second)
+        else:
+            RATE_LIMITS.pop(host, None)
+        _next_slot.pop(host, None)
+
+
+def _wait_for_slot(url, endpoint):
+    host = urlparse(url).netloc
+    with _rate_lock:
+        rate = RATE_LIMITS.get(host)
+        if not rate:
+            return
+        now = time.monotonic()
+        slot = max(_next_slot.get(host, now), now)
+        _next_slot[host] = slot + 1.0 / rate
+    if slot > now:
+        pace(slot - now, endpoint)
+
+
+def _send(method, url, endpoint, max_retries, kwargs):
+    """
+    Send with retries through the host's pooled session. Test transports
+    that patch requests.get / requests.post are called instead when
+    present. Returns (resp, retries, throttle, t0, t_attempt).
+    """
+    import requests
+
+    send = getattr(requests, method.lower())
+    if getattr(send, "__module__", None) == "requests.api":  # not patched
+        pooled = session(url)
+        send = lambda u, **kw: pooled.request(method.upper(), u, **kw)
+    kwargs["headers"] = {"Accept-Encoding": accept_encoding(), **(kwargs.get("headers") or {})}
+    retries, throttle = 0, 0.0
+    t0 = time.perf_counter()
+    while True:
+        _wait_for_slot(url, endpoint)
+        t_attempt = time.perf_counter()
+        try:
+            resp = send(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if retries >= max_retries:
+                _record(endpoint, method, None, t0, t_attempt, retries=retries,
+                        throttle=throttle, error=type(e).__name__)
+                raise
+            resp = None
+        status = getattr(resp, "status_code", None)
+        if resp is not None and (status not in RETRY_STATUSES or retries >= max_retries):
+            return resp, retries, throttle, t0, t_attempt
+        if resp is not None and hasattr(resp, "close"):
+            resp.close()
+        wait = _retry_after(resp, retries) if resp is not None else BACKOFF_S * 2 ** retries
+        time.sleep(wait)
+        throttle += wait
+        retries += 1
+
+
+def request(method, url, endpoint=None, api=None, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Send a request, retrying 429 / 5xx up to max_retries times.
+    Returns (response, parsed JSON or None).
+    """
+    endpoint = endpoint or endpoint_label(url, api)
+    resp, retries, throttle, t0, t_attempt = _send(method, url, endpoint, max_retries, kwargs)
+    data = decode(resp)
+    content = getattr(resp, "content", None)
+    _record(endpoint, method, resp, t0, t_attempt, rows=_rows(data),
+            nbytes=len(content) if isinstance(content, (bytes, bytearray)) else None,
+            retries=retries, throttle=throttle)
+    return resp, data
+
+
+def stream_rows(method, url, prefix="data.item", endpoint=None, api=None,
+                max_retries=MAX_RETRIES, error_prefix="API error", progress=None, **kwargs):
+    """
+    Yield the rows of a JSON response one at a time. prefix is an ijson
+    path: "data.item" for {"data": [...]}, "item" for a bare list. With
+    ijson installed the body is parsed incrementally as it downloads;
+    otherwise it is decoded in one go and the rows yielded from that.
+    A non-200 final status raises APIError(f"{error_prefix} {status}: ...").
+    Latency recorded for a streamed call includes the consumer's time.
+    If progress is a dict, progress["tell"] is set to a callable returning
+    the bytes received so far (for callers that cap a response's size).
+    """
+    endpoint = endpoint or endpoint_label(url, api)
+    resp, retries, throttle, t0, t_attempt = _send(
+        method, url, endpoint, max_retries, dict(kwargs, stream=True),
+    )
+    status = getattr(resp, "status_code", None)
+    if status != 200:
+        _record(endpoint, method, resp, t0, t_attempt, retries=retries, throttle=throttle)
+        raise APIError(f"{error_prefix} {status}: {getattr(resp, 'text', '')[:300]}", status)
+
+    raw = getattr(resp, "raw", None)
+    n = 0
+    try:
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        if ijson is not None and raw is not None and hasattr(raw, "read"):
+            raw.decode_content = True
+            rows = ijson.items(raw, prefix, use_float=True)
+            tell = raw.tell if hasattr(raw, "tell") else (lambda: 0)
+        else:
+            data = decode(resp)
+            rows = (data.get("data") or []) if isinstance(data, dict) else (data or [])
+            size = len(getattr(resp, "content", None) or b"")
+            tell = lambda: size
+        if progress is not None:
+            progress["tell"] = tell
+        for row in rows:
+            n += 1
+            yield row
+    finally:
+        wire = raw.tell() if raw is not None and hasattr(raw, "tell") else None
+        _record(endpoint, method, resp, t0, t_attempt, rows=n, wire_bytes=wire,
+                retries=retries, throttle=throttle, streamed=True)
+        if hasattr(resp, "close"):
+            resp.close()
+
+
+def _record(endpoint, method, resp, t0, t_attempt, rows=None, nbytes=None, wire_bytes=None,
+            retries=0, throttle=0.0, error=None, streamed=False):
+    now = time.perf_counter()
+    elapsed = getattr(resp, "elapsed", None)
+    headers = getattr(resp, "headers", None) or {}
+    if wire_bytes is None and headers.get("Content-Length"):
+        wire_bytes = int(headers["Content-Length"])
+    rec = {
+        "endpoint": endpoint,
+        "method": method.upper(),
+        "status": getattr(resp, "status_code", None),
+        "latency_s": round(now - t_attempt, 6),
+        "total_s": round(now - t0, 6),
+        # requests' elapsed stops when the response headers are parsed
+        "ttfb_s": round(elapsed.total_seconds(), 6) if elapsed is not None else None,
+        "bytes": nbytes,            # decoded body
+        "wire_bytes": wire_bytes,   # as transferred (compressed if encoded)
+        "encoding": headers.get("Content-Encoding"),
+        "rows": rows,
+        "retries": retries,
+        "throttle_s": round(throttle, 3),
+        "thread": threading.current_thread().name,
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+    }
+    if streamed:
+        rec["streamed"] = True
+    if error:
+        rec["error"] = error
+    _emit(rec)
+
+
+def pace(seconds, endpoint):
+    """Sleep between calls to one endpoint and count it as pacing time."""
+    time.sleep(seconds)
+    with _lock:
+        PACING[endpoint] = PACING.get(endpoint, 0.0) + seconds
+
+
+def on_record(fn, key=None):
+    """Register fn(record) to be called after every request (keyed like profiling.on_record)."""
+    _listeners[key if key is not None else id(fn)] = fn
+    return fn
+
+
+def clear():
+    with _lock:
+        CALLS.clear()
+        PACING.clear()
+        _totals.clear()
+
+
+# ── Aggregation ──────────────────────────────────────────────────
+def _pct(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def _sample(values, value, seen):
+    """Reservoir sampling: values stays a uniform sample of the `seen` values so far."""
+    if len(values) < LATENCY_SAMPLE:
+        values.append(value)
+    else:
+        i = _rng.randrange(seen)
+        if i < LATENCY_SAMPLE:
+            values[i] = value
+
+
+def _fold(totals, c):
+    """Add one call record to totals[endpoint] (constant work per call)."""
+    t = totals.get(c["endpoint"])
+    if t is None:
+        t = totals[c["endpoint"]] = {
+            "calls": 0, "errors": 0, "max_s": 0.0, "busy_s": 0.0, "rows": 0, "bytes": 0,
+            "wire": 0, "retries": 0, "throttle_s": 0.0, "lat": [], "ttfb": [], "n_ttfb": 0,
+        }
+    t["calls"] += 1
+    t["errors"] += c.get("status") != 200
+    t["max_s"] = max(t["max_s"], c["latency_s"])
+    t["busy_s"] += c["total_s"]
+    t["rows"] += c["rows"] or 0
+    t["bytes"] += c["bytes"] or c.get("wire_bytes") or 0
+    t["wire"] += c.get("wire_bytes") or 0
+    t["retries"] += c["retries"]
+    t["throttle_s"] += c["throttle_s"]
+    _sample(t["lat"], c["latency_s"], t["calls"])
+    if c.get("ttfb_s") is not None:
+        t["n_ttfb"] += 1
+        _sample(t["ttfb"], c["ttfb_s"], t["n_ttfb"])
+
+
+def summary(calls=None, api=None):
+    """
+    Per-endpoint aggregates: calls, errors, p50/p95 latency, p50 TTFB,
+    rows, MB, rows/s and MB/s (over time spent in requests), retries,
+    throttle waits and pacing sleeps. Read from the running totals of
+    every call so far, or aggregated from `calls` (records) when given.
+    api ("peec" / "awin") keeps that API's endpoints only.
+    """
+    if calls is None:
+        with _lock:
+            totals = {ep: dict(t, lat=list(t["lat"]), ttfb=list(t["ttfb"]))
+                      for ep, t in _totals.items()}
+    else:
+        totals = {}
+        for c in calls:
+            _fold(totals, c)
+    out = {}
+    for ep, t in sorted(totals.items()):
+        if api is not None and not ep.startswith(api + " "):
+            continue
+        busy = t["busy_s"] or None
+        rows, nbytes = t["rows"], t["bytes"]
+        out[ep] = {
+            "calls": t["calls"],
+            "errors": t["errors"],
+            "p50_s": round(_pct(t["lat"], 50), 4),
+            "p95_s": round(_pct(t["lat"], 95), 4),
+            "max_s": round(t["max_s"], 4),
+            "ttfb_p50_s": round(_pct(t["ttfb"], 50), 4) if t["ttfb"] else None,
+            "rows": rows,
+            "mb": round(nbytes / 2**20, 3),
+            "wire_mb": round(t["wire"] / 2**20, 3),
+            "rows_per_s": round(rows / busy, 1) if busy else None,
+            "mb_per_s": round(nbytes / 2**20 / busy, 3) if busy and nbytes else None,
+            "retries": t["retries"],
+            "throttle_s": round(t["throttle_s"], 3),
+            "busy_s": round(busy or 0, 3),
+            "paced_s": round(PACING.get(ep, 0.0), 3),
+        }
+    return out
+
+
+def format_summary(stats=None):
+    """Plain-text table of summary() for console output."""
+    stats = summary() if stats is None else stats
+    lines = [f"{'Endpoint':<40} {'calls':>5} {'err':>4} {'p50 s':>7} {'p95 s':>7} "
+             f"{'rows/s':>9} {'retry':>5} {'wait s':>7}"]
+    for ep, s in stats.items():
+        lines.append(
+            f"{ep:<40} {s['calls']:>5} {s['errors']:>4} {s['p50_s']:>7.3f} {s['p95_s']:>7.3f} "
+            f"{s['rows_per_s'] or 0:>9,.0f} {s['retries']:>5} {s['throttle_s'] + s['paced_s']:>7.2f}"
+        )
+    return "\n".join(lines)
+
+
+# ── Notebook panel ───────────────────────────────────────────────
+def _table_html(stats):
+    if not stats:
+        return '<div class="peec-sub">No API calls recorded yet.</div>'
+
+    def fmt(v, spec):
+        return "" if v is None else format(v, spec)
+
+    rows = "".join(
+        f"<tr><td>{ep}</td><td>{s['calls']}</td><td>{s['errors']}</td>"
+        f"<td>{fmt(s['p50_s'], '.3f')}</td><td>{fmt(s['p95_s'], '.3f')}</td>"
+        f"<td>{fmt(s['ttfb_p50_s'], '.3f')}</td><td>{s['rows']:,}</td>"
+        f"<td>{fmt(s['rows_per_s'], ',.0f')}</td><td>{fmt(s['mb'], ',.2f')}</td><td>{fmt(s['wire_mb'], ',.2f')}</td>"
+        f"<td>{s['retries']}</td><td>{s['throttle_s']:.2f}</td><td>{s['paced_s']:.2f}</td></tr>"
+        for ep, s in stats.items()
+    )
+    return (
+        '<div class="peec-scroll"><table><thead><tr><th>Endpoint</th><th>Calls</th>'
+        "<th>Errors</th><th>p50 s</th><th>p95 s</th><th>TTFB p50 s</th><th>Rows</th>"
+        "<th>Rows/s</th><th>MB</th><th>Wire MB</th><th>Retries</th><th>Throttle s</th><th>Paced s</th>"
+        f"</tr></thead><tbody>{rows}</tbody></table></div>"
+    )
+
+
+def panel(api=None):
+    """
+    Collapsed accordion with the per-endpoint summary (for one API, "peec"
+    or "awin", or both if api is None). Requests only mark it out of date;
+    it is redrawn when a profiling stage ends on the main thread (e.g. a
+    pull finishing), so a long harvest costs one redraw, not one per call,
+    and worker threads never touch the widget.
+    """
+    import ipywidgets as widgets
+    import profiling
+
+    table = widgets.HTML()
+    dirty = threading.Event()
+
+    def mark(rec):
+        if api is None or rec["endpoint"].startswith(api + " "):
+            dirty.set()
+
+    def refresh(stage_rec=None):
+        if stage_rec is not None and (
+                not dirty.is_set() or threading.current_thread() is not threading.main_thread()):
+            return
+        dirty.clear()
+        table.value = _table_html(summary(api=api))
+
+    on_record(mark, key=("panel", api))
+    profiling.on_record(refresh, key=("http_panel", api))
+    refresh()
+    box = widgets.Accordion(children=[table])
+    box.set_title(0, "\U0001f4e1 API calls")
+    box.selected_index = None
+    return box
@@ -0,0 +1,116 @@
+# journal.py — Checkpoint journal for long-range API fetches
+# Imported (not exec'd). A fetch made of units (Awin 31-day chunks, Peec
+# report pages) writes each unit's rows to PATHS["logs"]/journal/ as they
+# stream in; a unit only counts as done once all its rows are on disk. If
+# the fetch fails part-way, re-running it with the same parameters replays
+# the completed units from disk and only fetches the rest.
+#
+#   jr = Journal("awin_tx", {"advertiser_id": 1, "start": ..., "end": ...})
+#   for unit in units:
+#       for row in jr.replay_or_record(unit, lambda: fetch(unit)):
+#           ...
+#   jr.finish()       # whole fetch succeeded: drop the checkpoints
+#
+# Journals are keyed by a hash of (kind, params). Unfinished journals older
+# than MAX_AGE_H are discarded, so a stale partial backfill is not resumed
+# with out-of-date rows.
+
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+
+MAX_AGE_H = 24
+DIR_NAME = "journal"
+
+
+def _root():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    return paths["logs"] / DIR_NAME if paths else None
+
+
+def prune(root=None, max_age_h=MAX_AGE_H):
+    """Delete journals not touched for max_age_h hours."""
+    root = Path(root) if root else _root()
+    if root is None or not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age_h * 3600
+    n = 0
+    for d in root.iterdir():
+        if d.is_dir() and d.stat().st_mtime < cutoff:
+            shutil.rmtree(d, ignore_errors=True)
+            n += 1
+    return n
+
+
+class Journal:
+    """
+    Completed units of one fetch. With no workspace (PATHS unset) or
+    enabled=False it is a pass-through that records nothing.
+    """
+
+    def __init__(self, kind, params, root=None, enabled=True):
+        root = Path(root) if root else _root()
+        key = hashlib.sha1(json.dumps([kind, params], sort_keys=True, default=str)
+                           .encode("utf-8")).hexdigest()[:16]
+        self.kind = kind
+        self.enabled = enabled and root is not None
+        self.dir = root / f"{kind}_{key}" if root is not None else None
+        self.resumed = []   # units replayed from disk in this run
+        if self.enabled:
+            prune(root)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            meta = self.dir / "meta.json"
+            if not meta.exists():
+                with open(meta, "w", encoding="utf-8") as f:
+                    json.dump({"kind": kind, "params": params, "created": time.time()},
+                              f, default=str)
+
+    def _path(self, unit, suffix=".jsonl"):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(unit))
+        return self.dir / f"{safe}{suffix}"
+
+    def done(self, unit):
+        return self.enabled and self._path(unit).is_file()
+
+    def completed(self):
+        """Names of the units already on disk (sanitised file stems)."""
+        if not self.enabled:
+            return []
+        return sorted(p.stem for p in self.dir.glob("*.jsonl"))
+
+    def rows(self, unit):
+        """Replay a completed unit's rows."""
+        self.resumed.append(unit)
+        with open(self._path(unit), encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def record(self, unit, rows):
+        """
+        Pass rows through, writing each to disk; the unit is marked done
+        only when rows is exhausted (an error or early stop leaves it
+        incomplete, to be fetched again).
+        """
+        if not self.enabled:
+            yield from rows
+            return
+        partial = self._path(unit, ".partial")
+        with open(partial, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+                yield row
+        partial.replace(self._path(unit))
+
+    def replay_or_record(self, unit, fetch):
+        """Rows for unit: from disk if done, else fetch() recorded as it streams."""
+        if self.done(unit):
+            return self.rows(unit)
+        return self.record(unit, fetch())
+
+    def finish(self):
+        """The whole fetch succeeded: remove its checkpoints."""
+        if self.enabled:
+            shutil.rmtree(self.dir, ignore_errors=True)
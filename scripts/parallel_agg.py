@@ -0,0 +1,126 @@
+# parallel_agg.py — Process-pool groupby aggregation for large citation frames
+# Imported (not exec'd) so worker processes can unpickle the partition task.
+# Used via _grouped_agg() in cell_03 once a frame passes PARALLEL_AGG_MIN_ROWS.
+#
+# How it works:
+#   1. Every column the spec touches is encoded to a flat numeric array
+#      (strings are factorised to int codes, -1 = missing) and copied once
+#      into shared memory.
+#   2. Rows are hash-partitioned on the group key code; each worker attaches
+#      to the shared arrays, aggregates its own partition with pandas and
+#      returns the (small) per-group result.
+#   3. Partitions hold disjoint groups, so the results are concatenated,
+#      put back in sorted key order and decoded — identical to the output of
+#      df.groupby(key, as_index=False).agg(**spec).
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+SUPPORTED_FUNCS = {"sum", "mean", "first", "nunique", "count"}
+
+
+def supports(spec):
+    """True if every aggregation in spec can run on the parallel backend."""
+    return all(isinstance(f, str) and f in SUPPORTED_FUNCS for _, f in spec.values())
+
+
+def _encode(series, sort=False):
+    """
+    Return (array, uniques). Numeric columns pass through (uniques is None);
+    anything else is factorised to int64 codes with -1 for missing values.
+    """
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_object_dtype(series.dtype):
+        return np.ascontiguousarray(series.to_numpy()), None
+    codes, uniques = pd.factorize(series, sort=sort)
+    return codes.astype(np.int64, copy=False), pd.Index(uniques).array
+
+
+def _decode(values, uniques):
+    """Map float codes (NaN = missing) back to the original values."""
+    codes = np.where(np.isnan(values), -1, values).astype(np.int64)
+    return pd.api.extensions.take(uniques, codes, allow_fill=True)
+
+
+def _aggregate_partition(task):
+    """Worker: aggregate the rows whose key code hashes to this partition."""
+    part, n_parts, key_meta, col_meta, spec = task
+    handles = []
+
+    def _attach(meta):
+        name, dtype, length = meta
+        shm = shared_memory.SharedMemory(name=name)
+        handles.append(shm)
+        return np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+
+    try:
+        key = _attach(key_meta)
+        rows = np.flatnonzero((key >= 0) & (key % n_parts == part))
+        if len(rows) == 0:
+            return None
+        frame = {"_key": key[rows]}
+        for col, (meta, encoded) in col_meta.items():
+            values = _attach(meta)[rows]
+            if encoded:
+                # Codes as floats so missing values are NaN to pandas
+                values = np.where(values < 0, np.nan, values.astype(np.float64))
+            frame[col] = values
+        df = pd.DataFrame(frame)
+        return df.groupby("_key", as_index=False).agg(**spec)
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def groupby_agg(df, key, spec, workers=None, mp_context="spawn"):
+    """
+    Parallel equivalent of df.groupby(key, as_index=False).agg(**spec).
+
+    spec maps output name -> (column, func) with func in SUPPORTED_FUNCS.
+    Rows with a missing key are dropped, as pandas does by default.
+    """
+    workers = workers or os.cpu_count() or 1
+    columns = list(dict.fromkeys(col for col, _ in spec.values()))
+
+    key_codes, key_uniques = pd.factorize(df[key], sort=True)
+    key_codes = key_codes.astype(np.int64, copy=False)
+    key_uniques = pd.Index(key_uniques).array
+    arrays = {"_key": (key_codes, None)}
+    for col in columns:
+        arrays[col] = _encode(df[col])
+
+    segments = []
+    metas = {}
+    try:
+        for col, (arr, _) in arrays.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            metas[col] = (shm.name, arr.dtype.str, len(arr))
+
+        col_meta = {col: (metas[col], arrays[col][1] is not None) for col in columns}
+        tasks = [(i, workers, metas["_key"], col_meta, spec) for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context(mp_context)) as pool:
+            parts = [p for p in pool.map(_aggregate_partition, tasks) if p is not None]
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    if not parts:
+        return df.iloc[0:0].groupby(key, as_index=False).agg(**spec)
+
+    out = pd.concat(parts, ignore_index=True).sort_values("_key").reset_index(drop=True)
+    result = {key: pd.api.extensions.take(key_uniques, out["_key"].to_numpy())}
+    for name, (col, func) in spec.items():
+        values = out[name].to_numpy()
+        uniques = arrays[col][1]
+        if uniques is not None and func == "first":
+            values = _decode(values, uniques)
+        elif func in ("nunique", "count"):
+            values = values.astype(np.int64)
+        result[name] = values
+    return pd.DataFrame(result)
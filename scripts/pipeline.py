@@ -0,0 +1,321 @@
+# pipeline.py — Stage DAG with content-hash memoisation
+# Imported (not exec'd). Models the pipeline as stages with declared inputs
+# and outputs; a stage is skipped, and its memoised outputs reused, when the
+# content hash of its inputs matches the previous run.
+#
+#   stages = [
+#       Stage("domain_report", build_domain_report, inputs=["df_detail"],
+#             outputs=["df_domain_result"]),
+#       ...
+#   ]
+#   values = Pipeline(stages, cache_dir=PATHS["logs"] / "stage_cache").run(
+#       {"project_id": ..., "start": ..., "end": ...})
+#
+# Inputs are either context values passed to run() or outputs of other
+# stages. Memos live in-process (shared across re-exec'd cells) and, when
+# cache_dir is given, on disk so scheduled runs can reuse them.
+#
+# The notebook's cells are declared the same way (CELL_STAGES) but run
+# themselves: each records what it was built from when it publishes
+# (built()), and their prerequisite checks (require()) use Pipeline.stale
+# to warn when an upstream cell's result predates its own inputs.
+
+import hashlib
+import pickle
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# stage name -> (input hash, outputs); survives cells being re-exec'd
+_MEMO = {}
+
+
+# ── Hashing ──────────────────────────────────────────────────────
+def frame_fingerprint(df):
+    """
+    Content hash of a DataFrame (column names + cell values, index ignored).
+    Returns None for a missing frame so "never pulled" is distinct from "empty".
+    """
+    if df is None:
+        return None
+    import pandas as pd
+
+    h = hashlib.sha1()
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    h.update(str(len(df)).encode("utf-8"))
+    if len(df):
+        try:
+            h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        except TypeError:  # unhashable cells (lists/dicts)
+            h.update(pickle.dumps(df.reset_index(drop=True), protocol=4))
+    return h.hexdigest()
+
+
+def identity_key(value):
+    """
+    Cheap stand-in for fingerprint() for in-process checks: frames and other
+    objects by identity, scalars by value. Every pull publishes new frames,
+    so a new identity means a new input.
+    """
+    if isinstance(value, dict):
+        return tuple((k, identity_key(v)) for k, v in sorted(value.items(), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(identity_key(v) for v in value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return ("id", id(value))
+
+
+def fingerprint(value):
+    """Stable content hash for stage inputs: frames, containers and scalars."""
+    h = hashlib.sha1()
+    _feed(h, value)
+    return h.hexdigest()
+
+
+def _feed(h, value):
+    # pandas is only imported by callers that pass frames, so don't load it here
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        h.update(b"F" + str(frame_fingerprint(value)).encode("utf-8"))
+    elif pd is not None and isinstance(value, pd.Series):
+        h.update(b"S" + str(frame_fingerprint(value.to_frame())).encode("utf-8"))
+    elif isinstance(value, dict):
+        h.update(b"D%d" % len(value))
+        for k in sorted(value, key=repr):
+            _feed(h, k)
+            _feed(h, value[k])
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        h.update(b"L%d" % len(items))
+        for v in items:
+            _feed(h, v)
+    else:
+        h.update(b"V" + f"{type(value).__name__}:{value!r}".encode("utf-8"))
+
+
+# ── Stages ───────────────────────────────────────────────────────
+class Stage:
+    """
+    One node of the DAG. fn is called with the declared inputs as keyword
+    arguments and returns the single output, or a tuple matching outputs.
+    memo=False always re-runs (e.g. API pulls whose parameters don't
+    capture upstream changes). publish, if given, receives the outputs
+    dict whether the stage ran or was reused.
+    """
+
+    def __init__(self, name, fn, inputs, outputs, memo=True, publish=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.memo = memo
+        self.publish = publish
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+    def call(self, kwargs):
+        result = self.fn(**kwargs)
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        return dict(zip(self.outputs, result))
+
+
+class Pipeline:
+    """A set of stages run in dependency order, independent stages concurrently."""
+
+    def __init__(self, stages, cache_dir=None, workers=2, key=fingerprint, memos=None):
+        self.stages = {s.name: s for s in stages}
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.workers = workers
+        self.key = key                               # input hash function
+        self.memos = _MEMO if memos is None else memos
+        self.producer = {}
+        for s in stages:
+            for out in s.outputs:
+                if out in self.producer:
+                    raise ValueError(f"Output '{out}' produced by both '{self.producer[out]}' and '{s.name}'.")
+                self.producer[out] = s.name
+        self.report = []
+        self._check_acyclic()
+
+    def _deps(self, stage):
+        return {self.producer[i] for i in stage.inputs if i in self.producer}
+
+    def _check_acyclic(self):
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self._deps(self.stages[name]):
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
+
+    def _needed(self, targets):
+        """Stages required to produce the target stages (all if None)."""
+        if targets is None:
+            return set(self.stages)
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self._deps(self.stages[name]))
+        return needed
+
+    # ── Memo store ───────────────────────────────────────────────
+    def _cache_path(self, stage):
+        return self.cache_dir / f"{stage.name}.pkl"
+
+    def _load_memo(self, stage):
+        if stage.name in self.memos:
+            return self.memos[stage.name]
+        if self.cache_dir and self._cache_path(stage).is_file():
+            try:
+                with open(self._cache_path(stage), "rb") as f:
+                    self.memos[stage.name] = pickle.load(f)
+                return self.memos[stage.name]
+            except Exception:
+                return None  # unreadable cache just means a re-run
+        return None
+
+    def _save_memo(self, stage, key, outputs):
+        self.memos[stage.name] = (key, outputs)
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._cache_path(stage).with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump((key, outputs), f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp.replace(self._cache_path(stage))
+
+    # ── Execution ────────────────────────────────────────────────
+    def _run_stage(self, stage, values):
+        missing = [i for i in stage.inputs if i not in values]
+        if missing:
+            raise KeyError(f"Stage '{stage.name}' is missing inputs: {missing}")
+        kwargs = {i: values[i] for i in stage.inputs}
+        t = time.perf_counter()
+        key = self.key([stage.name, kwargs]) if stage.memo else None
+        memo = self._load_memo(stage) if stage.memo else None
+        if memo is not None and memo[0] == key:
+            outputs, status = memo[1], "cached"
+        else:
+            outputs, status = stage.call(kwargs), "ran"
+            if stage.memo:
+                self._save_memo(stage, key, outputs)
+        if stage.publish:
+            stage.publish(outputs)
+        return outputs, status, round(time.perf_counter() - t, 3)
+
+    def stale(self, context, names=None):
+        """Names of memoised stages (of names, default all) whose inputs
+        differ from their last run. Only stages whose inputs are all known
+        (context or memoised outputs) can be checked."""
+        values = dict(context)
+        for name, (key, outputs) in self.memos.items():
+            if name in self.stages:
+                values.update(outputs)
+        out = []
+        for stage in self.stages.values():
+            if names is not None and stage.name not in names:
+                continue
+            if all(i in values for i in stage.inputs):
+                memo = self._load_memo(stage)
+                key = self.key([stage.name, {i: values[i] for i in stage.inputs}])
+                if not stage.memo or memo is None or memo[0] != key:
+                    out.append(stage.name)
+        return out
+
+    def run(self, context, targets=None):
+        """
+        Run the stages needed for targets (default: all) and return the
+        context updated with every produced output. self.report lists
+        (stage, "ran" | "cached", seconds) in completion order.
+        """
+        values = dict(context)
+        pending = self._needed(targets)
+        self.report = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            while pending or running:
+                ready = [n for n in pending
+                         if not (self._deps(self.stages[n]) & (pending | set(running.values())))]
+                for name in ready:
+                    pending.discard(name)
+                    running[pool.submit(self._run_stage, self.stages[name], dict(values))] = name
+                if not running:
+                    raise RuntimeError(f"Unresolvable stages: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    outputs, status, secs = fut.result()
+                    values.update(outputs)
+                    self.report.append((name, status, secs))
+        return values
+
+
+# ── Notebook cells ───────────────────────────────────────────────
+# The cells as stages (no fn: each cell runs itself). Inputs and outputs are
+# __main__ globals; inputs no cell produces come from the session config.
+CELL_STAGES = [
+    Stage("cell_04", None, ["PROJECT_ID", "SESSION_START_DATE", "SESSION_END_DATE"],
+          ["df_detail"]),
+    Stage("cell_05", None, ["df_detail"], ["df_domain_result"]),
+    Stage("cell_06", None, ["df_detail"], ["df_url_result"]),
+    Stage("cell_07", None, ["ADVERTISER_ID", "SESSION_START_DATE", "SESSION_END_DATE"],
+          ["df_awin_tx"]),
+    Stage("cell_08", None, ["df_domain_result", "df_awin_tx"], ["df_matched"]),
+    Stage("cell_09", None, ["df_detail", "df_domain_result", "df_awin_tx"], ["df_enriched"]),
+    Stage("cell_10", None, ["df_detail", "df_domain_result", "df_awin_tx"], ["df_gap"]),
+]
+_CELL_MEMO = {}    # cell -> (identity key of its inputs, outputs it published)
+_CELL_INPUTS = {}  # cell -> the inputs themselves, so their ids can't be reused
+_cells = Pipeline(CELL_STAGES, key=identity_key, memos=_CELL_MEMO)
+
+
+def built(cell):
+    """Record that cell has just published its outputs from the current __main__ inputs."""
+    import __main__
+
+    stage = _cells.stages[cell]
+    inputs = _CELL_INPUTS[cell] = {i: getattr(__main__, i, None) for i in stage.inputs}
+    _cells._save_memo(stage, identity_key([cell, inputs]),
+                      {o: getattr(__main__, o, None) for o in stage.outputs})
+
+
+def stale_upstream(cell):
+    """Cells upstream of cell whose published results predate their inputs."""
+    import __main__
+
+    context = {i: getattr(__main__, i, None) for s in CELL_STAGES for i in s.inputs
+               if i not in _cells.producer}
+    upstream = _cells._needed([cell]) - {cell}
+    return sorted(_cells.stale(context, upstream))
+
+
+def require(names, cell, hint="Run earlier cells first."):
+    """
+    A cell's prerequisite check: raise if any of names is missing from
+    __main__, then warn if an upstream cell's result is out of date (e.g. a
+    new pull since the Domain Report ran). Returns the stale cells.
+    """
+    import __main__
+
+    for name in names:
+        if getattr(__main__, name, None) is None:
+            raise RuntimeError(f"Missing '{name}'. {hint}")
+    stale = stale_upstream(cell)
+    if stale and not getattr(__main__, "HEADLESS", False):
+        cells = ", ".join(c.replace("_", " ") for c in stale)
+        print(f"\u26a0\ufe0f Out of date: {cells} ran before its inputs last changed. "
+              f"Re-run {'it' if len(stale) == 1 else 'them'} first for current results.")
+    return stale
@@ -0,0 +1,242 @@
+# profiling.py — Per-stage timing / memory instrumentation
+# Imported (not exec'd). Cells 04–10 wrap each stage (API calls, row
+# building, groupbys, to_csv, to_html) in stage(); every record holds wall
+# time, CPU time, memory and row count, is appended as one JSON line to
+# PATHS["logs"]/profile.jsonl, and shows up in the cells' Profile panels.
+#
+#   with profiling.stage("domain_groupby", cell="cell_05") as rec:
+#       agg = ...
+#       rec["rows"] = len(agg)
+#
+# Memory: RSS (current and process peak) is always recorded. Per-stage peak
+# Python/numpy allocations via tracemalloc are recorded when
+# PEEC_PROFILE_MEMORY=1, as tracing slows allocation-heavy code.
+#
+# chrome_trace(path) writes the recorded stages as a Chrome trace
+# (open in chrome://tracing or https://ui.perfetto.dev).
+
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_MEMORY = os.environ.get("PEEC_PROFILE_MEMORY") == "1"
+RUN_ID = datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+LOG_NAME = "profile.jsonl"
+
+EVENTS = []
+_listeners = {}
+_lock = threading.Lock()
+_T0 = time.perf_counter()
+_EPOCH = time.time()
+
+
+# ── Memory probes ────────────────────────────────────────────────
+def _rss_mb():
+    """Current resident set size in MB (None if unavailable)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb():
+    """Process-lifetime peak RSS in MB (None if unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+# ── Recording ────────────────────────────────────────────────────
+def _log_path():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    return paths["logs"] / LOG_NAME if paths else None
+
+
+def _emit(rec):
+    with _lock:
+        EVENTS.append(rec)
+        path = _log_path()
+        if path is not None:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec) + "\n")
+            except OSError:
+                pass  # profiling must never break a run
+    for fn in list(_listeners.values()):
+        try:
+            fn(rec)
+        except Exception:
+            pass
+
+
+@contextlib.contextmanager
+def stage(name, cell=None, rows=None, **extra):
+    """
+    Time a block. Yields the record dict so the caller can set "rows" (or
+    other fields) once known. Records are emitted even if the block raises.
+    """
+    rec = {"run_id": RUN_ID, "stage": name, "cell": cell, "rows": rows, **extra}
+    tracing = TRACE_MEMORY and _start_tracemalloc()
+    rss0 = _rss_mb()
+    cpu0 = time.thread_time()
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        rec["start_s"] = round(t0 - _T0, 6)
+        rec["wall_s"] = round(time.perf_counter() - t0, 6)
+        rec["cpu_s"] = round(time.thread_time() - cpu0, 6)
+        rss1 = _rss_mb()
+        rec["rss_mb"] = None if rss1 is None else round(rss1, 1)
+        rec["rss_delta_mb"] = None if rss0 is None or rss1 is None else round(rss1 - rss0, 1)
+        peak = _peak_rss_mb()
+        if peak is not None and rss1 is not None:
+            peak = max(peak, rss1)  # ru_maxrss can lag the current sample
+        rec["peak_rss_mb"] = None if peak is None else round(peak, 1)
+        if tracing:
+            import tracemalloc
+            rec["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        rec["thread"] = threading.current_thread().name
+        rec["ts"] = datetime.now().isoformat(timespec="milliseconds")
+        _emit(rec)
+
+
+def _start_tracemalloc():
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return True
+
+
+def instrument(name, cell=None, rows=len):
+    """Decorator form of stage(); rows(result) sets the row count."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name, cell=cell) as rec:
+                result = fn(*args, **kwargs)
+                if rows is not None and result is not None:
+                    try:
+                        rec["rows"] = rows(result)
+                    except TypeError:
+                        pass
+                return result
+        return inner
+    return wrap
+
+
+def on_record(fn, key=None):
+    """
+    Register fn(record) to be called after every stage. A later listener
+    with the same key replaces the earlier one (e.g. when a cell is re-run).
+    """
+    _listeners[key if key is not None else id(fn)] = fn
+    return fn
+
+
+def clear():
+    with _lock:
+        EVENTS.clear()
+
+
+# ── Chrome trace export ──────────────────────────────────────────
+def chrome_trace(path, events=None):
+    """Write events (default: this session's) in Chrome trace event format."""
+    events = EVENTS if events is None else events
+    tids = {}
+    trace = []
+    for e in events:
+        tid = tids.setdefault(e.get("thread", "main"), len(tids) + 1)
+        args = {k: e[k] for k in ("cell", "rows", "cpu_s", "rss_mb", "rss_delta_mb",
+                                  "peak_alloc_mb", "error") if e.get(k) is not None}
+        trace.append({
+            "name": e["stage"], "cat": e.get("cell") or "stage", "ph": "X",
+            "ts": int((_EPOCH + e["start_s"]) * 1e6) if "start_s" in e else 0,
+            "dur": int(e["wall_s"] * 1e6), "pid": 1, "tid": tid, "args": args,
+        })
+    for name, tid in tids.items():
+        trace.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                      "args": {"name": name}})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+    return path
+
+
+# ── Notebook panel ───────────────────────────────────────────────
+def _table_html(events):
+    if not events:
+        return '<div class="peec-sub">No stages recorded yet.</div>'
+
+    def fmt(v, spec):
+        return "" if v is None else format(v, spec)
+
+    rows = "".join(
+        f"<tr><td>{e['stage']}</td><td>{fmt(e.get('rows'), ',')}</td>"
+        f"<td>{fmt(e['wall_s'], '.3f')}</td><td>{fmt(e['cpu_s'], '.3f')}</td>"
+        f"<td>{fmt(e.get('rss_mb'), ',.0f')}</td><td>{fmt(e.get('rss_delta_mb'), '+,.1f')}</td>"
+        f"<td>{fmt(e.get('peak_alloc_mb'), ',.1f')}</td><td>{e.get('error', '')}</td></tr>"
+        for e in events
+    )
+    return (
+        '<div class="peec-scroll"><table><thead><tr><th>Stage</th><th>Rows</th><th>Wall s</th>'
+        "<th>CPU s</th><th>RSS MB</th><th>\u0394RSS MB</th><th>Peak alloc MB</th><th>Error</th>"
+        f"</tr></thead><tbody>{rows}</tbody></table></div>"
+    )
+
+
+def panel(cell=None, last=20):
+    """
+    Collapsed accordion listing the latest stage records (for one cell, or
+    all cells if cell is None). Refreshes itself as new stages complete.
+    """
+    import ipywidgets as widgets
+
+    table = widgets.HTML()
+    trace_btn = widgets.Button(description="  Chrome trace", icon="download",
+                               layout=widgets.Layout(width="160px"))
+    note = widgets.HTML("")
+
+    def refresh(rec=None):
+        if rec is not None and cell is not None and rec.get("cell") != cell:
+            return
+        events = [e for e in EVENTS if cell is None or e.get("cell") == cell]
+        table.value = _table_html(events[-last:])
+
+    def on_trace(b):
+        path = _log_path()
+        if path is None:
+            note.value = "\u26a0\ufe0f Set up the workspace first."
+            return
+        out = chrome_trace(path.with_name(f"trace_{RUN_ID}.json"))
+        note.value = f"\u2705 Trace saved to {out} \u2014 open in chrome://tracing or ui.perfetto.dev"
+
+    trace_btn.on_click(on_trace)
+    on_record(refresh, key=("panel", cell))
+    refresh()
+    box = widgets.Accordion(children=[widgets.VBox([table, widgets.HBox([trace_btn, note])])])
+    box.set_title(0, "\u23f1 Profile")
+    box.selected_index = None
+    return box
@@ -0,0 +1,145 @@
+# report_memo.py — Bounded LRU of report results per (dataset, filter state)
+# Imported (not exec'd). The reactive filters in cells 05, 06, 09 and 10
+# recompute and re-render on every change; toggling back to a filter state
+# seen recently (Model = All <-> one model) is served from here instead:
+#
+#   memo = report_memo.memo("domain_report")
+#   key = memo.key([df_detail], casefold=("prompt_query",), model=..., prompt_query=...)
+#   hit = memo.get(key)           # None on a miss
+#   ...
+#   memo.put(key, (agg, html))
+#
+# Datasets are identified by frame: each frame object gets a token on first
+# sight (tracked by weakref), and every pull publishes new frames. Entries
+# whose frames have been replaced can never match again; they are dropped
+# once those frames are freed, and cell 04 calls invalidate() as soon as a
+# new pull is published, so they never linger.
+# Memos are registered on the module, so they survive cells being re-exec'd.
+
+import itertools
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+MAX_ENTRIES = 16   # per report
+MAX_MB = 256       # per report, estimated from frame + HTML sizes
+
+_tokens = {}       # id(frame) -> (weakref, token)
+_counter = itertools.count(1)
+_lock = threading.Lock()
+_memos = {}
+
+
+def _token(frame):
+    """Token for one frame object: stable while it lives, never reused."""
+    if frame is None:
+        return 0
+    entry = _tokens.get(id(frame))
+    if entry is not None and entry[0]() is frame:
+        return entry[1]
+    token = next(_counter)
+    _tokens[id(frame)] = (weakref.ref(frame), token)
+    return token
+
+
+def _normalise(value, fold=False):
+    if isinstance(value, str):
+        value = value.strip()
+        return value.lower() if fold else value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted((_normalise(v, fold) for v in value), key=repr))
+    return value
+
+
+def _size_mb(value):
+    """Rough size of a cached value (frames, strings and tuples of them)."""
+    pd = sys.modules.get("pandas")
+    if isinstance(value, (tuple, list)):
+        return sum(_size_mb(v) for v in value)
+    if pd is not None and isinstance(value, pd.DataFrame):
+        return float(value.memory_usage(index=False, deep=False).sum()) / 2**20
+    if isinstance(value, str):
+        return len(value) / 2**20
+    return 0.0
+
+
+class ReportMemo:
+    """LRU of one report's results, bounded by entry count and estimated MB."""
+
+    def __init__(self, name, max_entries=MAX_ENTRIES, max_mb=MAX_MB):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_mb = max_mb
+        self.data = OrderedDict()   # key -> (value, mb)
+        self.mb = 0.0
+        self.hits = self.misses = 0
+
+    def key(self, frames, casefold=(), **state):
+        """
+        Key for the result of filtering `frames` with `state`. Strings are
+        stripped (and lower-cased for the casefold names, the filters that
+        ignore case) and collections sorted, so equivalent states match.
+        """
+        with _lock:
+            tokens = tuple(_token(f) for f in frames)
+        return tokens, tuple(sorted((k, _normalise(v, k in casefold)) for k, v in state.items()))
+
+    def get(self, key):
+        with _lock:
+            self._purge()
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        mb = _size_mb(value)
+        with _lock:
+            if key in self.data:
+                self.mb -= self.data.pop(key)[1]
+            if mb > self.max_mb:
+                return
+            self.data[key] = (value, mb)
+            self.mb += mb
+            while len(self.data) > self.max_entries or self.mb > self.max_mb:
+                self.mb -= self.data.popitem(last=False)[1][1]
+
+    def _purge(self):
+        """Drop entries computed from frames that no longer exist."""
+        for fid in [fid for fid, (ref, _) in _tokens.items() if ref() is None]:
+            del _tokens[fid]
+        live = {0} | {t for _, t in _tokens.values()}
+        for key in [k for k in self.data if not live.issuperset(k[0])]:
+            self.mb -= self.data.pop(key)[1]
+
+    def clear(self):
+        with _lock:
+            self.data.clear()
+            self.mb = 0.0
+
+    def stats(self):
+        return {"entries": len(self.data), "mb": round(self.mb, 1),
+                "hits": self.hits, "misses": self.misses}
+
+
+def memo(name, **kwargs):
+    """The shared ReportMemo for a report (created on first use)."""
+    with _lock:
+        if name not in _memos:
+            _memos[name] = ReportMemo(name, **kwargs)
+        return _memos[name]
+
+
+def invalidate():
+    """Empty every memo (a new pull has landed)."""
+    for m in list(_memos.values()):
+        m.clear()
+
+
+def stats():
+    """Entries, size and hit/miss counts per report."""
+    return {name: m.stats() for name, m in _memos.items()}
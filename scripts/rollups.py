@@ -0,0 +1,275 @@
+# rollups.py — Per-day citation / transaction facts with materialised rollups
+# Imported (not exec'd). The reports in cells 05–10 total the whole date
+# range; this keeps per-day facts per domain so trends can be read without
+# re-pulling every window:
+#
+#   citations_day     (project_id, day, domain)    citations
+#   transactions_day  (advertiser_id, day, domain) transactions, sales, commission
+#
+# plus _week (periods start on Monday) and _month rollups of each, stored
+# alongside in a SQLite file (default PATHS["output"]/rollups.sqlite).
+# Ingesting days only re-aggregates the weeks / months those days fall in.
+#
+#   with rollups.RollupStore() as store:
+#       rollups.ingest_peec(peec, project_id, "2026-01-01", "2026-03-31", store)
+#       rollups.ingest_awin(df_awin_tx, advertiser_id, "2026-01-01", "2026-03-31", store)
+#       weekly = store.trend("week")   # citations vs revenue, matched domains
+#
+# Peec days already stored are not fetched again, except the last
+# REFRESH_DAYS before today, whose numbers may still be filling in. Awin
+# days are taken from a frame that was pulled anyway (df_awin_tx), so every
+# day in its range is replaced. Domains are normalised hosts (see
+# hostnames.py), the same keys cell 08 matches on.
+
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+STORE_NAME = "rollups.sqlite"
+GRAINS = ("day", "week", "month")
+REFRESH_DAYS = 2
+WORKERS = 8
+CHUNK = 500  # parameters per IN (...) list
+
+# SQL period of a YYYY-MM-DD day per grain
+_PERIOD = {
+    "day": "day",
+    "week": "date(day, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', day)",
+}
+_FACTS = {
+    "citations": ("project_id", ["citations"]),
+    "transactions": ("advertiser_id", ["transactions", "sales", "commission"]),
+}
+
+
+def _schema():
+    sql = ["CREATE TABLE IF NOT EXISTS ingested (source TEXT, scope TEXT, day TEXT, "
+           "ingested_at REAL, PRIMARY KEY (source, scope, day));"]
+    for fact, (scope, measures) in _FACTS.items():
+        cols = ", ".join(f"{m} REAL" for m in measures)
+        for grain in GRAINS:
+            key = "day" if grain == "day" else "period"
+            sql.append(f"CREATE TABLE IF NOT EXISTS {fact}_{grain} ({scope} TEXT, {key} TEXT, "
+                       f"domain TEXT, {cols}, PRIMARY KEY ({scope}, {key}, domain));")
+    return "\n".join(sql)
+
+
+def _default_path():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    if not paths:
+        raise RuntimeError("Missing 'PATHS'. Run the session config cell first, or pass a path.")
+    return paths["output"] / STORE_NAME
+
+
+def _period(grain, day):
+    """The period a YYYY-MM-DD day falls in (same as _PERIOD[grain] in SQL)."""
+    d = date.fromisoformat(day)
+    if grain == "week":
+        d -= timedelta(days=d.weekday())
+    elif grain == "month":
+        d = d.replace(day=1)
+    return d.isoformat()
+
+
+def _chunks(items, n=CHUNK):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _days(start_date, end_date):
+    d, end = date.fromisoformat(str(start_date)[:10]), date.fromisoformat(str(end_date)[:10])
+    out = []
+    while d <= end:
+        out.append(d.isoformat())
+        d += timedelta(days=1)
+    return out
+
+
+# ── Store ────────────────────────────────────────────────────────
+class RollupStore:
+    """SQLite file of daily facts and their week / month rollups. One thread."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else _default_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(_schema())
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ingested_days(self, fact, scope):
+        return {r[0] for r in self.db.execute(
+            "SELECT day FROM ingested WHERE source = ? AND scope = ?", (fact, str(scope)))}
+
+    def missing_days(self, fact, scope, start_date, end_date, today=None):
+        """Days of the range not stored yet, plus any in the refresh window."""
+        have = self.ingested_days(fact, scope)
+        fresh = ((today or date.today()) - timedelta(days=REFRESH_DAYS)).isoformat()
+        return [d for d in _days(start_date, end_date) if d not in have or d >= fresh]
+
+    def put(self, fact, scope, days, rows):
+        """
+        Replace the facts of `days` for one project / advertiser with rows
+        ((day, domain, *measures) tuples) and refresh the rollups of the
+        periods they fall in. A day with no rows is stored as empty.
+        """
+        scope_col, measures = _FACTS[fact]
+        scope, days = str(scope), sorted(set(days))
+        if not days:
+            return 0
+        with self.db:
+            for chunk in _chunks(days):
+                self.db.execute(f"DELETE FROM {fact}_day WHERE {scope_col} = ? "
+                                f"AND day IN ({','.join('?' * len(chunk))})", [scope, *chunk])
+            self.db.executemany(
+                f"INSERT INTO {fact}_day VALUES (?, ?, ?{', ?' * len(measures)})",
+                ((scope, *r) for r in rows),
+            )
+            now = time.time()
+            self.db.executemany("INSERT OR REPLACE INTO ingested VALUES (?, ?, ?, ?)",
+                                ((fact, scope, d, now) for d in days))
+            for grain in GRAINS[1:]:
+                self._refresh(fact, grain, scope, days)
+        return len(days)
+
+    def _refresh(self, fact, grain, scope, days):
+        """Re-aggregate the grain's periods that contain any of days."""
+        scope_col, measures = _FACTS[fact]
+        period = _PERIOD[grain]
+        sums = ", ".join(f"SUM({m})" for m in measures)
+        for chunk in _chunks(sorted({_period(grain, d) for d in days})):
+            marks = ",".join("?" * len(chunk))
+            self.db.execute(f"DELETE FROM {fact}_{grain} WHERE {scope_col} = ? "
+                            f"AND period IN ({marks})", [scope, *chunk])
+            self.db.execute(
+                f"INSERT INTO {fact}_{grain} SELECT {scope_col}, {period} AS p, domain, {sums} "
+                f"FROM {fact}_day WHERE {scope_col} = ? AND p IN ({marks}) "
+                f"GROUP BY {scope_col}, p, domain",
+                [scope, *chunk],
+            )
+
+    def facts(self, fact, grain="day", scope=None, start_date=None, end_date=None):
+        """
+        One fact table at a grain as a DataFrame (Period, Domain, measures),
+        summed over projects / advertisers unless scope is given.
+        """
+        import pandas as pd
+
+        scope_col, measures = _FACTS[fact]
+        key = "day" if grain == "day" else "period"
+        where, args = [], []
+        if scope is not None:
+            where.append(f"{scope_col} = ?")
+            args.append(str(scope))
+        if start_date:
+            where.append(f"{key} >= ?")
+            args.append(str(start_date)[:10])
+        if end_date:
+            where.append(f"{key} <= ?")
+            args.append(str(end_date)[:10])
+        q = (f"SELECT {key}, domain, {', '.join(f'SUM({m})' for m in measures)} "
+             f"FROM {fact}_{grain}" + (" WHERE " + " AND ".join(where) if where else "")
+             + f" GROUP BY {key}, domain ORDER BY {key}, domain")
+        return pd.DataFrame(self.db.execute(q, args).fetchall(),
+                            columns=["Period", "Domain", *(m.title() for m in measures)])
+
+    def trend(self, grain="week", project_id=None, advertiser_id=None, matched_only=True,
+              domains=None, start_date=None, end_date=None):
+        """
+        Citations vs transactions per period and domain, read from the
+        rollups: Period, Domain, Citations, Transactions, Sales, Commission.
+        matched_only keeps domains with both citations and transactions in
+        the period (cell 08's exact-host match); otherwise missing sides are 0.
+        """
+        cites = self.facts("citations", grain, project_id, start_date, end_date)
+        tx = self.facts("transactions", grain, advertiser_id, start_date, end_date)
+        df = cites.merge(tx, on=["Period", "Domain"], how="inner" if matched_only else "outer")
+        if domains is not None:
+            import hostnames
+            df = df[df["Domain"].isin(set(hostnames.normalise(list(domains), "host")))]
+        df = df.fillna(0).sort_values(["Period", "Domain"], kind="mergesort")
+        df["Transactions"] = df["Transactions"].astype(int)
+        df["Citations"] = df["Citations"].astype(int)
+        return df.reset_index(drop=True)
+
+
+# ── Ingestion ────────────────────────────────────────────────────
+def ingest_peec(client, project_id, start_date, end_date, store, workers=WORKERS,
+                status=print):
+    """
+    Fetch the URL report for each day of the range not yet stored (one
+    concurrent fetch_reports round) and store citations per domain per day.
+    Returns the number of days ingested.
+    """
+    import __main__
+    import hostnames
+    import profiling
+
+    todo = store.missing_days("citations", project_id, start_date, end_date)
+    if not todo:
+        status(f"\u2705 Rollups: Peec {project_id} up to date")
+        return 0
+    report_spec = __main__.report_spec  # cell 03
+    specs = {report_spec("urls", d, d, project_id=project_id): d for d in todo}
+
+    def cited(r):
+        return (hostnames.normalise_one(r.get("urlNormalized") or r.get("url", ""), "host"),
+                r.get("usage_count", 0) or 0)
+
+    with profiling.stage("rollup_peec", cell="rollups") as rec:
+        status(f"\u23f3 Rollups: fetching {len(todo)} Peec day(s) for {project_id}...")
+        reports = client.fetch_reports(list(specs), workers=workers,
+                                       transforms=dict.fromkeys(specs, cited))
+        rows = []
+        for spec, day in specs.items():
+            totals = {}
+            for domain, n in reports.pop(spec):
+                if domain:
+                    totals[domain] = totals.get(domain, 0) + n
+            rows += [(day, d, n) for d, n in totals.items()]
+        rec["rows"] = len(rows)
+        store.put("citations", project_id, todo, rows)
+    return len(todo)
+
+
+def ingest_awin(df_awin_tx, advertiser_id, start_date, end_date, store, status=print):
+    """
+    Store transactions, sales and commission per publisher domain per day
+    from a pulled transactions frame, replacing every day of its range.
+    Returns the number of days ingested.
+    """
+    import hostnames
+    import profiling
+
+    days = _days(start_date, end_date)
+    with profiling.stage("rollup_awin", cell="rollups") as rec:
+        rows = []
+        if df_awin_tx is not None and not df_awin_tx.empty:
+            df = df_awin_tx[["Transaction Date", "Publisher Domain", "Sale Amount",
+                             "Commission Amount"]].dropna(subset=["Transaction Date"])
+            df = df.assign(day=df["Transaction Date"].dt.strftime("%Y-%m-%d"),
+                           domain=hostnames.normalise(df["Publisher Domain"], "host"))
+            df = df[df["day"].isin(set(days)) & (df["domain"] != "")]
+            g = df.groupby(["day", "domain"], sort=False).agg(
+                transactions=("Sale Amount", "size"),
+                sales=("Sale Amount", "sum"),
+                commission=("Commission Amount", "sum"),
+            )
+            rows = [(d, dom, int(n), round(s, 2), round(c, 2))
+                    for (d, dom), n, s, c in zip(g.index, g["transactions"], g["sales"],
+                                                 g["commission"])]
+        rec["rows"] = len(rows)
+        store.put("transactions", advertiser_id, days, rows)
+    status(f"\u2705 Rollups: Awin {advertiser_id}, {len(days)} day(s), {len(rows):,} domain-days")
+    return len(days)
@@ -0,0 +1,697 @@
+# run_pipeline.py — Headless batch runner for the full Peec → Awin pipeline
+# Runs config → Peec pull ‖ Awin pull → domain/URL reports → enrichment →
+# gap analysis without a browser, writing the same CSVs as the notebook.
+#
+# Usage:
+#   python scripts/run_pipeline.py --project-id <id> --advertiser-id 4567 \
+#       --start 2026-01-01 --end 2026-01-31
+#   python scripts/run_pipeline.py --config nightly.json
+#   python scripts/run_pipeline.py --pairs projA:4567 projA:8910 projB:4567 \
+#       --scope both --rate-limit api.awin.com=2
+#
+# The config file is a JSON object using the flag names with underscores,
+# e.g. {"project_id": "...", "advertiser_id": 4567, "start": "2026-01-01"}.
+# Flags given on the command line override values from the config file.
+#
+# Cells are exec'd with HEADLESS = True, so they build their widgets but do
+# not display them. Stages (see STAGES) call the cells' build functions and
+# are run as a DAG by pipeline.py: report stages whose inputs are unchanged
+# since the last run reuse their memoised outputs from logs/stage_cache.
+# Per-stage timings and memory go to logs/profile.jsonl (see profiling.py);
+# --trace also writes them as a Chrome trace. Per-request API metrics go to
+# logs/http.jsonl and are summarised per endpoint (see http_telemetry.py).
+# API pulls checkpoint each completed chunk / report in logs/journal (see
+# journal.py): re-running after a failed pull resumes where it stopped;
+# --fresh discards those checkpoints first.
+#
+# Fan-out: with --pairs (or --project-ids x --advertiser-ids) every distinct
+# project and advertiser is pulled concurrently, sharing each host's
+# connection pool and rate limit (see http_telemetry.py). The pulled frames
+# are written tagged with "Project ID" / "Advertiser ID"; the report stages
+# then run within each pair (output/<project>_<advertiser>/) and/or across
+# all pairs combined (output/all/), per --scope.
+# --chats also downloads each project's AI chat contents for the range into
+# output/chats.sqlite (see chat_store.py).
+# --rollups adds the range's per-day citations and transactions to
+# output/rollups.sqlite and writes output/trend_weekly.csv (see rollups.py).
+# --diff compares each pull with the previous run's snapshot of the same
+# project / advertiser and writes only what changed (see snapshots.py).
+
+import argparse
+import json
+import os
+import sys
+import re
+import threading
+import time
+import __main__
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+import http_telemetry
+import journal
+import pipeline
+import profiling
+
+DEFAULTS = {
+    "project_id": None,
+    "project_name": None,
+    "advertiser_id": None,
+    "start": None,
+    "end": None,
+    "workspace": "peec_awin_workspace",
+    "env_file": None,
+    "awin_status": None,
+    "domain_types": [],
+    "exclude": "",
+    "gap_top_n": 0,
+    "gap_rank_by": "Opportunity Score",
+    "no_cache": False,
+    "peec_base_url": None,
+    "awin_base_url": None,
+    "trace": False,
+    "fresh": False,
+    "pairs": [],
+    "project_ids": [],
+    "advertiser_ids": [],
+    "scope": "within",
+    "workers": 8,
+    "rate_limits": {},
+    "chats": False,
+    "rollups": False,
+    "diff": False,
+}
+
+
+# ── Config ───────────────────────────────────────────────────────
+def _parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run the Peec AI x Awin pipeline headless.")
+    p.add_argument("--config", help="JSON config file (flags override its values)")
+    p.add_argument("--project-id", help="Peec project ID")
+    p.add_argument("--project-name", help="Label used in output (default: project ID)")
+    p.add_argument("--advertiser-id", type=int, help="Awin advertiser ID")
+    p.add_argument("--start", help="Start date YYYY-MM-DD (default: 30 days ago)")
+    p.add_argument("--end", help="End date YYYY-MM-DD (default: today)")
+    p.add_argument("--workspace", help="Workspace folder (output/ and logs/ are created inside)")
+    p.add_argument("--env-file", help=".env file with PEEC_API_KEY and AWAPI")
+    p.add_argument("--awin-status", choices=["pending", "approved", "declined", "deleted"],
+                   help="Only pull Awin transactions with this status")
+    p.add_argument("--domain-types", nargs="*", help="Enriched report domain type filter")
+    p.add_argument("--exclude", help="Comma-separated keywords to exclude from enriched/gap reports")
+    p.add_argument("--gap-top-n", type=int, help="Keep only the top N gap URLs (0 = all)")
+    p.add_argument("--gap-rank-by", choices=["Opportunity Score", "Domain Total Citations"])
+    p.add_argument("--no-cache", action="store_true", default=None,
+                   help="Re-run every stage instead of reusing memoised outputs")
+    p.add_argument("--peec-base-url", help="Peec API base URL (e.g. a local stub server)")
+    p.add_argument("--awin-base-url", help="Awin API base URL (e.g. a local stub server)")
+    p.add_argument("--trace", action="store_true", default=None,
+                   help="Also write stage timings as a Chrome trace (logs/trace_<run>.json)")
+    p.add_argument("--fresh", action="store_true", default=None,
+                   help="Discard checkpoints left by failed pulls instead of resuming them")
+    p.add_argument("--pairs", nargs="+", metavar="PROJECT:ADVERTISER",
+                   help="Fan-out: Peec project / Awin advertiser pairs to pull and report on")
+    p.add_argument("--project-ids", nargs="+",
+                   help="Fan-out: Peec projects, paired with every --advertiser-ids entry")
+    p.add_argument("--advertiser-ids", nargs="+", type=int,
+                   help="Fan-out: Awin advertisers, paired with every --project-ids entry")
+    p.add_argument("--scope", choices=["within", "across", "both"],
+                   help="Fan-out reports per pair, across all pairs, or both (default: within)")
+    p.add_argument("--workers", type=int, help="Fan-out: concurrent pulls (default: 8)")
+    p.add_argument("--rate-limit", action="append", metavar="HOST=PER_SECOND",
+                   help="Cap requests per second to a host, e.g. api.awin.com=2 (repeatable)")
+    p.add_argument("--chats", action="store_true", default=None,
+                   help="Also download the range's chat contents into output/chats.sqlite")
+    p.add_argument("--rollups", action="store_true", default=None,
+                   help="Also update the daily/weekly/monthly rollups in output/rollups.sqlite")
+    p.add_argument("--diff", action="store_true", default=None,
+                   help="Compare the pulls with the previous run's and write the changes")
+    p.add_argument("--check-imports", action="store_true",
+                   help="Measure module and cell import times against the budgets and exit")
+    p.add_argument("--check-paging", action="store_true",
+                   help="Page a stub API serving small pages, check no rows are lost and exit")
+    args = p.parse_args(argv)
+    if args.check_imports:
+        return {"check_imports": True}
+    if args.check_paging:
+        return {"check_paging": True}
+
+    cfg = dict(DEFAULTS)
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            cfg.update(json.load(f))
+    cfg.update({k: v for k, v in vars(args).items()
+                if k not in ("config", "check_imports", "check_paging", "rate_limit") and v is not None})
+    for item in args.rate_limit or []:
+        host, _, rate = item.partition("=")
+        try:
+            cfg["rate_limits"] = {**cfg["rate_limits"], host.strip(): float(rate)}
+        except ValueError:
+            p.error(f"--rate-limit expects HOST=PER_SECOND, got {item!r}")
+
+    try:
+        cfg["pairs"] = _fanout_pairs(cfg)
+    except ValueError as e:
+        p.error(str(e))
+    if cfg["pairs"]:
+        cfg["project_id"], cfg["advertiser_id"] = cfg["pairs"][0]
+    if not cfg["project_id"]:
+        p.error("a Peec project ID is required (--project-id or config 'project_id')")
+    if not cfg["advertiser_id"]:
+        p.error("an Awin advertiser ID is required (--advertiser-id or config 'advertiser_id')")
+    cfg["advertiser_id"] = int(cfg["advertiser_id"])
+    cfg["end"] = cfg["end"] or str(date.today())
+    cfg["start"] = cfg["start"] or str(date.today() - timedelta(days=30))
+    cfg["project_name"] = cfg["project_name"] or cfg["project_id"]
+    return cfg
+
+
+def _fanout_pairs(cfg):
+    """
+    (project_id, advertiser_id) pairs from cfg["pairs"] ("project:advertiser"
+    strings, [project, advertiser] lists or {"project_id", "advertiser_id"}
+    dicts) plus every project_ids x advertiser_ids combination, in order
+    and without duplicates. Empty when fan-out isn't used.
+    """
+    pairs = []
+    for item in cfg.get("pairs") or []:
+        if isinstance(item, dict):
+            item = (item.get("project_id"), item.get("advertiser_id"))
+        elif isinstance(item, str):
+            item = item.rpartition(":")[::2]
+        try:
+            project_id, advertiser_id = item
+            pairs.append((str(project_id), int(advertiser_id)))
+        except (TypeError, ValueError):
+            raise ValueError(f"pair {item!r} is not PROJECT:ADVERTISER") from None
+    pairs += [(str(p), int(a)) for p in cfg.get("project_ids") or []
+              for a in cfg.get("advertiser_ids") or []]
+    return list(dict.fromkeys(pairs))
+
+
+def _configure_session(cfg):
+    """Set the globals cell_00/cell_01 would normally set from widgets."""
+    from dotenv import load_dotenv
+
+    if cfg["env_file"]:
+        load_dotenv(cfg["env_file"])
+    else:
+        load_dotenv()
+    for var in ("PEEC_API_KEY", "AWAPI"):
+        if not os.getenv(var):
+            raise RuntimeError(f"{var} not set. Add it to a .env file or export it.")
+
+    workspace = Path(cfg["workspace"]).resolve()
+    for name in ["output", "logs"]:
+        (workspace / name).mkdir(parents=True, exist_ok=True)
+
+    __main__.IN_COLAB = False
+    __main__.HEADLESS = True
+    __main__.WORKSPACE_ROOT = workspace
+    __main__.PATHS = {
+        "scripts": SCRIPTS_DIR,
+        "output": workspace / "output",
+        "logs": workspace / "logs",
+    }
+    os.environ["WORKSPACE_ROOT"] = str(workspace)
+    if cfg.get("peec_base_url"):
+        os.environ["PEEC_BASE_URL"] = cfg["peec_base_url"]
+    if cfg.get("awin_base_url"):
+        os.environ["AWIN_BASE_URL"] = cfg["awin_base_url"]
+    __main__.PROJECT_ID = cfg["project_id"]
+    __main__.PROJECT_NAME = cfg["project_name"]
+    __main__.ADVERTISER_ID = cfg["advertiser_id"]
+    __main__.SESSION_START_DATE = cfg["start"]
+    __main__.SESSION_END_DATE = cfg["end"]
+    for host, rate in (cfg.get("rate_limits") or {}).items():
+        http_telemetry.set_rate_limit(host, rate)
+    if cfg.get("fresh"):
+        journal.prune(max_age_h=0)
+
+
+_cells = {}
+_cells_lock = threading.Lock()
+
+
+def _reset_cells(keep=("cell_03_peec_client.py",)):
+    """Drop exec'd cells (except keep) so the next _cell() re-reads __main__."""
+    with _cells_lock:
+        for name in [n for n in _cells if n not in keep]:
+            del _cells[name]
+
+
+def _cell(filename):
+    """
+    Exec a cell script in its own namespace (once per run) and return it.
+    Cross-cell state goes via __main__, so a cell is only exec'd once the
+    stages it depends on have published their outputs.
+    """
+    with _cells_lock:
+        if filename not in _cells:
+            path = SCRIPTS_DIR / filename
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+            ns = {"__name__": f"cell_{path.stem}", "__file__": str(path)}
+            exec(compile(source, str(path), "exec"), ns)
+            _cells[filename] = ns
+        return _cells[filename]
+
+
+# ── Stages ───────────────────────────────────────────────────────
+def _pull_peec(project_id, start, end):
+    df = _cell("cell_04_peec_data_pull.py")["pull_peec_detail"](start, end, project_id=project_id)
+    if df is None:
+        raise RuntimeError("Peec returned no citation data for this date range.")
+    return df
+
+
+def _publish_peec(out):
+    _cell("cell_04_peec_data_pull.py")["_publish_detail"](out["df_detail"])
+    out["df_detail"].to_csv(__main__.PATHS["output"] / "peec_citation_detail.csv", index=False)
+
+
+def _pull_awin(advertiser_id, start, end, awin_status):
+    cell07 = _cell("cell_07_awin_transactions.py")
+    df = cell07["process_awin_transactions"](
+        cell07["iter_awin_transactions"](advertiser_id, start, end, status=awin_status)
+    )
+    if df.empty:
+        raise RuntimeError("Awin returned no transactions for this date range.")
+    return df
+
+
+def _domain_report(df_detail):
+    return _cell("cell_05_domain_report.py")["build_domain_report"](df_detail)
+
+
+def _url_report(df_detail):
+    return _cell("cell_06_url_report.py")["build_url_report"](df_detail)
+
+
+def _enriched(df_detail, df_domain_result, df_awin_tx, advertiser_id, start, end,
+              domain_types, exclude):
+    cell09 = _cell("cell_09_enriched_report.py")
+    merged, _, _ = cell09["build_enriched"](df_domain_result, df_awin_tx, advertiser_id, start, end)
+    if merged is None:
+        return None
+    return cell09["filter_enriched"](merged, domain_types=domain_types, exclude=exclude)[0]
+
+
+def _gap(df_detail, df_domain_result, df_awin_tx, exclude, gap_rank_by, gap_top_n):
+    cell10 = _cell("cell_10_gap_analysis.py")
+    gap_domains = cell10["find_gap_domains"](df_domain_result, df_awin_tx)
+    cache = cell10["build_gap"](gap_domains, exclude=exclude) if not gap_domains.empty else None
+    if cache is None or cache["urls"].empty:
+        return None
+    return cell10["rank_gap"](cache, rank_by=gap_rank_by, top_n=gap_top_n)
+
+
+def _publisher(cell, fn, key):
+    """Publish hook calling a cell's _publish_* function unless the output is None."""
+    def publish(out):
+        if out[key] is not None:
+            _cell(cell)[fn](out[key])
+    return publish
+
+
+# df_detail is an input of enrichment and gap as well: both read the model
+# bitmasks / domain index that _publish_detail derives from it.
+STAGES = [
+    pipeline.Stage("peec_pull", _pull_peec, ["project_id", "start", "end"],
+                   ["df_detail"], memo=False, publish=_publish_peec),
+    pipeline.Stage("awin_pull", _pull_awin, ["advertiser_id", "start", "end", "awin_status"],
+                   ["df_awin_tx"], memo=False,
+                   publish=_publisher("cell_07_awin_transactions.py", "_publish_awin_tx", "df_awin_tx")),
+    pipeline.Stage("domain_report", _domain_report, ["df_detail"], ["df_domain_result"],
+                   publish=_publisher("cell_05_domain_report.py", "_publish_domain_report", "df_domain_result")),
+    pipeline.Stage("url_report", _url_report, ["df_detail"], ["df_url_result"],
+                   publish=_publisher("cell_06_url_report.py", "_publish_url_report", "df_url_result")),
+    pipeline.Stage("enriched", _enriched,
+                   ["df_detail", "df_domain_result", "df_awin_tx", "advertiser_id", "start", "end",
+                    "domain_types", "exclude"],
+                   ["df_enriched"],
+                   publish=_publisher("cell_09_enriched_report.py", "_publish_enriched", "df_enriched")),
+    pipeline.Stage("gap", _gap,
+                   ["df_detail", "df_domain_result", "df_awin_tx", "exclude", "gap_rank_by", "gap_top_n"],
+                   ["df_gap"],
+                   publish=_publisher("cell_10_gap_analysis.py", "_publish_gap", "df_gap")),
+]
+
+
+def run(cfg):
+    """Run every stage and return a summary dict."""
+    summary = {"config": cfg, "started": datetime.now().isoformat(timespec="seconds")}
+    t0 = time.perf_counter()
+
+    _configure_session(cfg)
+    _cell("cell_03_peec_client.py")
+
+    # Peec and Awin pulls have no shared inputs, so they run concurrently;
+    # memoised stages are skipped when their inputs hash the same as last run
+    cache_dir = None if cfg["no_cache"] else __main__.PATHS["logs"] / "stage_cache"
+    summary.update(_run_dag(STAGES, cfg, cache_dir))
+    if cfg["chats"]:
+        summary["chats"] = _harvest_chats(cfg, [cfg["project_id"]], __main__.PATHS["output"])
+    pulled_tx = {cfg["advertiser_id"]: getattr(__main__, "df_awin_tx", None)}
+    if cfg["rollups"]:
+        summary["rollups"] = _update_rollups(cfg, [cfg["project_id"]], pulled_tx,
+                                             __main__.PATHS["output"])
+    if cfg["diff"]:
+        summary["changes"] = _diff_snapshots(
+            cfg, {cfg["project_id"]: getattr(__main__, "df_detail", None)}, pulled_tx,
+            __main__.PATHS["output"],
+        )
+    return _finish(summary, cfg, t0)
+
+
+def _harvest_chats(cfg, project_ids, output_dir):
+    """Download new chat contents for each project into output_dir/chats.sqlite."""
+    import chat_store
+
+    peec = _cell("cell_03_peec_client.py")["peec"]
+    out = {}
+    with chat_store.ChatStore(output_dir / chat_store.STORE_NAME) as store:
+        for project_id in project_ids:
+            try:
+                out[project_id] = chat_store.harvest(
+                    peec, cfg["start"], cfg["end"], project_id=project_id,
+                    store=store, workers=cfg["workers"],
+                )
+            except Exception as e:
+                print(f"\u274c chats {project_id}: {type(e).__name__}: {e}")
+                out[project_id] = {"error": f"{type(e).__name__}: {e}"[:300]}
+    return out
+
+
+def _update_rollups(cfg, project_ids, awin_frames, output_dir):
+    """
+    Add the range's days to output_dir/rollups.sqlite (Peec days not yet
+    stored are fetched; Awin days come from the pulled frames) and write
+    the weekly citations vs revenue trend for matched domains.
+    """
+    import rollups
+
+    peec = _cell("cell_03_peec_client.py")["peec"]
+    out = {"peec_days": {}, "awin_days": {}}
+    with rollups.RollupStore(output_dir / rollups.STORE_NAME) as store:
+        for project_id in project_ids:
+            try:
+                out["peec_days"][project_id] = rollups.ingest_peec(
+                    peec, project_id, cfg["start"], cfg["end"], store, workers=cfg["workers"],
+                )
+            except Exception as e:
+                print(f"\u274c rollups {project_id}: {type(e).__name__}: {e}")
+                out["peec_days"][project_id] = {"error": f"{type(e).__name__}: {e}"[:300]}
+        for advertiser_id, df in awin_frames.items():
+            out["awin_days"][advertiser_id] = rollups.ingest_awin(
+                df, advertiser_id, cfg["start"], cfg["end"], store,
+            )
+        week0 = date.fromisoformat(cfg["start"])
+        week0 -= timedelta(days=week0.weekday())  # the week containing start
+        trend = store.trend("week", start_date=week0, end_date=cfg["end"])
+    trend.to_csv(output_dir / "trend_weekly.csv", index=False)
+    __main__.df_trend_weekly = trend
+    out["trend_rows"] = len(trend)
+    return out
+
+
+def _diff_snapshots(cfg, peec_frames, awin_frames, output_dir):
+    """
+    Diff each pulled frame against its previous snapshot and write the
+    delta tables to output_dir/changes_<peec|awin>_<id>_<table>.csv.
+    """
+    import snapshots
+
+    out = {}
+    for kind, frames, diff in (("peec", peec_frames, snapshots.diff_peec),
+                               ("awin", awin_frames, snapshots.diff_awin)):
+        for key, df in frames.items():
+            if df is None:
+                continue
+            changes = diff(df, key, cfg["start"], cfg["end"])
+            if changes is None:
+                print(f"\U0001f4f8 {kind} {key}: first snapshot stored, nothing to compare")
+                out[f"{kind} {key}"] = None
+                continue
+            snapshots.write(changes, output_dir, f"changes_{kind}_{_label(key)}")
+            s = changes["summary"]
+            print(f"\U0001f504 {kind} {key}: {s['added']:,} new, {s['removed']:,} gone, "
+                  f"{s['changed']:,} changed rows")
+            out[f"{kind} {key}"] = {**s, **{name: len(df) for name, df in changes.items()
+                                            if name != "summary"}}
+    return out
+
+
+def _run_dag(stages, cfg, cache_dir):
+    """Run the stage DAG; returns {"stages": ..., "rows": ...} for the summary."""
+    dag = pipeline.Pipeline(stages, cache_dir=cache_dir)
+    values = dag.run(cfg)
+
+    out = {"stages": {}}
+    for name, status, secs in dag.report:
+        out["stages"][name] = {"status": status, "seconds": secs}
+        print(f"\u2705 {name}: {status} ({secs}s)")
+
+    out["rows"] = {
+        k: (0 if values[k] is None else len(values[k]))
+        for k in ["df_detail", "df_awin_tx", "df_domain_result", "df_url_result",
+                  "df_enriched", "df_gap"]
+    }
+    if values["df_enriched"] is None:
+        print("\u26a0\ufe0f No matching domains found between Peec and Awin.")
+    if values["df_gap"] is None:
+        print("\u26a0\ufe0f No gap URLs to report.")
+    return out
+
+
+def _finish(summary, cfg, t0):
+    summary["http"] = http_telemetry.summary()
+    print("\n" + http_telemetry.format_summary(summary["http"]) + "\n")
+    summary["seconds"] = round(time.perf_counter() - t0, 2)
+    summary["profile_run_id"] = profiling.RUN_ID
+    if cfg["trace"]:
+        summary["trace"] = str(profiling.chrome_trace(
+            __main__.PATHS["logs"] / f"trace_{profiling.RUN_ID}.json"
+        ))
+    return summary
+
+
+# ── Fan-out ──────────────────────────────────────────────────────
+def _pull_partitions(cfg):
+    """
+    Pull every distinct project and advertiser in cfg["pairs"] concurrently.
+    Returns ({project_id: df_detail}, {advertiser_id: df_awin_tx}, errors);
+    a failed pull is reported in errors and does not stop the others.
+    """
+    cell03 = _cell("cell_03_peec_client.py")
+    pull_peec = _cell("cell_04_peec_data_pull.py")["pull_peec_detail"]
+    _cell("cell_07_awin_transactions.py")
+
+    def peec_job(project_id):
+        df = pull_peec(cfg["start"], cfg["end"], project_id=project_id,
+                       build_row=cell03["_build_row_for"](project_id))
+        if df is None:
+            raise RuntimeError("Peec returned no citation data for this date range.")
+        return df
+
+    def awin_job(advertiser_id):
+        return _pull_awin(advertiser_id, cfg["start"], cfg["end"], cfg["awin_status"])
+
+    projects = list(dict.fromkeys(p for p, _ in cfg["pairs"]))
+    advertisers = list(dict.fromkeys(a for _, a in cfg["pairs"]))
+    peec, awin, errors = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, cfg["workers"]),
+                            thread_name_prefix="fanout") as pool:
+        jobs = {pool.submit(peec_job, p): ("peec", p, peec) for p in projects}
+        jobs.update({pool.submit(awin_job, a): ("awin", a, awin) for a in advertisers})
+        for fut in as_completed(jobs):
+            api, key, frames = jobs[fut]
+            try:
+                frames[key] = fut.result()
+            except Exception as e:
+                errors[f"{api} {key}"] = f"{type(e).__name__}: {e}"[:300]
+                print(f"\u274c {api} {key}: {errors[f'{api} {key}']}")
+            else:
+                print(f"\u2705 {api} {key}: {len(frames[key]):,} rows")
+    return peec, awin, errors
+
+
+def _tagged(frames, column):
+    """
+    Concatenate {key: frame} with the key as a leading column (replacing
+    the frame's own column of that name, e.g. df_awin_tx's "Advertiser ID").
+    """
+    import pandas as pd
+
+    parts = [df.assign(**{column: key})[[column, *(c for c in df.columns if c != column)]]
+             for key, df in frames.items()]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=[column])
+
+
+def _partition_stages(df_detail, df_awin_tx):
+    """STAGES with the pull stages serving frames that were already pulled."""
+    frames = {"peec_pull": df_detail, "awin_pull": df_awin_tx}
+    return [
+        pipeline.Stage(s.name, lambda _df=frames[s.name], **kw: _df, s.inputs, s.outputs,
+                       memo=False, publish=s.publish) if s.name in frames else s
+        for s in STAGES
+    ]
+
+
+def _run_partition(cfg, label, project_id, advertiser_id, df_detail, df_awin_tx, output_root):
+    """Run the report stages on one partition, writing to output/<label>/."""
+    print(f"\n\u2500\u2500 {label} \u2500\u2500")
+    out_dir = output_root / label
+    out_dir.mkdir(parents=True, exist_ok=True)
+    __main__.PATHS["output"] = out_dir
+    __main__.PROJECT_ID = __main__.PROJECT_NAME = project_id
+    __main__.ADVERTISER_ID = advertiser_id
+    _reset_cells()  # cells re-read the partition's __main__ state
+    cache_dir = None if cfg["no_cache"] else __main__.PATHS["logs"] / "stage_cache" / label
+    part_cfg = dict(cfg, project_id=project_id, advertiser_id=advertiser_id)
+    try:
+        return _run_dag(_partition_stages(df_detail, df_awin_tx), part_cfg, cache_dir)
+    except Exception as e:  # one failing partition shouldn't stop the rest
+        print(f"\u274c {label}: {type(e).__name__}: {e}")
+        return {"error": f"{type(e).__name__}: {e}"[:300]}
+
+
+def _label(*parts):
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", "_".join(str(p) for p in parts))
+
+
+def run_fanout(cfg):
+    """
+    Pull every project / advertiser in cfg["pairs"] concurrently, write the
+    tagged frames, then run the reports within each pair and/or across all
+    pairs (cfg["scope"]). Returns a summary dict.
+    """
+    summary = {"config": cfg, "started": datetime.now().isoformat(timespec="seconds")}
+    t0 = time.perf_counter()
+
+    _configure_session(cfg)
+    output_root = __main__.PATHS["output"]
+    print(f"\u23f3 Fan-out: {len(cfg['pairs'])} pairs")
+    peec, awin, errors = _pull_partitions(cfg)
+    summary["errors"] = errors
+
+    # Partitioned frames: every project's / advertiser's rows, tagged
+    df_detail_all = _tagged(peec, "Project ID")
+    df_awin_tx_all = _tagged(awin, "Advertiser ID")
+    __main__.df_detail_all = df_detail_all
+    __main__.df_awin_tx_all = df_awin_tx_all
+    df_detail_all.to_csv(output_root / "peec_citation_detail_all.csv", index=False)
+    df_awin_tx_all.to_csv(output_root / "awin_transactions_all.csv", index=False)
+    summary["rows"] = {"df_detail_all": len(df_detail_all), "df_awin_tx_all": len(df_awin_tx_all)}
+
+    summary["partitions"] = {}
+    if cfg["scope"] in ("within", "both"):
+        for project_id, advertiser_id in cfg["pairs"]:
+            label = _label(project_id, advertiser_id)
+            if project_id not in peec or advertiser_id not in awin:
+                summary["partitions"][label] = {"status": "skipped (pull failed)"}
+                continue
+            summary["partitions"][label] = _run_partition(
+                cfg, label, project_id, advertiser_id, peec[project_id], awin[advertiser_id],
+                output_root,
+            )
+    if cfg["scope"] in ("across", "both") and peec and awin:
+        # Re-sorted so the combined frame keeps the pulls' orderings
+        detail = df_detail_all.sort_values("Domain", kind="mergesort").reset_index(drop=True)
+        tx = df_awin_tx_all.sort_values(
+            "Transaction Date", ascending=False, kind="mergesort",
+        ).reset_index(drop=True)
+        advertisers = tuple(awin) if len(awin) > 1 else next(iter(awin))
+        summary["partitions"]["all"] = _run_partition(
+            cfg, "all", ",".join(peec), advertisers, detail, tx, output_root,
+        )
+
+    __main__.PATHS["output"] = output_root
+    projects = list(dict.fromkeys(p for p, _ in cfg["pairs"]))
+    if cfg["chats"]:
+        summary["chats"] = _harvest_chats(cfg, projects, output_root)
+    if cfg["rollups"]:
+        summary["rollups"] = _update_rollups(cfg, [p for p in projects if p in peec], awin,
+                                             output_root)
+    if cfg["diff"]:
+        summary["changes"] = _diff_snapshots(cfg, peec, awin, output_root)
+    return _finish(summary, cfg, t0)
+
+
+def _check_imports():
+    """
+    Print cold import times vs IMPORT_BUDGET_MS (modules) and
+    CELL_IMPORT_BUDGET_MS (cells' module-level imports); exit 1 if any is over.
+    """
+    sys.path.insert(0, str(SCRIPTS_DIR.parent))
+    from scripts import check_import_times
+
+    over = 0
+    for module, (ms, limit, ok) in check_import_times().items():
+        over += not ok
+        mark = "\u2705" if ok else "\u274c"
+        print(f"{mark} {module:<30} {ms:>7.1f} ms  (budget {limit} ms)")
+    sys.exit(1 if over else 0)
+
+
+def _check_paging(page_size=300):
+    """
+    Fetch a report and the chat listing from stub servers that cap pages at
+    page_size (below the client's page size) and compare row counts with
+    what the stub holds; exit 1 if any rows went missing.
+    """
+    import tempfile
+    import chat_store
+    from stub_servers import StubServers
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubServers(rows=5_000, page_size=page_size) as stubs:
+        os.environ["PEEC_BASE_URL"] = stubs.peec_base
+        os.environ.setdefault("PEEC_API_KEY", "stub")
+        __main__.PROJECT_ID = __main__.PROJECT_NAME = "synthetic"
+        __main__.IN_COLAB = False
+        __main__.HEADLESS = True
+        __main__.PATHS = {"scripts": SCRIPTS_DIR, "output": Path(tmp), "logs": Path(tmp)}
+        peec = _cell("cell_03_peec_client.py")["peec"]
+        checks = {
+            "reports/urls": (
+                lambda: peec.iter_report("urls", "2026-01-01", "2026-01-31",
+                                         dimensions=["prompt_id", "model_id"]),
+                len(stubs.payloads["urls"]),
+            ),
+            "chats": (
+                lambda: chat_store.iter_chats(peec, "2026-01-01", "2026-01-31", "synthetic"),
+                len(stubs.payloads["chats"]),
+            ),
+        }
+        for name, (rows, expected) in checks.items():
+            got = sum(1 for _ in rows())
+            failed += got != expected
+            mark = "\u2705" if got == expected else "\u274c"
+            print(f"{mark} {name:<16} {got:>7,} of {expected:,} rows  (pages of {page_size})")
+    sys.exit(1 if failed else 0)
+
+
+def main(argv=None):
+    cfg = _parse_args(argv)
+    if cfg.get("check_imports"):
+        _check_imports()
+    if cfg.get("check_paging"):
+        _check_paging()
+    summary = run_fanout(cfg) if cfg["pairs"] else run(cfg)
+    log_path = __main__.PATHS["logs"] / f"run_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(log_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+    print(f"\n\U0001f4c2 Outputs in {__main__.PATHS['output']}")
+    print(f"\U0001f4dd Run summary: {log_path}")
+    if summary.get("trace"):
+        print(f"\u23f1 Chrome trace: {summary['trace']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# snapshots.py — Diff each pull against the previous one
+# Imported (not exec'd). After a pull, diff_peec / diff_awin compare the new
+# frame with the snapshot stored by the previous pull of the same project /
+# advertiser (PATHS["logs"]/snapshots/), then store the new snapshot:
+#
+#   changes = snapshots.diff_peec(df_detail, project_id)
+#   changes["citation_deltas"]      # only domains whose citations moved
+#   changes = snapshots.diff_awin(df_awin_tx, advertiser_id)
+#   changes["status_changes"]       # pending -> approved, ...
+#
+# Rows are matched on stable keys (URL x Prompt ID x Model; Transaction ID)
+# by hashing the key and compared-value columns to 64-bit ints and joining
+# on the key hash. Everything after the join (delta tables, the per-domain
+# and per-publisher totals kept in the snapshot) is computed from the
+# added / removed / changed rows only. The first pull of a scope has no
+# previous snapshot, so its deltas are None.
+#
+# Diffs are only meaningful between pulls of comparable ranges (e.g. a
+# rolling last-30-days pull); each result records both ranges.
+
+import pickle
+from pathlib import Path
+
+DIR_NAME = "snapshots"
+
+PEEC_KEYS = ["URL", "Prompt ID", "Model"]
+PEEC_VALUES = ["Domain", "usage_count", "citation_avg"]
+AWIN_KEYS = ["Transaction ID"]
+AWIN_VALUES = ["Publisher ID", "Publisher Name", "Publisher Domain", "Transaction Date",
+               "Status", "Sale Amount", "Commission Amount"]
+
+
+def _root():
+    import __main__
+    paths = getattr(__main__, "PATHS", None)
+    if not paths:
+        raise RuntimeError("Missing 'PATHS'. Run the session config cell first, or pass a root.")
+    return paths["logs"] / DIR_NAME
+
+
+def _path(kind, scope, root=None):
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(scope))
+    return Path(root or _root()) / f"{kind}_{safe}.pkl"
+
+
+def load(kind, scope, root=None):
+    """The stored snapshot dict for kind ("peec" / "awin") and scope, or None."""
+    path = _path(kind, scope, root)
+    if not path.is_file():
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save(kind, scope, snap, root=None):
+    path = _path(kind, scope, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+    return path
+
+
+# ── Hash join ────────────────────────────────────────────────────
+def _rows(df, keys, values):
+    """Key + value columns with their row hashes (_key, _val); one row per key."""
+    import pandas as pd
+
+    rows = df[keys + values].copy()
+    rows["_key"] = pd.util.hash_pandas_object(rows[keys], index=False).to_numpy()
+    rows["_val"] = pd.util.hash_pandas_object(rows[values], index=False).to_numpy()
+    return rows.drop_duplicates("_key", keep="last").reset_index(drop=True)
+
+
+def _join(old, new):
+    """
+    (added, removed, changed_old, changed_new): rows of new / old whose key
+    is only on one side, and both sides of keys whose values differ.
+    """
+    m = new[["_key", "_val"]].merge(old[["_key", "_val"]], on="_key", how="outer",
+                                    suffixes=("", "_old"), indicator=True)
+    added = m.loc[m["_merge"] == "left_only", "_key"]
+    removed = m.loc[m["_merge"] == "right_only", "_key"]
+    changed = m.loc[(m["_merge"] == "both") & (m["_val"] != m["_val_old"]), "_key"]
+    return (new[new["_key"].isin(added)], old[old["_key"].isin(removed)],
+            old[old["_key"].isin(changed)].sort_values("_key"),
+            new[new["_key"].isin(changed)].sort_values("_key"))
+
+
+def _totals(rows, by, measures):
+    """Per-group row count and measure sums (the running totals kept in a snapshot)."""
+    g = rows.groupby(by, sort=False)
+    out = g[measures].sum()
+    out["Rows"] = g.size()
+    return out
+
+
+def _apply(totals, plus, minus):
+    """totals + plus - minus, dropping groups left with no rows."""
+    out = totals.add(plus, fill_value=0).sub(minus, fill_value=0)
+    return out[out["Rows"] > 0]
+
+
+def _snapshot(rows, totals, start_date, end_date):
+    return {"rows": rows, "totals": totals, "start": start_date, "end": end_date}
+
+
+def _diff(kind, df, scope, keys, values, by, measures, start_date, end_date, root):
+    """Shared steps: hash rows, join with the previous snapshot, update totals, save."""
+    import pandas as pd
+    import profiling
+
+    with profiling.stage(f"{kind}_diff", cell="snapshots", rows=len(df)) as rec:
+        new = _rows(df, keys, values)
+        prev = load(kind, scope, root)
+        if prev is None:
+            save(kind, scope, _snapshot(new, _totals(new, by, measures), start_date, end_date),
+                 root)
+            return None
+        added, removed, changed_old, changed_new = _join(prev["rows"], new)
+        plus = _totals(pd.concat([added, changed_new]), by, measures)
+        minus = _totals(pd.concat([removed, changed_old]), by, measures)
+        totals = _apply(prev["totals"], plus, minus)
+        save(kind, scope, _snapshot(new, totals, start_date, end_date), root)
+        rec["changed"] = len(added) + len(removed) + len(changed_new)
+    return {
+        "prev": prev, "totals": totals, "added": added, "removed": removed,
+        "changed_old": changed_old, "changed_new": changed_new,
+        "touched": plus.index.union(minus.index),
+    }
+
+
+def _summary(d, start_date, end_date):
+    return {
+        "previous_range": (d["prev"]["start"], d["prev"]["end"]),
+        "range": (start_date, end_date),
+        "added": len(d["added"]), "removed": len(d["removed"]), "changed": len(d["changed_new"]),
+    }
+
+
+# ── Peec ─────────────────────────────────────────────────────────
+def diff_peec(df_detail, project_id, start_date=None, end_date=None, root=None):
+    """
+    Compare df_detail with the previous pull of project_id. Returns None on
+    the first pull, else {"summary", "domains_new", "domains_lost",
+    "citation_deltas"}; citation_deltas lists every domain whose citations
+    (sum of usage_count) or cited URL rows changed, biggest moves first.
+    """
+    import pandas as pd
+
+    d = _diff("peec", df_detail, project_id, PEEC_KEYS, PEEC_VALUES, "Domain",
+                 ["usage_count"], start_date, end_date, root)
+    if d is None:
+        return None
+    touched = d["touched"]
+    before = d["prev"]["totals"].reindex(touched)
+    after = d["totals"].reindex(touched)
+    deltas = pd.DataFrame({
+        "Domain": touched,
+        "Citations Before": before["usage_count"].fillna(0).to_numpy(),
+        "Citations After": after["usage_count"].fillna(0).to_numpy(),
+        "URL Rows Before": before["Rows"].fillna(0).to_numpy(),
+        "URL Rows After": after["Rows"].fillna(0).to_numpy(),
+    })
+    for c in deltas.columns[1:]:
+        deltas[c] = deltas[c].astype(int)
+    deltas["Delta"] = deltas["Citations After"] - deltas["Citations Before"]
+    deltas = deltas[(deltas["Delta"] != 0)
+                    | (deltas["URL Rows Before"] != deltas["URL Rows After"])]
+    deltas = deltas.sort_values("Delta", key=abs, ascending=False, kind="mergesort")
+    deltas = deltas.reset_index(drop=True)
+
+    cols = ["Domain", "Citations Before", "Citations After", "Delta"]
+    return {
+        "summary": _summary(d, start_date, end_date),
+        "domains_new": deltas.loc[deltas["URL Rows Before"] == 0, cols].reset_index(drop=True),
+        "domains_lost": deltas.loc[deltas["URL Rows After"] == 0, cols].reset_index(drop=True),
+        "citation_deltas": deltas,
+    }
+
+
+# ── Awin ─────────────────────────────────────────────────────────
+def diff_awin(df_awin_tx, advertiser_id, start_date=None, end_date=None, root=None):
+    """
+    Compare df_awin_tx with the previous pull of advertiser_id. Returns None
+    on the first pull, else {"summary", "status_changes", "new_publishers"}:
+    transactions whose status moved, and publishers with no transactions in
+    the previous pull.
+    """
+    import pandas as pd
+
+    d = _diff("awin", df_awin_tx, advertiser_id, AWIN_KEYS, AWIN_VALUES, "Publisher ID",
+                 ["Sale Amount", "Commission Amount"], start_date, end_date, root)
+    if d is None:
+        return None
+    old, new = d["changed_old"], d["changed_new"]
+    moved = old["Status"].to_numpy() != new["Status"].to_numpy()
+    status_changes = new.loc[moved, ["Transaction ID", "Publisher ID", "Publisher Name",
+                                     "Transaction Date", "Sale Amount"]].assign(**{
+        "Status Before": old.loc[moved, "Status"].to_numpy(),
+        "Status After": new.loc[moved, "Status"].to_numpy(),
+    }).reset_index(drop=True)
+
+    fresh = d["added"][~d["added"]["Publisher ID"].isin(d["prev"]["totals"].index)]
+    new_publishers = fresh.groupby("Publisher ID", sort=False).agg(**{
+        "Publisher Name": ("Publisher Name", "first"),
+        "Publisher Domain": ("Publisher Domain", "first"),
+        "Transactions": ("Transaction ID", "size"),
+        "Sale Amount": ("Sale Amount", "sum"),
+        "Commission Amount": ("Commission Amount", "sum"),
+    }).round(2).sort_values("Sale Amount", ascending=False).reset_index()
+    return {
+        "summary": _summary(d, start_date, end_date),
+        "status_changes": status_changes,
+        "new_publishers": pd.DataFrame(new_publishers),
+    }
+
+
+def write(changes, output_dir, prefix):
+    """Write each delta table to output_dir/<prefix>_<table>.csv; returns the paths."""
+    paths = []
+    for name, df in (changes or {}).items():
+        if name != "summary":
+            path = Path(output_dir) / f"{prefix}_{name}.csv"
+            df.to_csv(path, index=False)
+            paths.append(path)
+    return paths
@@ -0,0 +1,297 @@
+# stub_servers.py — Local stand-ins for the Peec customer API and Awin API
+# Imported or run directly. Serves synthetic payloads (see synthetic.py) over
+# real HTTP, with configurable latency, page size, 429 bursts, 5xx rates and
+# payload size, so the fetch layer can be load-tested end to end. Bodies are
+# gzipped when the client sends Accept-Encoding: gzip (--no-compress to stop).
+#
+# Usage:
+#   python scripts/stub_servers.py --rows 100k --latency-ms 150 --error-rate 0.02
+#   # then, in another shell:
+#   PEEC_BASE_URL=http://127.0.0.1:8701/customer/v1 \
+#   AWIN_BASE_URL=http://127.0.0.1:8702 PEEC_API_KEY=x AWAPI=x \
+#       python scripts/run_pipeline.py --project-id synthetic --advertiser-id 1 \
+#       --start 2026-01-01 --end 2026-03-31
+#
+# Or from Python:
+#   with StubServers(rows=10_000, latency_ms=50) as stubs:
+#       PeecClient(base_url=stubs.peec_base) ...
+#       fetch_awin_transactions(1, sd, ed, base_url=stubs.awin_base)
+#
+# Routes
+#   Peec (base .../customer/v1): GET /projects /brands /prompts /tags /topics
+#     /models /chats /chats/{id}/content; POST /reports/{brands,domains,urls}.
+#     "data" lists are paginated by limit/offset, capped at page_size.
+#   Awin: GET /advertisers/{id}/transactions/ (filtered to the startDate /
+#     endDate window) and /advertisers/{id}/reports/publisher.
+#   Both: GET /_stats returns request / status counters.
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+import synthetic
+
+
+class StubConfig:
+    """
+    Behaviour knobs shared by both servers.
+
+    latency_ms / jitter_ms  per-request delay (uniform jitter added)
+    page_size               max rows per Peec page, whatever limit is asked
+    rate_limit              sustained requests/second before 429 (0 = off);
+                            burst is the token-bucket capacity
+    burst_429_rate          chance a request starts a burst of burst_429_len 429s
+    error_rate              chance of a 500/502/503 response
+    pad_bytes               filler added to every row to inflate payload size
+    compress                gzip bodies over 1 KB when the client accepts gzip
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, page_size=1000, rate_limit=0, burst=10,
+                 burst_429_rate=0.0, burst_429_len=3, error_rate=0.0, pad_bytes=0, compress=True, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.page_size = page_size
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.burst_429_rate = burst_429_rate
+        self.burst_429_len = burst_429_len
+        self.error_rate = error_rate
+        self.pad_bytes = pad_bytes
+        self.compress = compress
+        self.seed = seed
+
+
+class _Faults:
+    """Latency, token-bucket rate limit, 429 bursts and 5xx injection."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.rng = random.Random(cfg.seed)
+        self.lock = threading.Lock()
+        self.tokens = float(cfg.burst)
+        self.last = time.monotonic()
+        self.burst_left = 0
+        self.stats = {"requests": 0, "by_status": {}, "by_path": {}}
+
+    def record(self, path, status):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["by_status"][str(status)] = self.stats["by_status"].get(str(status), 0) + 1
+            self.stats["by_path"][path] = self.stats["by_path"].get(path, 0) + 1
+
+    def check(self):
+        """Sleep for the configured latency, then return a fault status or None."""
+        cfg = self.cfg
+        with self.lock:
+            delay = (cfg.latency_ms + self.rng.uniform(0, cfg.jitter_ms)) / 1000
+            if self.burst_left:
+                self.burst_left -= 1
+                fault = 429
+            elif cfg.burst_429_rate and self.rng.random() < cfg.burst_429_rate:
+                self.burst_left = cfg.burst_429_len - 1
+                fault = 429
+            elif cfg.error_rate and self.rng.random() < cfg.error_rate:
+                fault = self.rng.choice([500, 502, 503])
+            else:
+                fault = None
+            if fault is None and cfg.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(cfg.burst, self.tokens + (now - self.last) * cfg.rate_limit)
+                self.last = now
+                if self.tokens < 1:
+                    fault = 429
+                else:
+                    self.tokens -= 1
+        if delay:
+            time.sleep(delay)
+        return fault
+
+
+def _make_handler(kind, u, payloads, faults):
+    cfg = faults.cfg
+    pad = "x" * cfg.pad_bytes if cfg.pad_bytes else None
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # keep the console quiet
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            headers = dict(headers or {})
+            if (cfg.compress and len(body) > 1024
+                    and "gzip" in (self.headers.get("Accept-Encoding") or "")):
+                body = gzip.compress(body, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self, params):
+            path = urlparse(self.path).path
+            if path.endswith("/_stats"):
+                return self._send(200, faults.stats)
+
+            authed = (self.headers.get("X-API-Key") if kind == "peec"
+                      else params.get("accessToken"))
+            if not authed:
+                faults.record(path, 401)
+                return self._send(401, {"error": "missing credentials"})
+
+            status = faults.check()
+            if status == 429:
+                faults.record(path, 429)
+                return self._send(429, {"error": "rate limited"}, {"Retry-After": "1"})
+            if status:
+                faults.record(path, status)
+                return self._send(status, {"error": "upstream error"})
+
+            result = synthetic.route(u, payloads, self.path, params)
+            if isinstance(result, dict) and isinstance(result.get("data"), list):
+                limit = min(int(params.get("limit", cfg.page_size)), cfg.page_size)
+                offset = int(params.get("offset", 0))
+                result = {"data": result["data"][offset:offset + limit]}
+                rows = result["data"]
+            else:
+                rows = result
+            if pad:
+                rows = [dict(r, _pad=pad) for r in rows]
+                result = {"data": rows} if isinstance(result, dict) else rows
+            faults.record(path, 200)
+            self._send(200, result)
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            self._handle({k: v[0] for k, v in query.items()})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b"{}"
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                return self._send(400, {"error": "invalid JSON"})
+            self._handle(params)
+
+    return Handler
+
+
+class StubServers:
+    """
+    Peec + Awin stub servers on 127.0.0.1, each in a background thread.
+    Ports default to 0 (pick a free port); see peec_base / awin_base.
+    """
+
+    def __init__(self, rows=10_000, tx_rows=None, config=None, peec_port=0, awin_port=0,
+                 host="127.0.0.1", **config_kwargs):
+        self.config = config or StubConfig(**config_kwargs)
+        self.universe = synthetic.make_universe(rows, seed=self.config.seed)
+        self.payloads = {
+            "urls": synthetic.peec_url_rows(self.universe),
+            "transactions": synthetic.awin_transactions(self.universe, n=tx_rows),
+            "domains": synthetic.peec_domain_rows(self.universe),
+            "prompts": synthetic.peec_prompts(self.universe),
+            "publishers": synthetic.awin_publisher_report(self.universe),
+            "chats": synthetic.peec_chats(self.universe),
+        }
+        self.faults = {"peec": _Faults(self.config), "awin": _Faults(self.config)}
+        self._servers = {
+            kind: ThreadingHTTPServer(
+                (host, port), _make_handler(kind, self.universe, self.payloads, self.faults[kind]),
+            )
+            for kind, port in (("peec", peec_port), ("awin", awin_port))
+        }
+        for srv in self._servers.values():
+            srv.daemon_threads = True
+        self._threads = []
+
+    @property
+    def peec_base(self):
+        host, port = self._servers["peec"].server_address[:2]
+        return f"http://{host}:{port}/customer/v1"
+
+    @property
+    def awin_base(self):
+        host, port = self._servers["awin"].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stats(self):
+        return {kind: f.stats for kind, f in self.faults.items()}
+
+    def start(self):
+        for srv in self._servers.values():
+            t = threading.Thread(target=srv.serve_forever, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        for srv in self._servers.values():
+            srv.shutdown()
+            srv.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Run local Peec + Awin stub API servers.")
+    p.add_argument("--rows", default="10k", help="Peec URL report rows, e.g. 100k, 1M")
+    p.add_argument("--tx-rows", help="Awin transactions (default: same as --rows)")
+    p.add_argument("--peec-port", type=int, default=8701)
+    p.add_argument("--awin-port", type=int, default=8702)
+    p.add_argument("--latency-ms", type=float, default=0)
+    p.add_argument("--jitter-ms", type=float, default=0)
+    p.add_argument("--page-size", type=int, default=1000)
+    p.add_argument("--rate-limit", type=float, default=0, help="Requests/second before 429 (0 = off)")
+    p.add_argument("--burst", type=int, default=10, help="Token-bucket capacity for --rate-limit")
+    p.add_argument("--burst-429-rate", type=float, default=0.0)
+    p.add_argument("--burst-429-len", type=int, default=3)
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of 5xx responses")
+    p.add_argument("--pad-bytes", type=int, default=0, help="Filler bytes added per row")
+    p.add_argument("--no-compress", action="store_true", help="Never gzip responses")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args(argv)
+
+    cfg = StubConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, page_size=args.page_size,
+        rate_limit=args.rate_limit, burst=args.burst, burst_429_rate=args.burst_429_rate,
+        burst_429_len=args.burst_429_len, error_rate=args.error_rate,
+        pad_bytes=args.pad_bytes, compress=not args.no_compress, seed=args.seed,
+    )
+    tx_rows = synthetic.parse_scale(args.tx_rows) if args.tx_rows else None
+    print("\u23f3 Generating synthetic payloads...")
+    stubs = StubServers(rows=synthetic.parse_scale(args.rows), tx_rows=tx_rows, config=cfg,
+                        peec_port=args.peec_port, awin_port=args.awin_port).start()
+    print(f"\u2705 Peec stub: {stubs.peec_base}")
+    print(f"\u2705 Awin stub: {stubs.awin_base}")
+    print(f"   export PEEC_BASE_URL={stubs.peec_base} AWIN_BASE_URL={stubs.awin_base}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(stubs.stats(), indent=1))
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# synthetic.py — Synthetic Peec / Awin payloads for offline runs and benchmarks
+# Imported (not exec'd). Produces payloads shaped like the real API responses
+# that the cells consume:
+#   Peec:  /prompts, /reports/domains, /reports/urls (prompt_id x model_id),
+#          /chats, /chats/{id}/content
+#   Awin:  /advertisers/{id}/transactions/, /advertisers/{id}/reports/publisher
+#
+# A Universe fixes the domains, URLs, prompts, models and publishers for one
+# scale, so the Peec and Awin sides overlap the way real accounts do: citation
+# counts are Zipf-skewed across domains, and a share of Awin publishers sit on
+# domains that AI models cite (the rest become gap candidates).
+#
+#   u = make_universe(100_000)
+#   rows = peec_url_rows(u)            # report_urls "data"
+#   raw = awin_transactions(u)         # transactions endpoint payload
+#   with offline_api(u):               # route requests.get/post to u
+#       ...exec cells / run stages...
+
+import contextlib
+import json
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import numpy as np
+
+MODELS = [
+    "chatgpt-scraper", "gpt-4o", "gpt-4o-search", "gemini-2.5-flash",
+    "google-ai-overview", "perplexity-scraper", "claude-sonnet-4",
+]
+PAGE_TYPES = ["ARTICLE", "LISTICLE", "HOW_TO_GUIDE", "COMPARISON", "PRODUCT_PAGE",
+              "CATEGORY_PAGE", "HOMEPAGE", "OTHER", None]
+DOMAIN_TYPES = ["Editorial", "UGC", "Corporate", "Competitor", "Institutional", "Reference", "Other"]
+TLDS = ["com", "co.uk", "net", "org", "io", "de"]
+STATUSES = ["pending", "approved", "declined"]
+DEVICES = ["Desktop", "Mobile", "Tablet"]
+
+
+class Universe:
+    """Entities shared by every payload generated for one scale."""
+
+    def __init__(self, n_rows, seed=0, overlap=0.4, start_date="2026-01-01",
+                 end_date="2026-03-31"):
+        rng = np.random.default_rng(seed)
+        self.n_rows = n_rows
+        self.seed = seed
+        self.start_date = start_date
+        self.end_date = end_date
+
+        # Domains grow sub-linearly with rows (long tail of rarely-cited sites)
+        self.n_domains = int(min(max(50, n_rows ** 0.75 / 2), 200_000))
+        self.domains = [f"site{i}-{_word(i)}.{TLDS[i % len(TLDS)]}" for i in range(self.n_domains)]
+        self.domain_types = [DOMAIN_TYPES[i] for i in rng.integers(0, len(DOMAIN_TYPES), self.n_domains)]
+        weights = 1.0 / np.arange(1, self.n_domains + 1) ** 1.1
+        self.domain_p = weights / weights.sum()
+        self.pages_per_domain = np.clip((self.domain_p * n_rows / 4).astype(int), 1, 500)
+
+        self.n_prompts = int(min(max(20, n_rows ** 0.5), 2_000))
+        self.prompt_ids = [f"pr_{i:05d}" for i in range(self.n_prompts)]
+        self.models = MODELS
+
+        # Publishers: `overlap` of them on cited domains, the rest elsewhere
+        self.n_publishers = int(min(max(20, self.n_domains // 10), 20_000))
+        n_cited = int(self.n_publishers * overlap)
+        cited = rng.choice(self.n_domains, size=n_cited, replace=False, p=self.domain_p)
+        self.publisher_ids = (10_000 + np.arange(self.n_publishers)).tolist()
+        self.publisher_domains = (
+            [self.domains[i] for i in cited]
+            + [f"pub{i}-{_word(i + 7)}.com" for i in range(self.n_publishers - n_cited)]
+        )
+        self.publisher_names = [f"{d.split('.')[0].title()} Media" for d in self.publisher_domains]
+
+
+def make_universe(n_rows, seed=0, **kwargs):
+    return Universe(n_rows, seed=seed, **kwargs)
+
+
+def _word(i):
+    syl = ["deal", "hub", "best", "review", "shop", "tech", "home", "style", "money", "travel"]
+    return syl[i % len(syl)] + syl[(i // len(syl)) % len(syl)]
+
+
+def parse_scale(text):
+    """'1k' -> 1000, '2.5M' -> 2500000, '500' -> 500."""
+    text = str(text).strip().lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+# ── Peec payloads ────────────────────────────────────────────────
+def peec_prompts(u):
+    return [{"id": p, "messages": [{"content": f"Which site is best for query {i}?"}]}
+            for i, p in enumerate(u.prompt_ids)]
+
+
+def peec_domain_rows(u):
+    """report_domains "data": one classification per cited domain."""
+    return [{"domain": d, "classification": t} for d, t in zip(u.domains, u.domain_types)]
+
+
+def peec_url_rows(u, n=None, seed=None):
+    """report_urls "data" with prompt_id x model_id dimensions."""
+    n = u.n_rows if n is None else n
+    rng = np.random.default_rng(u.seed + 1 if seed is None else seed)
+    dom = rng.choice(u.n_domains, size=n, p=u.domain_p)
+    page = (rng.random(n) * u.pages_per_domain[dom]).astype(int)
+    prompt = rng.integers(0, u.n_prompts, n)
+    model = rng.integers(0, len(u.models), n)
+    sub = rng.choice(["www.", "", "blog.", "shop."], size=n, p=[0.6, 0.3, 0.07, 0.03])
+    page_type = rng.integers(0, len(PAGE_TYPES), n)
+    avg = np.round(rng.gamma(2.0, 1.5, n) + 1, 2)
+    usage = rng.geometric(0.35, n)
+
+    rows = []
+    for d, pg, pr, m, s, pt, a, c in zip(dom.tolist(), page.tolist(), prompt.tolist(),
+                                         model.tolist(), sub.tolist(), page_type.tolist(),
+                                         avg.tolist(), usage.tolist()):
+        url = f"{s}{u.domains[d]}/p/{pg}"
+        rows.append({
+            "url": f"https://{url}?utm_source=ai",
+            "urlNormalized": url,
+            "title": f"{u.domains[d]} page {pg}",
+            "classification": PAGE_TYPES[pt],
+            "prompt": {"id": u.prompt_ids[pr]},
+            "model": {"id": u.models[m]},
+            "citation_avg": a,
+            "usage_count": c,
+        })
+    return rows
+
+
+def peec_chats(u, n=None, seed=None):
+    """/chats "data": one chat per prompt x model x day sampled."""
+    n = min(max(50, u.n_rows // 10), 20_000) if n is None else n
+    rng = np.random.default_rng(u.seed + 4 if seed is None else seed)
+    start = datetime.strptime(u.start_date, "%Y-%m-%d")
+    days = (datetime.strptime(u.end_date, "%Y-%m-%d") - start).days + 1
+    prompt = rng.integers(0, u.n_prompts, n)
+    model = rng.integers(0, len(u.models), n)
+    day = rng.integers(0, days, n)
+    return [{
+        "id": f"ch_{i:07d}",
+        "prompt": {"id": u.prompt_ids[p]},
+        "model": {"id": u.models[m]},
+        "date": (start + timedelta(days=d)).strftime("%Y-%m-%d"),
+    } for i, (p, m, d) in enumerate(zip(prompt.tolist(), model.tolist(), day.tolist()))]
+
+
+def peec_chat_content(u, chat_id):
+    """/chats/{id}/content: the prompt, a model answer and its cited sources."""
+    i = int(chat_id.rsplit("_", 1)[-1]) if chat_id.rsplit("_", 1)[-1].isdigit() else 0
+    rng = np.random.default_rng(u.seed * 1_000_003 + i)
+    cited = rng.choice(u.n_domains, size=int(rng.integers(2, 8)), p=u.domain_p).tolist()
+    answer = " ".join(
+        f"According to {u.domains[d]}, option {k + 1} is a strong choice for this query."
+        for k, d in enumerate(cited)
+    )
+    return {
+        "id": chat_id,
+        "messages": [
+            {"role": "user", "content": f"Which site is best for query {i % u.n_prompts}?"},
+            {"role": "assistant", "content": answer * 3},
+        ],
+        "sources": [{"url": f"https://www.{u.domains[d]}/p/{k}", "citationCount": 1}
+                    for k, d in enumerate(cited)],
+    }
+
+
+# ── Awin payloads ────────────────────────────────────────────────
+def awin_transactions(u, n=None, start_date=None, end_date=None, seed=None):
+    """Transactions endpoint payload, publisher activity Zipf-skewed."""
+    n = u.n_rows if n is None else n
+    rng = np.random.default_rng(u.seed + 2 if seed is None else seed)
+    start = datetime.strptime(start_date or u.start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date or u.end_date, "%Y-%m-%d") + timedelta(days=1)
+    span = max(int((end - start).total_seconds()), 1)
+
+    w = 1.0 / np.arange(1, u.n_publishers + 1) ** 0.9
+    pub = rng.choice(u.n_publishers, size=n, p=w / w.sum())
+    secs = np.sort(rng.integers(0, span, n))[::-1]
+    sale = np.round(rng.lognormal(3.8, 0.8, n), 2)
+    rate = rng.choice([0.03, 0.05, 0.08, 0.1], size=n)
+    status = rng.integers(0, len(STATUSES), n)
+    url_style = rng.integers(0, 5, n)
+    device = rng.integers(0, len(DEVICES), n)
+    lapse = rng.integers(30, 30 * 86_400, n)
+
+    out = []
+    for i, (p, s, amt, r, st, us, dv, lp) in enumerate(zip(
+            pub.tolist(), secs.tolist(), sale.tolist(), rate.tolist(),
+            status.tolist(), url_style.tolist(), device.tolist(), lapse.tolist())):
+        dom = u.publisher_domains[p]
+        ts = (start + timedelta(seconds=s)).strftime("%Y-%m-%dT%H:%M:%S")
+        out.append({
+            "id": 900_000_000 + i,
+            "advertiserId": 1,
+            "advertiserName": "Synthetic Advertiser",
+            "publisherId": u.publisher_ids[p],
+            "siteName": u.publisher_names[p],
+            "publisherUrl": ("", f"https://www.{dom}/", dom, f"http://{dom}/blog", f"https://{dom}")[us],
+            "clickRef": "",
+            "orderRef": f"ORD{i}",
+            "transactionDate": ts,
+            "validationDate": None,
+            "type": "Commission group transaction",
+            "status": STATUSES[st],
+            "saleAmount": {"amount": amt, "currency": "GBP"},
+            "commissionAmount": {"amount": round(amt * r, 2), "currency": "GBP"},
+            "clickDevice": DEVICES[dv],
+            "transactionDevice": DEVICES[dv],
+            "lapseTime": lp,
+        })
+    return out
+
+
+def awin_publisher_report(u, seed=None):
+    """Publisher performance report payload, one row per publisher."""
+    rng = np.random.default_rng(u.seed + 3 if seed is None else seed)
+    clicks = rng.integers(10, 50_000, u.n_publishers)
+    sales = (clicks * rng.uniform(0.005, 0.05, u.n_publishers)).astype(int)
+    value = np.round(sales * rng.lognormal(3.8, 0.3, u.n_publishers), 2)
+    return [{
+        "publisherId": pid, "publisherName": name,
+        "impressions": int(c * 20), "clicks": int(c),
+        "totalNo": int(s), "totalValue": float(v), "totalComm": round(float(v) * 0.06, 2),
+        "confirmedNo": int(s * 0.7), "confirmedValue": round(float(v) * 0.7, 2),
+        "confirmedComm": round(float(v) * 0.042, 2),
+        "pendingNo": int(s * 0.2), "pendingValue": round(float(v) * 0.2, 2),
+        "pendingComm": round(float(v) * 0.012, 2),
+        "declinedNo": int(s * 0.1), "declinedValue": round(float(v) * 0.1, 2),
+        "declinedComm": round(float(v) * 0.006, 2),
+    } for pid, name, c, s, v in zip(u.publisher_ids, u.publisher_names, clicks, sales, value)]
+
+
+# ── Offline transport ────────────────────────────────────────────
+class _Response:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.text = "" if status_code == 200 else json.dumps(payload)[:300]
+
+    def json(self):
+        return self._payload
+
+
+def route(u, payloads, url, params):
+    """Payload for one API request (full, unpaginated), chosen by URL path."""
+    path = urlparse(url).path.rstrip("/")
+    if path.endswith("/transactions"):
+        # Honour the chunk window so auto-chunking returns each row once
+        lo, hi = params["startDate"], params["endDate"]
+        return [t for t in payloads["transactions"] if lo <= t["transactionDate"] <= hi]
+    if path.endswith("/reports/publisher"):
+        return payloads["publishers"]
+    if path.endswith("/reports/urls"):
+        return {"data": payloads["urls"]}
+    if path.endswith("/reports/domains"):
+        return {"data": payloads["domains"]}
+    if path.endswith("/content") and "/chats/" in path:
+        return peec_chat_content(u, path.rsplit("/", 2)[-2])
+    if path.endswith("/chats"):
+        return {"data": payloads["chats"]}
+    if path.endswith("/prompts"):
+        return {"data": payloads["prompts"]}
+    if path.endswith("/projects"):
+        return {"data": [{"id": "synthetic", "name": "Synthetic Project", "status": "active"}]}
+    if path.endswith("/models"):
+        return {"data": [{"id": m} for m in u.models]}
+    return {"data": []}
+
+
+@contextlib.contextmanager
+def offline_api(u, payloads=None):
+    """
+    Serve u's payloads in place of requests.get / requests.post, so cells
+    can be exec'd and timed without API keys or network. payloads may hold
+    pre-generated "urls" / "transactions" to avoid regenerating them.
+    """
+    import requests
+
+    payloads = dict(payloads or {})
+    payloads.setdefault("urls", None)
+    payloads.setdefault("transactions", None)
+    if payloads["urls"] is None:
+        payloads["urls"] = peec_url_rows(u)
+    if payloads["transactions"] is None:
+        payloads["transactions"] = awin_transactions(u)
+    payloads.setdefault("domains", peec_domain_rows(u))
+    payloads.setdefault("prompts", peec_prompts(u))
+    payloads.setdefault("publishers", awin_publisher_report(u))
+    payloads.setdefault("chats", peec_chats(u))
+
+    def _page(url, params):
+        # "data" lists are paginated by limit/offset, as the live API does
+        result = route(u, payloads, url, params)
+        if isinstance(result, dict) and isinstance(result.get("data"), list) and "limit" in params:
+            offset = int(params.get("offset", 0))
+            result = {"data": result["data"][offset:offset + int(params["limit"])]}
+        return _Response(result)
+
+    def _get(url, params=None, **kwargs):
+        return _page(url, params or {})
+
+    def _post(url, json=None, **kwargs):
+        return _page(url, json or {})
+
+    saved = requests.get, requests.post
+    requests.get, requests.post = _get, _post
+    try:
+        yield payloads
+    finally:
+        requests.get, requests.post = saved